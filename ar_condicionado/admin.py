@@ -1,3 +1,72 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-# Register your models here.
+from core.models import Ambiente, Dispositivo, Sensor
+
+from .comandos import aparelhos_do_usuario
+from .models import ArCondicionado, RegraAutomacao
+
+
+@admin.register(ArCondicionado)
+class ArCondicionadoAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'ambiente', 'dispositivo', 'ligado', 'temperatura', 'modo', 'velocidade']
+    list_filter = ['ligado', 'modo', 'ambiente']
+    list_select_related = ['ambiente', 'dispositivo']
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(ambiente__usuario=request.user)
+
+    def changelist_view(self, request, extra_context=None):
+        # Aparelhos sem ambiente (anteriores a ArCondicionado.ambiente) não têm dono: só superusuários os comandam
+        if request.user.is_superuser and request.method == 'GET':
+            orfaos = ArCondicionado.objects.filter(ambiente__isnull=True).count()
+            if orfaos:
+                self.message_user(
+                    request,
+                    f'{orfaos} aparelho(s) sem ambiente: atribua um ambiente para que o dono possa vê-los e comandá-los.',
+                    messages.WARNING,
+                )
+        return super().changelist_view(request, extra_context)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if not request.user.is_superuser:
+            if db_field.name == 'ambiente':
+                kwargs['queryset'] = Ambiente.objects.filter(usuario=request.user)
+            elif db_field.name == 'dispositivo':
+                kwargs['queryset'] = Dispositivo.objects.filter(usuario=request.user)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+@admin.register(RegraAutomacao)
+class RegraAutomacaoAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'sensor', 'condicao', 'limite', 'duracao', 'acao', 'modo', 'ar', 'ativa', 'ultimo_disparo']
+    list_filter = ['ativa', 'acao', 'condicao', 'sensor__ambiente']
+    search_fields = ['nome', 'sensor__nome']
+    list_select_related = ['sensor', 'ar']
+    readonly_fields = ['ultimo_disparo']
+
+    fieldsets = [
+        ('Condição', {
+            'fields': ['nome', 'sensor', 'condicao', 'limite', 'duracao', 'histerese', 'ativa']
+        }),
+        ('Ação', {
+            'fields': ['acao', 'ar', 'modo', 'temperatura', 'ultimo_disparo']
+        }),
+    ]
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(sensor__usuario=request.user)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Só os sensores e aparelhos do próprio usuário; RegraAutomacao.clean confere que são do mesmo dono
+        if not request.user.is_superuser:
+            if db_field.name == 'sensor':
+                kwargs['queryset'] = Sensor.objects.filter(usuario=request.user)
+            elif db_field.name == 'ar':
+                kwargs['queryset'] = aparelhos_do_usuario(request.user)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -0,0 +1,189 @@
+"""Automação dos aparelhos a partir das leituras dos sensores.
+
+As regras ativas ficam em memória indexadas pelo sensor, então cada lote
+ingerido avalia só as regras dos sensores presentes nele; um lote sem
+sensores com regra não custa nenhuma consulta. O índice é recarregado após
+``IOT_AUTOMACAO_CACHE_SEGUNDOS`` ou quando uma regra ou um aparelho é
+salvo (``ar_condicionado.signals``).
+
+O estado de cada regra também fica em memória e é atualizado leitura a
+leitura: desde quando a condição vale e se a regra já disparou. A regra
+dispara uma vez quando a condição dura ``duracao`` segundos e só volta a
+poder disparar depois que o valor sai da condição com a folga da
+``histerese``, então um valor oscilando no limite não liga e desliga o
+aparelho a cada leitura.
+
+Os comandos disparados em um lote são agrupados por ação e aplicados com
+``comandos.aplicar``, um UPDATE por grupo. Se mais de uma regra disparar
+para o mesmo aparelho no lote, vale a que disparou por último.
+
+Só leituras de origem autenticada (token do dispositivo) chegam aqui: a
+ingestão não avalia as regras para lotes de comandos, do admin ou do
+listener aceitando dispositivos sem token.
+
+Como o cache de recentes, o estado é por processo: as leituras de um
+sensor precisam chegar ao mesmo processo (o listener ou um único worker
+de ingestão) para a duração ser contada corretamente. Nos demais
+processos a automação é desligada com ``IOT_AUTOMACAO_ATIVA``, desligado
+por padrão com vários workers WSGI (verificado em ``ar_condicionado.checks``).
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from sistema_iot.metricas import registro
+
+from .comandos import aplicar
+from .models import ArCondicionado, RegraAutomacao
+
+
+class EstadoRegra:
+    """Situação da condição de uma regra na última leitura avaliada"""
+
+    __slots__ = ('desde', 'disparada', 'ultima')
+
+    def __init__(self):
+        self.desde = None
+        self.disparada = False
+        self.ultima = None
+
+
+def _condicao(regra, valor):
+    return valor > regra.limite if regra.condicao == 'acima' else valor < regra.limite
+
+
+def _encerrada(regra, valor):
+    """Indica se o valor saiu da condição com folga suficiente para rearmar a regra"""
+    if regra.condicao == 'acima':
+        return valor <= regra.limite - regra.histerese
+    return valor >= regra.limite + regra.histerese
+
+
+class MotorAutomacao:
+    """Regras ativas por sensor, estado incremental de cada regra e aplicação dos comandos em lote"""
+
+    def __init__(self, validade):
+        self.validade = validade
+        self._por_sensor = None
+        self._carregado_em = 0
+        self._estados = {}
+        self._lock = threading.Lock()
+        self.disparos = 0
+        self.aparelhos_comandados = 0
+
+    def _indice(self):
+        """{sensor_id: [(regra, pks dos aparelhos)]}; recarregado após ``validade`` segundos"""
+        with self._lock:
+            if self._por_sensor is not None and time.monotonic() - self._carregado_em <= self.validade:
+                return self._por_sensor
+
+        regras = list(RegraAutomacao.objects.filter(ativa=True).select_related('sensor'))
+        ambientes = {regra.sensor.ambiente_id for regra in regras if regra.ar_id is None}
+        por_ambiente = defaultdict(list)
+        if ambientes:
+            for pk, ambiente_id in ArCondicionado.objects.filter(ambiente_id__in=ambientes).values_list('pk', 'ambiente_id'):
+                por_ambiente[ambiente_id].append(pk)
+        por_sensor = defaultdict(list)
+        for regra in regras:
+            alvos = [regra.ar_id] if regra.ar_id is not None else por_ambiente[regra.sensor.ambiente_id]
+            por_sensor[regra.sensor_id].append((regra, tuple(alvos)))
+
+        with self._lock:
+            self._por_sensor = dict(por_sensor)
+            self._carregado_em = time.monotonic()
+            # Regras removidas ou desativadas deixam de ter estado
+            ativas = {regra.pk for regra in regras}
+            self._estados = {pk: estado for pk, estado in self._estados.items() if pk in ativas}
+            return self._por_sensor
+
+    def invalidar(self, regra_id=None):
+        """Força recarregar as regras; o estado da regra alterada recomeça do zero"""
+        with self._lock:
+            self._por_sensor = None
+            if regra_id is not None:
+                self._estados.pop(regra_id, None)
+
+    def avaliar(self, leituras):
+        """Avalia as regras dos sensores do lote (tuplas sensor_id, valor, timestamp); retorna quantas dispararam"""
+        if not getattr(settings, 'IOT_AUTOMACAO_ATIVA', True):
+            return 0
+        indice = self._indice()
+        por_sensor = defaultdict(list)
+        for sensor_id, valor, timestamp in leituras:
+            if sensor_id in indice:
+                por_sensor[sensor_id].append((timestamp, valor))
+        if not por_sensor:
+            return 0
+
+        disparos = []
+        with self._lock:
+            for sensor_id, linhas in por_sensor.items():
+                if len(linhas) > 1:
+                    linhas.sort(key=lambda linha: linha[0])
+                for regra, alvos in indice[sensor_id]:
+                    estado = self._estados.get(regra.pk)
+                    if estado is None:
+                        estado = self._estados[regra.pk] = EstadoRegra()
+                    for timestamp, valor in linhas:
+                        if estado.ultima is not None and timestamp < estado.ultima:
+                            # Leitura atrasada de um lote anterior: a duração já foi contada sem ela
+                            continue
+                        estado.ultima = timestamp
+                        if _condicao(regra, valor):
+                            if estado.desde is None:
+                                estado.desde = timestamp
+                            if not estado.disparada and (timestamp - estado.desde).total_seconds() >= regra.duracao:
+                                estado.disparada = True
+                                disparos.append((timestamp, regra, alvos))
+                        elif _encerrada(regra, valor):
+                            estado.desde = None
+                            estado.disparada = False
+            self.disparos += len(disparos)
+
+        if disparos:
+            self._aplicar(disparos)
+        return len(disparos)
+
+    def _aplicar(self, disparos):
+        disparos.sort(key=lambda disparo: disparo[0])
+        por_aparelho = {}
+        for _, regra, alvos in disparos:
+            for pk in alvos:
+                por_aparelho[pk] = regra
+        grupos = defaultdict(list)
+        for pk, regra in por_aparelho.items():
+            grupos[(regra.acao, regra.modo, regra.temperatura)].append(pk)
+
+        disparadas = {}
+        for timestamp, regra, _ in disparos:
+            regra.ultimo_disparo = timestamp
+            disparadas[regra.pk] = regra
+        with transaction.atomic():
+            for (acao, modo, temperatura), pks in grupos.items():
+                alvos = ArCondicionado.objects.filter(pk__in=pks)
+                aplicar(acao, alvos)
+                if acao == 'ligar' and modo:
+                    aplicar('modo', alvos, modo)
+                if acao == 'ligar' and temperatura is not None:
+                    aplicar('temperatura', alvos, temperatura)
+            RegraAutomacao.objects.bulk_update(disparadas.values(), ['ultimo_disparo'])
+        with self._lock:
+            self.aparelhos_comandados += len(por_aparelho)
+
+    def prometheus(self):
+        with self._lock:
+            regras = sum(len(regras) for regras in (self._por_sensor or {}).values())
+            return [
+                '# TYPE iot_automacao_disparos_total counter',
+                f'iot_automacao_disparos_total {self.disparos}',
+                '# TYPE iot_automacao_aparelhos_comandados_total counter',
+                f'iot_automacao_aparelhos_comandados_total {self.aparelhos_comandados}',
+                '# TYPE iot_automacao_regras gauge',
+                f'iot_automacao_regras {regras}',
+            ]
+
+
+motor_automacao = MotorAutomacao(getattr(settings, 'IOT_AUTOMACAO_CACHE_SEGUNDOS', 60))
+registro.registrar_coletor(motor_automacao.prometheus)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def automacao_com_varios_workers(app_configs, **kwargs):
+    """O estado das regras é por processo: com vários workers a duração de cada regra se divide entre eles"""
+    if getattr(settings, 'IOT_AUTOMACAO_ATIVA', True) and getattr(settings, 'IOT_WORKERS_WEB', 1) > 1:
+        return [Warning(
+            f'Automação ativa com {settings.IOT_WORKERS_WEB} workers WSGI; cada worker conta a duração '
+            'das regras só com as leituras que recebe.',
+            hint='Defina IOT_AUTOMACAO_ATIVA=0 nos workers e ative a automação só no listener '
+                 '(escutar_dispositivos) ou em um único worker de ingestão.',
+            id='ar_condicionado.W001',
+        )]
+    return []
@@ -0,0 +1,135 @@
+"""Comandos atômicos para os aparelhos de ar-condicionado.
+
+Cada comando vira um único UPDATE condicional aplicado pelo banco
+(``temperatura = temperatura + 1 WHERE ligado AND temperatura < máx``), sem
+carregar os objetos antes; cliques concorrentes não se sobrescrevem. Um
+lote de comandos, cada um mirando vários aparelhos ou um ambiente
+inteiro, roda em uma transação.
+
+Ajustes de temperatura só valem para aparelhos ligados: um aparelho
+desligado (ou já no limite) fica de fora do UPDATE e não entra na contagem
+de ``alterados``. As rotas antigas de aumentar/diminuir avisam isso no
+painel.
+
+Pela API cada usuário só comanda os aparelhos dos seus ambientes
+(``aparelhos_do_usuario``); superusuários comandam todos.
+"""
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Ambiente
+
+from .models import ArCondicionado
+
+
+CAMPOS_ESTADO = ['pk', 'ligado', 'temperatura', 'modo', 'velocidade', 'inicio_ligado', 'ambiente_id']
+
+
+class ComandoInvalido(Exception):
+    """O comando recebido não pode ser aplicado"""
+
+
+class AcessoNegado(Exception):
+    """O comando mira aparelhos ou ambientes de outro usuário"""
+
+
+def aparelhos_do_usuario(usuario):
+    """Aparelhos que o usuário pode comandar e acompanhar: os dos seus ambientes (todos para superusuários)"""
+    if usuario.is_superuser:
+        return ArCondicionado.objects.all()
+    return ArCondicionado.objects.filter(ambiente__usuario=usuario)
+
+
+def _alvos(comando, usuario=None):
+    """Retorna o queryset dos aparelhos indicados por "pk", "pks" ou "ambiente".
+
+    Com ``usuario``, levanta AcessoNegado se algum alvo não for dele (ou não existir).
+    """
+    permitidos = ArCondicionado.objects.all() if usuario is None else aparelhos_do_usuario(usuario)
+    if 'pk' in comando:
+        pks = [comando['pk']]
+    else:
+        pks = comando.get('pks')
+    if pks is not None:
+        if not isinstance(pks, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in pks):
+            raise ComandoInvalido('"pks" deve ser uma lista de inteiros.')
+        alvos = permitidos.filter(pk__in=pks)
+        if usuario is not None and alvos.count() != len(set(pks)):
+            raise AcessoNegado('Aparelho inexistente ou de outro usuário.')
+        return alvos
+    ambiente = comando.get('ambiente')
+    if isinstance(ambiente, int) and not isinstance(ambiente, bool):
+        if usuario is not None and not usuario.is_superuser and not Ambiente.objects.filter(
+                pk=ambiente, usuario=usuario).exists():
+            raise AcessoNegado('Ambiente inexistente ou de outro usuário.')
+        return permitidos.filter(ambiente_id=ambiente)
+    raise ComandoInvalido('Informe "pk", "pks" ou "ambiente".')
+
+
+def _temperatura(valor):
+    if isinstance(valor, bool) or not isinstance(valor, int):
+        raise ComandoInvalido('"valor" deve ser um inteiro.')
+    if not ArCondicionado.TEMPERATURA_MINIMA <= valor <= ArCondicionado.TEMPERATURA_MAXIMA:
+        raise ComandoInvalido(
+            f'Temperatura deve estar entre {ArCondicionado.TEMPERATURA_MINIMA} e {ArCondicionado.TEMPERATURA_MAXIMA}.'
+        )
+    return valor
+
+
+def aplicar(acao, alvos, valor=None):
+    """Aplica uma ação aos aparelhos do queryset com um UPDATE; retorna quantos foram alterados"""
+    agora = timezone.now()
+    if acao == 'ligar':
+        return alvos.update(ligado=True, inicio_ligado=Coalesce(F('inicio_ligado'), Value(agora)))
+    if acao == 'desligar':
+        return alvos.update(ligado=False, inicio_ligado=None)
+    if acao == 'alternar':
+        # Os dois lados do SET leem o valor antigo de "ligado"
+        return alvos.update(
+            ligado=Case(When(ligado=True, then=Value(False)), default=Value(True)),
+            inicio_ligado=Case(When(ligado=True, then=Value(None)), default=Value(agora)),
+        )
+    if acao == 'aumentar':
+        return alvos.filter(ligado=True, temperatura__lt=ArCondicionado.TEMPERATURA_MAXIMA).update(
+            temperatura=F('temperatura') + 1
+        )
+    if acao == 'diminuir':
+        return alvos.filter(ligado=True, temperatura__gt=ArCondicionado.TEMPERATURA_MINIMA).update(
+            temperatura=F('temperatura') - 1
+        )
+    if acao == 'temperatura':
+        return alvos.filter(ligado=True).update(temperatura=_temperatura(valor))
+    if acao == 'modo':
+        if valor not in ArCondicionado.MODOS:
+            raise ComandoInvalido(f'Modo deve ser um de: {", ".join(ArCondicionado.MODOS)}.')
+        return alvos.update(modo=valor)
+    if acao == 'velocidade':
+        if valor not in ArCondicionado.VELOCIDADES:
+            raise ComandoInvalido(f'Velocidade deve ser uma de: {", ".join(ArCondicionado.VELOCIDADES)}.')
+        return alvos.update(velocidade=valor)
+    raise ComandoInvalido(f'Ação desconhecida: {acao}')
+
+
+def executar_comandos(comandos, usuario=None):
+    """Executa uma lista de comandos em uma transação e retorna o novo estado dos aparelhos afetados.
+
+    Com ``usuario`` só aceita alvos dele; um alvo negado cancela o lote inteiro.
+    """
+    if not isinstance(comandos, list) or not comandos:
+        raise ComandoInvalido('Esperada uma lista de comandos.')
+
+    resultados = []
+    afetados = ArCondicionado.objects.none()
+    with transaction.atomic():
+        for comando in comandos:
+            if not isinstance(comando, dict):
+                raise ComandoInvalido('Cada comando deve ser um objeto.')
+            alvos = _alvos(comando, usuario)
+            alterados = aplicar(comando.get('acao'), alvos, comando.get('valor'))
+            resultados.append({'acao': comando.get('acao'), 'alterados': alterados})
+            afetados = afetados | alvos
+        estado = list(afetados.order_by('pk').values(*CAMPOS_ESTADO))
+
+    return {'resultados': resultados, 'estado': estado}
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ar_condicionado.simulacao import simular_tick
+
+
+class Command(BaseCommand):
+    help = 'Executa periodicamente a simulação de temperatura dos aparelhos de ar-condicionado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=10,
+            help='Segundos entre cada passo da simulação (default: 10)',
+        )
+        parser.add_argument(
+            '--uma-vez',
+            action='store_true',
+            help='Executa um único passo e sai (útil em cron)',
+        )
+
+    def handle(self, *args, **options):
+        if options['uma_vez']:
+            atualizados = simular_tick()
+            self.stdout.write(f'Aparelhos simulados: {atualizados}')
+            return
+
+        self.stdout.write(f'Simulando a cada {options["intervalo"]}s. Ctrl+C para sair.')
+        try:
+            while True:
+                close_old_connections()
+                simular_tick()
+                time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write('Simulação encerrada.')
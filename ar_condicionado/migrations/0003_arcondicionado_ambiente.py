@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ar_condicionado', '0002_arcondicionado_inicio_ligado'),
+        ('core', '0007_dispositivo_indices_presenca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arcondicionado',
+            name='ambiente',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ares_condicionados', to='core.ambiente', verbose_name='Ambiente'),
+        ),
+    ]
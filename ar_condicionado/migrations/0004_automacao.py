@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:43
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ar_condicionado', '0003_arcondicionado_ambiente'),
+        ('core', '0011_leitura_indice_timestamp_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arcondicionado',
+            name='dispositivo',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ar', to='core.dispositivo', verbose_name='Dispositivo'),
+        ),
+        migrations.CreateModel(
+            name='RegraAutomacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, verbose_name='Nome')),
+                ('condicao', models.CharField(choices=[('acima', 'Acima do limite'), ('abaixo', 'Abaixo do limite')], default='acima', max_length=10, verbose_name='Condição')),
+                ('limite', models.FloatField(verbose_name='Limite')),
+                ('duracao', models.PositiveIntegerField(default=0, help_text='Tempo que a condição precisa durar antes de a regra disparar', verbose_name='Duração (segundos)')),
+                ('histerese', models.FloatField(default=0, help_text='Folga além do limite para a condição ser considerada encerrada', validators=[django.core.validators.MinValueValidator(0)], verbose_name='Histerese')),
+                ('acao', models.CharField(choices=[('ligar', 'Ligar'), ('desligar', 'Desligar')], default='ligar', max_length=10, verbose_name='Ação')),
+                ('modo', models.CharField(blank=True, choices=[('Frio', 'Frio'), ('Quente', 'Quente'), ('Ventilar', 'Ventilar'), ('Automático', 'Automático')], help_text='Modo aplicado ao ligar (vazio mantém o atual)', max_length=20, verbose_name='Modo')),
+                ('temperatura', models.IntegerField(blank=True, help_text='Temperatura aplicada ao ligar (vazio mantém a atual)', null=True, validators=[django.core.validators.MinValueValidator(16), django.core.validators.MaxValueValidator(30)], verbose_name='Temperatura')),
+                ('ativa', models.BooleanField(default=True, verbose_name='Ativa')),
+                ('ultimo_disparo', models.DateTimeField(blank=True, null=True, verbose_name='Último Disparo')),
+                ('ar', models.ForeignKey(blank=True, help_text='Vazio: todos os aparelhos do ambiente do sensor', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='regras', to='ar_condicionado.arcondicionado', verbose_name='Ar-condicionado')),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regras_automacao', to='core.sensor', verbose_name='Sensor')),
+            ],
+            options={
+                'verbose_name': 'Regra de Automação',
+                'verbose_name_plural': 'Regras de Automação',
+                'ordering': ['nome'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:10
+
+from django.db import migrations
+
+
+def atribuir_ambiente(apps, schema_editor):
+    """Dá um dono aos aparelhos criados antes de ArCondicionado.ambiente.
+
+    Sem ambiente só superusuários comandam o aparelho. Usa o ambiente do
+    dispositivo vinculado ou, com um único ambiente no banco, esse ambiente;
+    os demais continuam sem ambiente e são apontados no admin.
+    """
+    ArCondicionado = apps.get_model('ar_condicionado', 'ArCondicionado')
+    Ambiente = apps.get_model('core', 'Ambiente')
+    orfaos = ArCondicionado.objects.filter(ambiente__isnull=True)
+    for ar in orfaos.filter(dispositivo__ambiente__isnull=False).select_related('dispositivo'):
+        ar.ambiente_id = ar.dispositivo.ambiente_id
+        ar.save(update_fields=['ambiente'])
+    ambientes = list(Ambiente.objects.values_list('pk', flat=True)[:2])
+    if len(ambientes) == 1:
+        orfaos.update(ambiente_id=ambientes[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ar_condicionado', '0004_automacao'),
+    ]
+
+    operations = [
+        migrations.RunPython(atribuir_ambiente, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,92 @@
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
 
 class ArCondicionado(models.Model):
+    MODOS = ['Frio', 'Quente', 'Ventilar', 'Automático']
+    VELOCIDADES = ['Baixa', 'Média', 'Alta']
+    TEMPERATURA_MINIMA = 16
+    TEMPERATURA_MAXIMA = 30
+
     ligado = models.BooleanField(default=False)
     temperatura = models.IntegerField(default=24)
     modo = models.CharField(max_length=20, default='Frio')
     velocidade = models.CharField(max_length=10, default='Média')
     inicio_ligado = models.DateTimeField(null=True, blank=True)
+    ambiente = models.ForeignKey(
+        'core.Ambiente', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='ares_condicionados', verbose_name='Ambiente',
+    )
+    dispositivo = models.OneToOneField(
+        'core.Dispositivo', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='ar', verbose_name='Dispositivo',
+    )
     def __str__(self):
         return f"ArCondicionado - {self.id}"
+
+    def clean(self):
+        if self.ambiente_id and self.dispositivo_id and self.dispositivo.usuario_id != self.ambiente.usuario_id:
+            raise ValidationError({'dispositivo': 'O dispositivo precisa ser do dono do ambiente do aparelho.'})
+
+
+class RegraAutomacao(models.Model):
+    """Liga ou desliga aparelhos quando a leitura de um sensor fica acima/abaixo de um limite por um tempo"""
+    CONDICOES = [
+        ('acima', 'Acima do limite'),
+        ('abaixo', 'Abaixo do limite'),
+    ]
+    ACOES = [
+        ('ligar', 'Ligar'),
+        ('desligar', 'Desligar'),
+    ]
+
+    nome = models.CharField(max_length=100, verbose_name='Nome')
+    sensor = models.ForeignKey(
+        'core.Sensor', on_delete=models.CASCADE, related_name='regras_automacao', verbose_name='Sensor',
+    )
+    condicao = models.CharField(max_length=10, choices=CONDICOES, default='acima', verbose_name='Condição')
+    limite = models.FloatField(verbose_name='Limite')
+    duracao = models.PositiveIntegerField(
+        default=0, verbose_name='Duração (segundos)',
+        help_text='Tempo que a condição precisa durar antes de a regra disparar',
+    )
+    histerese = models.FloatField(
+        default=0, validators=[MinValueValidator(0)], verbose_name='Histerese',
+        help_text='Folga além do limite para a condição ser considerada encerrada',
+    )
+    ar = models.ForeignKey(
+        ArCondicionado, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='regras', verbose_name='Ar-condicionado',
+        help_text='Vazio: todos os aparelhos do ambiente do sensor',
+    )
+    acao = models.CharField(max_length=10, choices=ACOES, default='ligar', verbose_name='Ação')
+    modo = models.CharField(
+        max_length=20, blank=True, choices=[(modo, modo) for modo in ArCondicionado.MODOS], verbose_name='Modo',
+        help_text='Modo aplicado ao ligar (vazio mantém o atual)',
+    )
+    temperatura = models.IntegerField(
+        null=True, blank=True, verbose_name='Temperatura',
+        validators=[MinValueValidator(ArCondicionado.TEMPERATURA_MINIMA), MaxValueValidator(ArCondicionado.TEMPERATURA_MAXIMA)],
+        help_text='Temperatura aplicada ao ligar (vazio mantém a atual)',
+    )
+    ativa = models.BooleanField(default=True, verbose_name='Ativa')
+    ultimo_disparo = models.DateTimeField(null=True, blank=True, verbose_name='Último Disparo')
+
+    class Meta:
+        verbose_name = 'Regra de Automação'
+        verbose_name_plural = 'Regras de Automação'
+        ordering = ['nome']
+
+    def __str__(self):
+        return self.nome
+
+    def clean(self):
+        """O sensor e os aparelhos comandados pela regra precisam ser do mesmo usuário"""
+        if not self.sensor_id:
+            return
+        if self.ar_id:
+            if self.ar.ambiente is None or self.ar.ambiente.usuario_id != self.sensor.usuario_id:
+                raise ValidationError({'ar': 'O aparelho precisa estar em um ambiente do dono do sensor.'})
+        elif self.sensor.ambiente is not None and self.sensor.ambiente.usuario_id != self.sensor.usuario_id:
+            raise ValidationError({'ar': 'O ambiente do sensor é de outro usuário: escolha um aparelho.'})
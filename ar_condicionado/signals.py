@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .automacao import motor_automacao
+from .models import ArCondicionado, RegraAutomacao
+
+
+@receiver(post_save, sender=RegraAutomacao)
+@receiver(post_delete, sender=RegraAutomacao)
+def regra_alterada(sender, instance, **kwargs):
+    """Recarrega as regras da automação; a regra alterada recomeça sem estado"""
+    motor_automacao.invalidar(instance.pk)
+
+
+@receiver(post_save, sender=ArCondicionado)
+@receiver(post_delete, sender=ArCondicionado)
+def aparelho_alterado(sender, instance, **kwargs):
+    """Recarrega os aparelhos de cada ambiente usados pelas regras sem aparelho definido"""
+    motor_automacao.invalidar()
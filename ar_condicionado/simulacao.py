@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Cast, Floor, Greatest, Least, Random
+from django.utils import timezone
+
+from .models import ArCondicionado
+
+
+def simular_tick():
+    """Avança a simulação de todos os aparelhos com um UPDATE por etapa.
+
+    Acerta o início do contador de tempo ligado e aplica a pequena variação
+    aleatória de temperatura (-1, 0 ou +1) calculada pelo próprio banco,
+    limitada à faixa de ``TEMPERATURA_MINIMA`` a ``TEMPERATURA_MAXIMA``.
+    Retorna quantos aparelhos ligados tiveram a temperatura simulada.
+    """
+    with transaction.atomic():
+        ArCondicionado.objects.filter(ligado=True, inicio_ligado__isnull=True).update(inicio_ligado=timezone.now())
+        ArCondicionado.objects.filter(ligado=False, inicio_ligado__isnull=False).update(inicio_ligado=None)
+        variacao = F('temperatura') + Cast(Floor(Random() * 3), IntegerField()) - 1
+        return ArCondicionado.objects.filter(ligado=True).update(temperatura=Greatest(
+            Least(variacao, Value(ArCondicionado.TEMPERATURA_MAXIMA)), Value(ArCondicionado.TEMPERATURA_MINIMA),
+        ))
@@ -1,3 +1,238 @@
+import json
+from datetime import timedelta
+
+from django.contrib.auth.models import Permission, User
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.ingestao import gravar_leituras
+from core.models import Ambiente, Dispositivo, LeituraSensor, Sensor, TipoSensor
+
+from .automacao import motor_automacao
+from .comandos import AcessoNegado, ComandoInvalido, aplicar, executar_comandos
+from .models import ArCondicionado, RegraAutomacao
+from .simulacao import simular_tick
+
+
+class ComandosTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('dono', password='senha')
+        self.ambiente = Ambiente.objects.create(nome='Sala', usuario=self.usuario)
+        self.ligado = ArCondicionado.objects.create(ligado=True, temperatura=24, ambiente=self.ambiente)
+        self.desligado = ArCondicionado.objects.create(ligado=False, temperatura=24, ambiente=self.ambiente)
+        outro = User.objects.create_user('vizinho', password='senha')
+        self.ambiente_alheio = Ambiente.objects.create(nome='Quarto', usuario=outro)
+        self.alheio = ArCondicionado.objects.create(ligado=False, temperatura=24, ambiente=self.ambiente_alheio)
+
+    def estado(self, ar):
+        ar.refresh_from_db()
+        return ar.ligado, ar.temperatura
+
+    def postar(self, corpo):
+        return self.client.post(reverse('ar_comandos'), json.dumps(corpo), content_type='application/json')
+
+    def test_temperatura_so_muda_em_aparelhos_ligados_e_dentro_dos_limites(self):
+        todos = ArCondicionado.objects.filter(ambiente=self.ambiente)
+        self.assertEqual(aplicar('aumentar', todos), 1)
+        self.assertEqual(self.estado(self.ligado), (True, 25))
+        self.assertEqual(self.estado(self.desligado), (False, 24))
+
+        self.assertEqual(aplicar('temperatura', todos, ArCondicionado.TEMPERATURA_MAXIMA), 1)
+        self.assertEqual(aplicar('aumentar', todos), 0)
+        with self.assertRaises(ComandoInvalido):
+            aplicar('temperatura', todos, ArCondicionado.TEMPERATURA_MAXIMA + 1)
+
+    def test_alternar_le_o_valor_antigo(self):
+        aplicar('alternar', ArCondicionado.objects.filter(ambiente=self.ambiente))
+        self.assertEqual(self.estado(self.ligado), (False, 24))
+        self.assertEqual(self.estado(self.desligado)[0], True)
+        self.ligado.refresh_from_db()
+        self.assertIsNone(self.ligado.inicio_ligado)
+        self.assertIsNotNone(self.desligado.inicio_ligado)
+
+    def test_lote_em_uma_transacao(self):
+        resultado = executar_comandos([
+            {'acao': 'ligar', 'ambiente': self.ambiente.pk},
+            {'acao': 'diminuir', 'pks': [self.ligado.pk, self.desligado.pk]},
+            {'acao': 'modo', 'pk': self.desligado.pk, 'valor': 'Quente'},
+        ], self.usuario)
+        self.assertEqual([item['alterados'] for item in resultado['resultados']], [2, 2, 1])
+        self.assertEqual([ar['temperatura'] for ar in resultado['estado']], [23, 23])
+
+        with self.assertRaises(ComandoInvalido):
+            executar_comandos([{'acao': 'desligar', 'pk': self.ligado.pk}, {'acao': 'modo', 'pk': self.ligado.pk, 'valor': 'Turbo'}])
+        self.assertTrue(self.estado(self.ligado)[0])
+
+    def test_alvo_de_outro_usuario_cancela_o_lote(self):
+        for alvo in ({'pk': self.alheio.pk}, {'pks': [self.ligado.pk, self.alheio.pk]}, {'ambiente': self.ambiente_alheio.pk}):
+            with self.subTest(alvo=alvo), self.assertRaises(AcessoNegado):
+                executar_comandos([{'acao': 'desligar', 'pk': self.ligado.pk}, {'acao': 'ligar', **alvo}], self.usuario)
+        self.assertEqual(self.estado(self.ligado), (True, 24))
+        self.assertEqual(self.estado(self.alheio), (False, 24))
+
+    def test_api_exige_login_e_responde_403_para_aparelho_alheio(self):
+        resposta = self.postar({'acao': 'ligar', 'ambiente': self.ambiente.pk})
+        self.assertEqual(resposta.status_code, 401)
+        self.assertFalse(self.estado(self.desligado)[0])
+
+        self.client.force_login(self.usuario)
+        resposta = self.postar({'acao': 'ligar', 'pk': self.alheio.pk})
+        self.assertEqual(resposta.status_code, 403)
+        self.assertFalse(self.estado(self.alheio)[0])
+
+        resposta = self.postar({'acao': 'ligar', 'ambiente': self.ambiente.pk})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([ar['pk'] for ar in resposta.json()['estado']], [self.ligado.pk, self.desligado.pk])
+
+    def test_rota_antiga_avisa_aparelho_desligado(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.post(reverse('aumentar_with_pk', args=[self.desligado.pk]), follow=True)
+        self.assertContains(resposta, 'Aparelho desligado')
+        self.assertEqual(self.estado(self.desligado), (False, 24))
+
+    def test_rotas_antigas_seguem_a_regra_de_acesso_da_api(self):
+        url = reverse('alternar_with_pk', args=[self.alheio.pk])
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('alternar_with_pk', args=[self.ligado.pk])).status_code, 405)
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(self.client.post(reverse('alterar_modo_with_pk', args=[self.alheio.pk]), {'modo': 'Quente'}).status_code, 404)
+        self.assertEqual(self.estado(self.alheio), (False, 24))
+        self.assertEqual(self.estado(self.ligado), (True, 24))
+
+        # Sem pk, a rota usa o primeiro aparelho do próprio usuário
+        self.client.post(reverse('alternar'))
+        self.assertEqual(self.estado(self.ligado), (False, 24))
+        self.assertEqual(self.estado(self.alheio), (False, 24))
+
+    def test_painel_so_mostra_aparelhos_do_usuario(self):
+        url = reverse('painel_pk', args=[self.ligado.pk])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(reverse('painel_pk', args=[self.alheio.pk])).status_code, 404)
+        self.assertRedirects(self.client.get(reverse('painel')), url)
+        # Sem aparelhos próprios, a rota sem pk mostra o índice vazio em vez do primeiro aparelho do site
+        ArCondicionado.objects.filter(pk__in=[self.ligado.pk, self.desligado.pk]).update(ambiente=None)
+        self.assertEqual(self.client.get(reverse('painel')).status_code, 200)
+
+    def test_api_responde_422_para_comando_invalido(self):
+        self.client.force_login(self.usuario)
+        resposta = self.postar({'acao': 'modo', 'pk': self.ligado.pk, 'valor': 'Turbo'})
+        self.assertEqual(resposta.status_code, 422)
+
+
+class SimulacaoTests(TestCase):
+
+    def test_temperatura_simulada_fica_dentro_dos_limites(self):
+        extremos = [ArCondicionado.TEMPERATURA_MINIMA, ArCondicionado.TEMPERATURA_MAXIMA, 40]
+        ares = [ArCondicionado.objects.create(ligado=True, temperatura=temperatura) for temperatura in extremos]
+        desligado = ArCondicionado.objects.create(ligado=False, temperatura=24)
+        vistas = set()
+        for _ in range(200):
+            self.assertEqual(simular_tick(), len(ares))
+            vistas.update(ArCondicionado.objects.filter(ligado=True).values_list('temperatura', flat=True))
+        self.assertGreaterEqual(min(vistas), ArCondicionado.TEMPERATURA_MINIMA)
+        # O aparelho a 40 °C volta ao máximo no primeiro passo
+        self.assertEqual(max(vistas), ArCondicionado.TEMPERATURA_MAXIMA)
+
+        desligado.refresh_from_db()
+        self.assertEqual((desligado.temperatura, desligado.inicio_ligado), (24, None))
+        self.assertFalse(ArCondicionado.objects.filter(ligado=True, inicio_ligado__isnull=True).exists())
+
+    def test_painel_responde_304_enquanto_o_aparelho_nao_muda(self):
+        usuario = User.objects.create_user('dono', password='senha')
+        ambiente = Ambiente.objects.create(nome='Sala', usuario=usuario)
+        ar = ArCondicionado.objects.create(ligado=True, temperatura=24, ambiente=ambiente)
+        self.client.force_login(usuario)
+        url = reverse('painel_pk', args=[ar.pk])
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        etag = resposta['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A simulação grava pelo banco, sem passar pela view: a ETag acompanha o estado gravado
+        ArCondicionado.objects.filter(pk=ar.pk).update(temperatura=25)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AutomacaoTests(TestCase):
+
+    def setUp(self):
+        usuario = User.objects.create_user('dono', password='senha')
+        ambiente = Ambiente.objects.create(nome='Sala', usuario=usuario)
+        dispositivo = Dispositivo.objects.create(
+            nome='ESP32', tipo='sensor', mac_address='24:6f:28:ab:12:34', ambiente=ambiente, usuario=usuario,
+        )
+        self.sensor = Sensor.objects.create(
+            nome='Temperatura', tipo=TipoSensor.objects.create(nome='Temperatura', unidade='°C'),
+            dispositivo=dispositivo, ambiente=ambiente, usuario=usuario,
+        )
+        self.ar = ArCondicionado.objects.create(ligado=False, temperatura=24, ambiente=ambiente)
+        self.regra = RegraAutomacao.objects.create(
+            nome='Calor', sensor=self.sensor, condicao='acima', limite=28, duracao=60, histerese=2,
+            acao='ligar', temperatura=20,
+        )
+        self.base = timezone.now().replace(microsecond=0)
+        # O motor é do processo: regras e estados de outros testes não podem sobrar
+        motor_automacao.invalidar()
+        self.addCleanup(motor_automacao.invalidar)
+
+    def avaliar(self, *valores):
+        """Avalia (valor, segundos após a base) na ordem; retorna quantas regras dispararam em cada chamada"""
+        return [
+            motor_automacao.avaliar([(self.sensor.pk, valor, self.base + timedelta(seconds=segundos))])
+            for valor, segundos in valores
+        ]
+
+    def test_dispara_depois_da_duracao_e_rearma_com_histerese(self):
+        self.assertEqual(self.avaliar((29, 0), (29.5, 30), (29, 60)), [0, 0, 1])
+        self.ar.refresh_from_db()
+        self.assertEqual((self.ar.ligado, self.ar.temperatura), (True, 20))
+        self.regra.refresh_from_db()
+        self.assertEqual(self.regra.ultimo_disparo, self.base + timedelta(seconds=60))
+
+        ArCondicionado.objects.filter(pk=self.ar.pk).update(ligado=False)
+        # 27 está abaixo do limite mas dentro da histerese: a regra continua disparada
+        self.assertEqual(self.avaliar((27, 120), (29, 200), (29, 300)), [0, 0, 0])
+        self.assertFalse(ArCondicionado.objects.get(pk=self.ar.pk).ligado)
+        self.assertEqual(self.avaliar((26, 400), (29, 500), (29, 560)), [0, 0, 1])
+        self.assertTrue(ArCondicionado.objects.get(pk=self.ar.pk).ligado)
+
+    def test_so_leituras_autenticadas_avaliam_as_regras(self):
+        self.regra.duracao = 0
+        self.regra.save()
+
+        def gravar(segundos, automacao):
+            leitura = LeituraSensor(sensor=self.sensor, valor=35, timestamp=self.base + timedelta(seconds=segundos))
+            with self.captureOnCommitCallbacks(execute=True):
+                gravar_leituras([leitura], {self.sensor.dispositivo_id}, automacao)
+            return ArCondicionado.objects.get(pk=self.ar.pk).ligado
+
+        self.assertFalse(gravar(0, automacao=False))
+        self.assertTrue(gravar(10, automacao=True))
+
+    def test_regra_e_admin_so_usam_objetos_do_usuario(self):
+        vizinho = User.objects.create_user('vizinho', password='senha', is_staff=True)
+        vizinho.user_permissions.set(Permission.objects.filter(
+            content_type__app_label='ar_condicionado', codename__in=['add_regraautomacao', 'view_regraautomacao', 'view_arcondicionado'],
+        ))
+        alheio = ArCondicionado.objects.create(ambiente=Ambiente.objects.create(nome='Quarto', usuario=vizinho))
+
+        regra = RegraAutomacao(nome='Invasora', sensor=self.sensor, limite=28, ar=alheio)
+        with self.assertRaises(ValidationError):
+            regra.full_clean()
+        regra.ar = self.ar
+        regra.full_clean()
 
-# Create your tests here.
+        self.client.force_login(vizinho)
+        cl = self.client.get(reverse('admin:ar_condicionado_regraautomacao_changelist')).context['cl']
+        self.assertEqual(list(cl.result_list), [])
+        cl = self.client.get(reverse('admin:ar_condicionado_arcondicionado_changelist')).context['cl']
+        self.assertEqual(list(cl.result_list), [alheio])
+        form = self.client.get(reverse('admin:ar_condicionado_regraautomacao_add')).context['adminform'].form
+        self.assertFalse(form.fields['sensor'].queryset.exists())
+        self.assertEqual(list(form.fields['ar'].queryset), [alheio])
@@ -16,4 +16,6 @@ urlpatterns = [
 
     path('alterar_modo/', views.alterar_modo, name='alterar_modo'),
     path('<int:pk>/alterar_modo/', views.alterar_modo, name='alterar_modo_with_pk'),
+
+    path('api/comandos/', views.comandos, name='ar_comandos'),
 ]
\ No newline at end of file
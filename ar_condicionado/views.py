@@ -1,49 +1,58 @@
 from django.shortcuts import render
 
 from django.shortcuts import render, redirect,get_object_or_404
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from .comandos import AcessoNegado, ComandoInvalido, aparelhos_do_usuario, aplicar, executar_comandos
 from .models import ArCondicionado
-import random
-import datetime
+import hashlib
+import json
 from django.utils import timezone
 
-def _get_ar(pk=None):
-    """Retorna o ArCondicionado pelo pk se fornecido, senão o primeiro (cria se não existir)."""
+def _get_ar(request, pk=None):
+    """Retorna o aparelho do usuário pelo pk se fornecido, senão o primeiro deles (404 se não for dele)."""
+    aparelhos = aparelhos_do_usuario(request.user)
     if pk:
-        return get_object_or_404(ArCondicionado, pk=pk)
-    ar = ArCondicionado.objects.first()
+        return get_object_or_404(aparelhos, pk=pk)
+    ar = aparelhos.first()
     if not ar:
-        ar = ArCondicionado.objects.create()
+        raise Http404('Nenhum ar-condicionado cadastrado nos seus ambientes.')
     return ar
 
+def _etag_painel(request, pk=None):
+    """ETag do painel a partir do estado do aparelho (None quando não há pk)"""
+    if pk is None or messages.get_messages(request):
+        # Com mensagem pendente a página muda mesmo com o aparelho igual: não responde 304
+        return None
+    estado = aparelhos_do_usuario(request.user).filter(pk=pk).values_list(
+        'ligado', 'temperatura', 'modo', 'velocidade', 'inicio_ligado'
+    ).first()
+    if estado is None:
+        return None
+    return hashlib.md5(repr((pk, request.user.pk) + estado).encode()).hexdigest()
+
+
+@login_required
+@cache_control(private=True, max_age=0)
+@condition(etag_func=_etag_painel)
 def painel(request,pk=None):
+    """Somente leitura: a simulação de temperatura roda no comando simular_ar_condicionado"""
     if pk is None:
-        first = ArCondicionado.objects.first()
+        first = aparelhos_do_usuario(request.user).first()
         if first:
             return redirect('painel_pk', pk=first.pk)
-        # nenhum ar cadastrado: mostrar índice (vazio)
-        ars = ArCondicionado.objects.all()
-        return render(request, 'painel.html', {'ars': ars})
-
-    ar = _get_ar(pk)
+        # nenhum ar nos ambientes do usuário: mostrar índice (vazio)
+        return render(request, 'painel.html', {'ars': ArCondicionado.objects.none()})
 
-    # Início do contador
-    if ar.ligado and not ar.inicio_ligado:
-        ar.inicio_ligado = timezone.now()
-        ar.save()
-    elif not ar.ligado and ar.inicio_ligado:
-        ar.inicio_ligado = None
-        ar.save()
+    ar = _get_ar(request, pk)
 
     tempo_ligado = None
     if ar.ligado and ar.inicio_ligado:
         tempo_ligado = timezone.now() - ar.inicio_ligado
 
-
-   # Simular pequenas variações de temperatura
-    if ar.ligado:
-        ar.temperatura += random.choice([-1, 0, 1])
-        ar.save()
-
     context = {
         'ar': ar,
         'tempo_ligado': tempo_ligado
@@ -51,37 +60,72 @@ def painel(request,pk=None):
     return render(request, 'painel.html', context)
 
 
+# As rotas antigas seguem a mesma regra de acesso da API de comandos: login e aparelho do usuário
+@login_required
+@require_POST
 def alternar_status(request, pk=None):
-    ar = _get_ar(pk)
-    if not ar:
-        return redirect('painel')
-    ar.ligado = not ar.ligado
-    ar.save()
+    ar = _get_ar(request, pk)
+    aplicar('alternar', ArCondicionado.objects.filter(pk=ar.pk))
     return redirect('painel_pk', pk=ar.pk)
 
-def aumentar_temp(request, pk=None):
-    ar = _get_ar(pk)
-    if not ar:
-        return redirect('painel')
-    ar.temperatura = (ar.temperatura or 0) + 1
-    ar.save()
+def _ajustar_temperatura(request, pk, acao):
+    """A temperatura só muda com o aparelho ligado e dentro dos limites; senão avisa no painel"""
+    ar = _get_ar(request, pk)
+    if not aplicar(acao, ArCondicionado.objects.filter(pk=ar.pk)):
+        if not ar.ligado:
+            messages.warning(request, 'Aparelho desligado: ligue-o para ajustar a temperatura.')
+        else:
+            messages.warning(
+                request,
+                f'A temperatura já está no limite ({ArCondicionado.TEMPERATURA_MINIMA} a {ArCondicionado.TEMPERATURA_MAXIMA} °C).',
+            )
     return redirect('painel_pk', pk=ar.pk)
 
+@login_required
+@require_POST
+def aumentar_temp(request, pk=None):
+    return _ajustar_temperatura(request, pk, 'aumentar')
+
+@login_required
+@require_POST
 def diminuir_temp(request, pk=None):
-    ar = _get_ar(pk)
-    if not ar:
-        return redirect('painel')
-    ar.temperatura = (ar.temperatura or 0) - 1
-    ar.save()
-    return redirect('painel_pk', pk=ar.pk)
+    return _ajustar_temperatura(request, pk, 'diminuir')
 
+@login_required
+@require_POST
 def alterar_modo(request, pk=None):
-    ar = _get_ar(pk)
-    if request.method == 'POST':
-        modo = request.POST.get('modo')
-        if modo is not None:
-            # opcional: normalizar capitalização conforme seu modelo
-            ar.modo = modo
-            ar.save()
+    ar = _get_ar(request, pk)
+    modo = request.POST.get('modo')
+    if modo is not None:
+        try:
+            aplicar('modo', ArCondicionado.objects.filter(pk=ar.pk), modo)
+        except ComandoInvalido as erro:
+            messages.error(request, str(erro))
     # sempre redireciona para o painel do aparelho (com pk)
-    return redirect('painel_pk', pk=ar.pk)
\ No newline at end of file
+    return redirect('painel_pk', pk=ar.pk)
+
+
+@require_POST
+def comandos(request):
+    """API JSON: aplica um comando ou um lote de comandos e devolve o novo estado dos aparelhos.
+
+    Aceita {"acao": ..., "pk": ...}, {"comandos": [...]} ou uma lista de comandos; só para
+    aparelhos dos ambientes do usuário (401 sem login, 403 se algum alvo for de outro, 422 se o comando
+    for inválido).
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'erro': 'Faça login para comandar os aparelhos.'}, status=401)
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'erro': 'Corpo da requisição não é um JSON válido.'}, status=400)
+    if isinstance(dados, dict):
+        dados = dados['comandos'] if 'comandos' in dados else [dados]
+
+    try:
+        resultado = executar_comandos(dados, request.user)
+    except AcessoNegado as erro:
+        return JsonResponse({'erro': str(erro)}, status=403)
+    except ComandoInvalido as erro:
+        return JsonResponse({'erro': str(erro)}, status=422)
+    return JsonResponse(resultado)
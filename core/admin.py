@@ -1,10 +1,19 @@
+from django import forms
 from django.contrib import admin
-from .models import Ambiente, Dispositivo, TipoSensor, Sensor, LeituraSensor
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import Alerta, Ambiente, Dispositivo, TipoSensor, Sensor, LeituraSensor
+from .paginacao import ChangeListLeituras
+from .provisionamento import AplicacaoInterrompida, ManifestoInvalido, aplicar_plano, ler_manifesto, validar_manifesto
 
 
 @admin.register(TipoSensor)
 class TipoSensorAdmin(admin.ModelAdmin):
-    list_display = ['nome', 'unidade', 'descricao']
+    list_display = ['nome', 'unidade', 'retencao_dias', 'descricao']
     search_fields = ['nome', 'unidade']
     ordering = ['nome']
 
@@ -18,6 +27,13 @@ class AmbienteAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
+        # Contagens calculadas na mesma consulta da listagem (evita um COUNT por linha)
+        dispositivos = Dispositivo.objects.filter(ambiente=OuterRef('pk')).order_by().values('ambiente').annotate(n=Count('pk')).values('n')
+        sensores = Sensor.objects.filter(ambiente=OuterRef('pk')).order_by().values('ambiente').annotate(n=Count('pk')).values('n')
+        qs = qs.annotate(
+            num_dispositivos=Coalesce(Subquery(dispositivos), 0),
+            num_sensores=Coalesce(Subquery(sensores), 0),
+        )
         if request.user.is_superuser:
             return qs
         return qs.filter(usuario=request.user)
@@ -27,13 +43,45 @@ class AmbienteAdmin(admin.ModelAdmin):
             obj.usuario = request.user
         obj.save()
 
+    def total_dispositivos(self, obj):
+        return obj.num_dispositivos
+    total_dispositivos.short_description = 'Dispositivos'
+    total_dispositivos.admin_order_field = 'num_dispositivos'
+
+    def total_sensores(self, obj):
+        return obj.num_sensores
+    total_sensores.short_description = 'Sensores'
+    total_sensores.admin_order_field = 'num_sensores'
+
+
+class PresencaFilter(admin.SimpleListFilter):
+    title = 'Presença'
+    parameter_name = 'presenca'
+
+    def lookups(self, request, model_admin):
+        return Dispositivo.PRESENCA_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value() in dict(Dispositivo.PRESENCA_CHOICES):
+            return queryset.por_presenca(self.value())
+        return queryset
+
+
+class ManifestoForm(forms.Form):
+    manifesto = forms.FileField(label='Manifesto', help_text='CSV (uma linha por sensor) ou JSON; veja core/provisionamento.py')
+    simular = forms.BooleanField(label='Apenas simular', required=False, initial=True)
+    ignorar_existentes = forms.BooleanField(label='Ignorar MACs já cadastrados', required=False)
+    gerar_tokens = forms.BooleanField(label='Gerar tokens de acesso', required=False)
+
 
 @admin.register(Dispositivo)
 class DispositivoAdmin(admin.ModelAdmin):
-    list_display = ['nome', 'tipo', 'ambiente', 'status', 'usuario', 'is_online', 'ultimo_contato']
-    list_filter = ['tipo', 'status', 'ambiente', 'usuario', 'criado_em']
+    list_display = ['nome', 'tipo', 'ambiente', 'status', 'usuario', 'is_online', 'presenca', 'ultimo_contato']
+    list_filter = [PresencaFilter, 'tipo', 'status', 'ambiente', 'usuario', 'criado_em']
     search_fields = ['nome', 'modelo', 'fabricante', 'mac_address', 'ip_address']
     ordering = ['nome']
+    actions = ['gerar_tokens']
+    change_list_template = 'admin/core/dispositivo/change_list.html'
     
     fieldsets = [
         ('Informações Básicas', {
@@ -53,7 +101,7 @@ class DispositivoAdmin(admin.ModelAdmin):
     ]
     
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
+        qs = super().get_queryset(request).com_presenca()
         if request.user.is_superuser:
             return qs
         return qs.filter(usuario=request.user)
@@ -67,6 +115,66 @@ class DispositivoAdmin(admin.ModelAdmin):
         return obj.is_online
     is_online.boolean = True
     is_online.short_description = 'Online'
+    is_online.admin_order_field = 'ultimo_contato'
+
+    def presenca(self, obj):
+        return dict(Dispositivo.PRESENCA_CHOICES).get(obj.presenca)
+    presenca.short_description = 'Presença'
+    presenca.admin_order_field = 'ultimo_contato'
+
+    def gerar_tokens(self, request, queryset):
+        # O token só existe em texto aqui; o banco guarda o hash
+        dispositivos = list(queryset)
+        tokens = [f'{dispositivo.mac_address}: {dispositivo.gerar_token()}' for dispositivo in dispositivos]
+        Dispositivo.objects.bulk_update(dispositivos, ['token_hash'])
+        self.message_user(request, 'Novos tokens (anote agora, eles não serão exibidos de novo): ' + '; '.join(tokens))
+    gerar_tokens.short_description = 'Gerar novo token de acesso para o listener'
+
+    def get_urls(self):
+        return [
+            path('importar/', self.admin_site.admin_view(self.importar_manifesto), name='core_dispositivo_importar'),
+        ] + super().get_urls()
+
+    def importar_manifesto(self, request):
+        """Cadastro em lote a partir de um manifesto; os objetos criados pertencem ao usuário logado"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        plano = None
+        form = ManifestoForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            arquivo = form.cleaned_data['manifesto']
+            formato = 'json' if arquivo.name.lower().endswith('.json') else 'csv'
+            try:
+                entradas = ler_manifesto(arquivo.read(), formato)
+            except ManifestoInvalido as erro:
+                form.add_error('manifesto', str(erro))
+            else:
+                plano = validar_manifesto(entradas, request.user, form.cleaned_data['ignorar_existentes'])
+                if not plano.erros and not form.cleaned_data['simular']:
+                    try:
+                        tokens = aplicar_plano(plano, request.user, form.cleaned_data['gerar_tokens'])
+                    except AplicacaoInterrompida as erro:
+                        mensagem = f'Conflito ao gravar: {erro}. {erro.gravados} dispositivos dos blocos anteriores foram gravados.'
+                        if erro.tokens:
+                            mensagem += ' Tokens deles (anote agora, eles não serão exibidos de novo): ' + '; '.join(
+                                f'{mac}: {token}' for mac, token in erro.tokens
+                            )
+                        self.message_user(request, mensagem, level='error')
+                    else:
+                        mensagem = f'{len(plano.dispositivos)} dispositivos e {plano.total_sensores} sensores cadastrados.'
+                        if tokens:
+                            mensagem += ' Tokens (anote agora, eles não serão exibidos de novo): ' + '; '.join(
+                                f'{mac}: {token}' for mac, token in tokens
+                            )
+                        self.message_user(request, mensagem)
+                        return redirect('admin:core_dispositivo_changelist')
+        return TemplateResponse(request, 'admin/core/dispositivo/importar.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar manifesto de dispositivos',
+            'form': form,
+            'plano': plano,
+        })
 
 
 @admin.register(Sensor)
@@ -75,13 +183,14 @@ class SensorAdmin(admin.ModelAdmin):
     list_filter = ['tipo', 'ativo', 'ambiente', 'usuario', 'criado_em']
     search_fields = ['nome', 'dispositivo__nome', 'ambiente__nome']
     ordering = ['nome']
+    list_select_related = ['tipo', 'dispositivo', 'ambiente', 'leitura_atual']
     
     fieldsets = [
         ('Informações Básicas', {
             'fields': ['nome', 'tipo', 'dispositivo', 'ambiente', 'ativo']
         }),
         ('Configurações', {
-            'fields': ['valor_minimo', 'valor_maximo', 'precisao']
+            'fields': ['valor_minimo', 'valor_maximo', 'precisao', 'slot', 'retencao_dias']
         }),
         ('Descrição', {
             'fields': ['descricao'],
@@ -106,6 +215,12 @@ class SensorAdmin(admin.ModelAdmin):
             return f"{leitura.valor} {obj.tipo.unidade}"
         return "Nenhuma leitura"
     ultima_leitura_valor.short_description = 'Última Leitura'
+    ultima_leitura_valor.admin_order_field = 'leitura_atual__timestamp'
+
+    def total_leituras(self, obj):
+        return obj.total_leituras
+    total_leituras.short_description = 'Total de Leituras'
+    total_leituras.admin_order_field = 'leitura_atual__total_leituras'
 
 
 @admin.register(LeituraSensor)
@@ -115,7 +230,13 @@ class LeituraSensorAdmin(admin.ModelAdmin):
     search_fields = ['sensor__nome', 'observacao']
     ordering = ['-timestamp']
     date_hierarchy = 'timestamp'
+    list_select_related = ['sensor__tipo']
+    change_list_template = 'admin/core/leiturasensor/change_list.html'
     
+    def get_changelist(self, request, **kwargs):
+        # Paginação por (timestamp, id) e total estimado; veja core/paginacao.py
+        return ChangeListLeituras
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
@@ -131,6 +252,43 @@ class LeituraSensorAdmin(admin.ModelAdmin):
     valor_formatado.short_description = 'Valor'
 
 
+class AlertaAtivoFilter(admin.SimpleListFilter):
+    title = 'Situação'
+    parameter_name = 'situacao'
+
+    def lookups(self, request, model_admin):
+        return [('ativo', 'Ativo'), ('encerrado', 'Encerrado')]
+
+    def queryset(self, request, queryset):
+        if self.value() in ('ativo', 'encerrado'):
+            return queryset.filter(encerrado_em__isnull=self.value() == 'ativo')
+        return queryset
+
+
+@admin.register(Alerta)
+class AlertaAdmin(admin.ModelAdmin):
+    list_display = ['sensor', 'tipo', 'limite', 'valor_extremo', 'ultimo_valor', 'contagem', 'inicio', 'encerrado_em']
+    list_filter = [AlertaAtivoFilter, 'tipo', 'sensor__ambiente']
+    search_fields = ['sensor__nome']
+    list_select_related = ['sensor__tipo']
+    ordering = ['-inicio']
+    date_hierarchy = 'inicio'
+    readonly_fields = [
+        'sensor', 'usuario', 'tipo', 'limite', 'valor_extremo', 'ultimo_valor',
+        'contagem', 'inicio', 'ultimo_timestamp', 'encerrado_em',
+    ]
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(usuario=request.user)
+
+    def has_add_permission(self, request):
+        # Os alertas são abertos e fechados pela ingestão
+        return False
+
+
 # Personalizando o título do admin
 admin.site.site_header = "Sistema IoT - Administração"
 admin.site.site_title = "Sistema IoT"
@@ -0,0 +1,196 @@
+"""Agregados incrementais das leituras por minuto, hora e dia.
+
+Cada lote gravado é resumido em memória por (sensor, granularidade,
+período) e mesclado aos agregados existentes com uma leitura e um upsert
+por granularidade. Consultas de histórico longas leem os agregados por
+hora ou por dia em vez de varrer LeituraSensor.
+
+Quando leituras já agregadas mudam de valor, ``recalcular_agregados``
+refaz só os períodos que as contêm a partir do que está gravado.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import AgregadoLeitura, LeituraSensor
+
+
+GRANULARIDADES = ('minuto', 'hora', 'dia')
+DURACOES = {'minuto': timedelta(minutes=1), 'hora': timedelta(hours=1), 'dia': timedelta(days=1)}
+BATCH_SIZE = 500
+CAMPOS = ['minimo', 'maximo', 'soma', 'contagem', 'ultimo_valor', 'ultimo_timestamp']
+
+
+def inicio_do_periodo(momento, granularidade):
+    """Trunca o momento para o início do período no fuso horário local"""
+    local = timezone.localtime(momento)
+    if granularidade == 'minuto':
+        local = local.replace(second=0, microsecond=0)
+    elif granularidade == 'hora':
+        local = local.replace(minute=0, second=0, microsecond=0)
+    elif granularidade == 'dia':
+        local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        raise ValueError(f'Granularidade desconhecida: {granularidade}')
+    return local
+
+
+def _resumir(leituras, granularidade):
+    """Agrupa tuplas (sensor_id, valor, timestamp) em {(sensor_id, inicio): [min, max, soma, n, último, ts]}"""
+    resumo = {}
+    for sensor_id, valor, momento in leituras:
+        chave = (sensor_id, inicio_do_periodo(momento, granularidade))
+        atual = resumo.get(chave)
+        if atual is None:
+            resumo[chave] = [valor, valor, valor, 1, valor, momento]
+            continue
+        if valor < atual[0]:
+            atual[0] = valor
+        if valor > atual[1]:
+            atual[1] = valor
+        atual[2] += valor
+        atual[3] += 1
+        if momento >= atual[5]:
+            atual[4] = valor
+            atual[5] = momento
+    return resumo
+
+
+def atualizar_agregados(leituras, granularidades=GRANULARIDADES):
+    """Mescla um lote de tuplas (sensor_id, valor, timestamp) aos agregados existentes"""
+    leituras = list(leituras)
+    if not leituras:
+        return
+
+    for granularidade in granularidades:
+        resumo = _resumir(leituras, granularidade)
+        sensores = {sensor_id for sensor_id, _ in resumo}
+        inicios = [inicio for _, inicio in resumo]
+        existentes = {
+            (agregado.sensor_id, agregado.inicio): agregado
+            for agregado in AgregadoLeitura.objects.filter(
+                sensor_id__in=sensores,
+                granularidade=granularidade,
+                inicio__gte=min(inicios),
+                inicio__lte=max(inicios),
+            )
+        }
+
+        agregados = []
+        for (sensor_id, inicio), (minimo, maximo, soma, contagem, ultimo, momento) in resumo.items():
+            agregado = existentes.get((sensor_id, inicio))
+            if agregado is None:
+                agregado = AgregadoLeitura(
+                    sensor_id=sensor_id, granularidade=granularidade, inicio=inicio,
+                    minimo=minimo, maximo=maximo, soma=soma, contagem=contagem,
+                    ultimo_valor=ultimo, ultimo_timestamp=momento,
+                )
+            else:
+                agregado.minimo = min(agregado.minimo, minimo)
+                agregado.maximo = max(agregado.maximo, maximo)
+                agregado.soma += soma
+                agregado.contagem += contagem
+                if momento >= agregado.ultimo_timestamp:
+                    agregado.ultimo_valor = ultimo
+                    agregado.ultimo_timestamp = momento
+            agregados.append(agregado)
+
+        _gravar(agregados)
+
+
+def _gravar(agregados):
+    AgregadoLeitura.objects.bulk_create(
+        agregados,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['sensor', 'granularidade', 'inicio'],
+        update_fields=CAMPOS,
+    )
+
+
+def _combinar(linhas, granularidade, alvos):
+    """Mescla tuplas (sensor_id, momento, min, max, soma, n, último, ts) nos períodos de ``alvos``"""
+    resumo = {}
+    for sensor_id, momento, minimo, maximo, soma, contagem, ultimo, ultimo_momento in linhas:
+        chave = (sensor_id, inicio_do_periodo(momento, granularidade))
+        if chave not in alvos:
+            continue
+        atual = resumo.get(chave)
+        if atual is None:
+            resumo[chave] = [minimo, maximo, soma, contagem, ultimo, ultimo_momento]
+            continue
+        atual[0] = min(atual[0], minimo)
+        atual[1] = max(atual[1], maximo)
+        atual[2] += soma
+        atual[3] += contagem
+        if ultimo_momento >= atual[5]:
+            atual[4] = ultimo
+            atual[5] = ultimo_momento
+    return resumo
+
+
+def recalcular_agregados(chaves):
+    """Refaz os agregados dos períodos que contêm os pares (sensor_id, timestamp) a partir do que está gravado.
+
+    Os minutos saem das leituras, as horas dos minutos e os dias das horas,
+    então cada período refeito lê no máximo 60 (ou 24) linhas além das
+    leituras dos minutos afetados. Períodos que ficaram sem leituras são
+    removidos.
+    """
+    alvos = {(sensor_id, inicio_do_periodo(momento, 'minuto')) for sensor_id, momento in chaves}
+    if not alvos:
+        return
+
+    fonte = None
+    for granularidade in GRANULARIDADES:
+        alvos = {(sensor_id, inicio_do_periodo(inicio, granularidade)) for sensor_id, inicio in alvos}
+        sensores = {sensor_id for sensor_id, _ in alvos}
+        desde = min(inicio for _, inicio in alvos)
+        ate = max(inicio for _, inicio in alvos) + DURACOES[granularidade]
+        if fonte is None:
+            linhas = (
+                (sensor_id, momento, valor, valor, valor, 1, valor, momento)
+                for sensor_id, valor, momento in LeituraSensor.objects.filter(
+                    sensor_id__in=sensores, timestamp__gte=desde, timestamp__lt=ate,
+                ).values_list('sensor_id', 'valor', 'timestamp')
+            )
+        else:
+            linhas = AgregadoLeitura.objects.filter(
+                sensor_id__in=sensores, granularidade=fonte, inicio__gte=desde, inicio__lt=ate,
+            ).values_list('sensor_id', 'inicio', *CAMPOS)
+        resumo = _combinar(linhas, granularidade, alvos)
+
+        _gravar([
+            AgregadoLeitura(
+                sensor_id=sensor_id, granularidade=granularidade, inicio=inicio,
+                minimo=minimo, maximo=maximo, soma=soma, contagem=contagem,
+                ultimo_valor=ultimo, ultimo_timestamp=momento,
+            )
+            for (sensor_id, inicio), (minimo, maximo, soma, contagem, ultimo, momento) in resumo.items()
+        ])
+        for sensor_id, inicio in alvos - resumo.keys():
+            AgregadoLeitura.objects.filter(sensor_id=sensor_id, granularidade=granularidade, inicio=inicio).delete()
+        fonte = granularidade
+
+
+def escolher_granularidade(inicio, fim, pontos):
+    """Escolhe a granularidade mais grossa que ainda tem ``pontos`` períodos no intervalo.
+
+    Retorna None quando o intervalo tem menos minutos que ``pontos``: nesse
+    caso as próprias leituras dão mais detalhe que os agregados.
+    """
+    intervalo = fim - inicio
+    for granularidade in reversed(GRANULARIDADES):
+        if intervalo >= DURACOES[granularidade] * pontos:
+            return granularidade
+    return None
+
+
+def serie_agregada(sensor, inicio, fim, granularidade):
+    """Retorna os agregados do sensor no intervalo [inicio, fim), em ordem cronológica"""
+    return AgregadoLeitura.objects.filter(
+        sensor=sensor,
+        granularidade=granularidade,
+        inicio__gte=inicio_do_periodo(inicio, granularidade),
+        inicio__lt=fim,
+    ).order_by('inicio')
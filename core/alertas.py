@@ -0,0 +1,162 @@
+"""Alertas de leituras fora da faixa ``valor_minimo``/``valor_maximo`` do sensor.
+
+Cada lote gravado passa por ``avaliar_alertas``: os limites vêm de um cache
+em memória por sensor (não há consulta por leitura), os alertas abertos dos
+sensores do lote são lidos em uma consulta e as mudanças são gravadas com um
+``bulk_update`` e um ``bulk_create``.
+
+Um alerta abre na primeira leitura fora da faixa e só fecha quando o valor
+volta para dentro dela com folga (histerese de ``IOT_ALERTA_HISTERESE`` da
+largura da faixa), então um valor oscilando em cima do limite não abre e
+fecha alertas a cada leitura. Há no máximo um alerta aberto por sensor
+(restrição única parcial), o que deduplica alertas entre lotes e processos.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Alerta, Sensor
+
+
+TOTAL_ATIVOS = 8
+
+
+class CacheLimites:
+    """Limites (mínimo, máximo, histerese, dono) por sensor, com expiração"""
+
+    def __init__(self, validade):
+        self.validade = validade
+        self._limites = {}
+        self._lock = threading.Lock()
+        self._carregado_em = time.monotonic()
+
+    def obter(self, sensor_ids):
+        """Retorna {sensor_id: (minimo, maximo, histerese, usuario_id)}; busca só os que faltam"""
+        with self._lock:
+            if time.monotonic() - self._carregado_em > self.validade:
+                self._limites = {}
+                self._carregado_em = time.monotonic()
+            faltando = [sensor_id for sensor_id in sensor_ids if sensor_id not in self._limites]
+        if faltando:
+            fracao = getattr(settings, 'IOT_ALERTA_HISTERESE', 0.05)
+            novos = {}
+            linhas = Sensor.objects.filter(pk__in=faltando).values_list('pk', 'valor_minimo', 'valor_maximo', 'usuario_id')
+            for sensor_id, minimo, maximo, usuario_id in linhas:
+                if minimo is not None and maximo is not None:
+                    histerese = abs(maximo - minimo) * fracao
+                else:
+                    limite = maximo if maximo is not None else minimo
+                    histerese = abs(limite or 0) * fracao
+                novos[sensor_id] = (minimo, maximo, histerese, usuario_id)
+            with self._lock:
+                self._limites.update(novos)
+        limites = self._limites
+        return {sensor_id: limites[sensor_id] for sensor_id in sensor_ids if sensor_id in limites}
+
+    def invalidar(self, sensor_id=None):
+        with self._lock:
+            if sensor_id is None:
+                self._limites = {}
+            else:
+                self._limites.pop(sensor_id, None)
+
+
+cache_limites = CacheLimites(getattr(settings, 'IOT_ALERTA_CACHE_SEGUNDOS', 60))
+
+
+def _violacao(valor, minimo, maximo):
+    """Retorna ('acima'|'abaixo', limite) se o valor está fora da faixa, senão None"""
+    if maximo is not None and valor > maximo:
+        return 'acima', maximo
+    if minimo is not None and valor < minimo:
+        return 'abaixo', minimo
+    return None
+
+
+def _normalizado(alerta, valor, histerese):
+    """Indica se o valor voltou para dentro da faixa com folga suficiente para fechar o alerta"""
+    if alerta.tipo == 'acima':
+        return valor <= alerta.limite - histerese
+    return valor >= alerta.limite + histerese
+
+
+def avaliar_alertas(leituras):
+    """Abre, atualiza e fecha alertas a partir de tuplas (sensor_id, valor, timestamp).
+
+    Retorna os ids dos donos que tiveram alertas abertos ou encerrados.
+    """
+    por_sensor = defaultdict(list)
+    for sensor_id, valor, timestamp in leituras:
+        por_sensor[sensor_id].append((timestamp, valor))
+    if not por_sensor:
+        return set()
+
+    limites = cache_limites.obter(list(por_sensor))
+    abertos = {
+        alerta.sensor_id: alerta
+        for alerta in Alerta.objects.filter(sensor_id__in=list(por_sensor), encerrado_em__isnull=True)
+    }
+
+    alterados = {}
+    novos = []
+    for sensor_id, linhas in por_sensor.items():
+        minimo, maximo, histerese, usuario_id = limites.get(sensor_id, (None, None, 0, None))
+        alerta = abertos.get(sensor_id)
+        if minimo is None and maximo is None:
+            if alerta is not None:
+                # Os limites foram removidos do sensor: não há mais faixa a violar
+                alerta.encerrado_em = max(timestamp for timestamp, _ in linhas)
+                alterados[alerta.pk] = alerta
+            continue
+        if len(linhas) > 1:
+            linhas.sort(key=lambda linha: linha[0])
+
+        for timestamp, valor in linhas:
+            violacao = _violacao(valor, minimo, maximo)
+            if alerta is not None:
+                if violacao is not None and violacao[0] == alerta.tipo:
+                    alerta.contagem += 1
+                    alerta.ultimo_valor = valor
+                    alerta.ultimo_timestamp = timestamp
+                    if (valor > alerta.valor_extremo) if alerta.tipo == 'acima' else (valor < alerta.valor_extremo):
+                        alerta.valor_extremo = valor
+                    if alerta.pk is not None:
+                        alterados[alerta.pk] = alerta
+                    continue
+                if violacao is None and not _normalizado(alerta, valor, histerese):
+                    # Dentro da faixa mas ainda na zona de histerese: o alerta continua aberto
+                    continue
+                alerta.encerrado_em = timestamp
+                if alerta.pk is not None:
+                    alterados[alerta.pk] = alerta
+                alerta = None
+            if violacao is not None:
+                tipo, limite = violacao
+                alerta = Alerta(
+                    sensor_id=sensor_id, usuario_id=usuario_id, tipo=tipo, limite=limite,
+                    valor_extremo=valor, ultimo_valor=valor, contagem=1,
+                    inicio=timestamp, ultimo_timestamp=timestamp,
+                )
+                novos.append(alerta)
+
+    donos = {alerta.usuario_id for alerta in alterados.values() if alerta.encerrado_em is not None}
+    donos.update(alerta.usuario_id for alerta in novos)
+    if alterados:
+        Alerta.objects.bulk_update(
+            alterados.values(), ['contagem', 'ultimo_valor', 'ultimo_timestamp', 'valor_extremo', 'encerrado_em'],
+        )
+    if novos:
+        # Outro processo pode ter aberto o alerta do mesmo sensor; a restrição única descarta o repetido
+        Alerta.objects.bulk_create(novos, ignore_conflicts=True)
+    return donos
+
+
+def alertas_ativos(usuario, limite=TOTAL_ATIVOS):
+    """Retorna os alertas abertos do usuário, mais recentes primeiro (índice parcial por usuário)"""
+    return list(
+        Alerta.objects.filter(usuario=usuario, encerrado_em__isnull=True)
+        .select_related('sensor__tipo', 'sensor__dispositivo')
+        .order_by('-inicio')[:limite]
+    )
@@ -0,0 +1,254 @@
+"""Arquivo frio das leituras antigas, um arquivo por sensor por mês.
+
+Cada arquivo guarda as leituras em colunas (ids, timestamps e valores em
+arrays binários de 8 bytes, com ids e timestamps codificados em delta)
+comprimidas com zlib, o que ocupa uma fração do espaço de LeituraSensor
+e dos seus índices. As observações, raras, vão em um bloco JSON esparso.
+
+``leituras_no_intervalo`` junta o arquivo e a tabela quente de forma
+transparente para consultas históricas.
+"""
+import heapq
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import LeituraSensor
+
+
+MAGICO = b'IOTA'
+VERSAO = 1
+_CABECALHO = struct.Struct('<4sBI')
+CHUNK_SIZE = 2000
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def diretorio_arquivo():
+    return Path(getattr(settings, 'IOT_ARQUIVO_DIR', Path(settings.BASE_DIR) / 'arquivo'))
+
+
+def caminho_mes(sensor_id, ano, mes):
+    return diretorio_arquivo() / str(sensor_id) / f'{ano:04d}-{mes:02d}.bin.z'
+
+
+def mes_local(momento):
+    """Retorna (ano, mês) do momento no fuso horário local"""
+    local = timezone.localtime(momento)
+    return local.year, local.month
+
+
+def inicio_mes(ano, mes):
+    """Meia-noite do primeiro dia do mês no fuso horário local (o mesmo de ``mes_local``)"""
+    return timezone.make_aware(datetime(ano, mes, 1))
+
+
+def para_microssegundos(momento):
+    delta = momento - _EPOCA
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def de_microssegundos(valor):
+    return datetime.fromtimestamp(valor // 1000000, tz=dt_timezone.utc).replace(microsecond=valor % 1000000)
+
+
+def _little_endian(dados):
+    if sys.byteorder == 'big':
+        dados.byteswap()
+    return dados
+
+
+def _delta(valores):
+    anterior = 0
+    saida = array('q')
+    for valor in valores:
+        saida.append(valor - anterior)
+        anterior = valor
+    return saida
+
+
+def _acumular(deltas):
+    total = 0
+    saida = array('q')
+    for delta in deltas:
+        total += delta
+        saida.append(total)
+    return saida
+
+
+def codificar(ids, timestamps, valores, observacoes):
+    """Serializa colunas ordenadas por timestamp (timestamps em µs desde a época)"""
+    n = len(ids)
+    partes = [
+        _CABECALHO.pack(MAGICO, VERSAO, n),
+        _little_endian(_delta(ids)).tobytes(),
+        _little_endian(_delta(timestamps)).tobytes(),
+        _little_endian(array('d', valores)).tobytes(),
+    ]
+    extras = json.dumps(observacoes, ensure_ascii=False).encode('utf-8') if observacoes else b''
+    partes.append(struct.pack('<I', len(extras)))
+    partes.append(extras)
+    return zlib.compress(b''.join(partes), 6)
+
+
+def decodificar(conteudo):
+    """Retorna (ids, timestamps, valores, observacoes) a partir do conteúdo de um arquivo"""
+    dados = memoryview(zlib.decompress(conteudo))
+    magico, versao, n = _CABECALHO.unpack_from(dados, 0)
+    if magico != MAGICO or versao != VERSAO:
+        raise ValueError('Arquivo de leituras com formato desconhecido.')
+    posicao = _CABECALHO.size
+    colunas = []
+    for tipo in ('q', 'q', 'd'):
+        coluna = array(tipo)
+        coluna.frombytes(dados[posicao:posicao + 8 * n])
+        colunas.append(_little_endian(coluna))
+        posicao += 8 * n
+    (tamanho_extras,) = struct.unpack_from('<I', dados, posicao)
+    posicao += 4
+    observacoes = json.loads(bytes(dados[posicao:posicao + tamanho_extras])) if tamanho_extras else {}
+    return _acumular(colunas[0]), _acumular(colunas[1]), colunas[2], observacoes
+
+
+def ler_mes(sensor_id, ano, mes):
+    """Lê o arquivo do mês; retorna colunas vazias se ele não existir"""
+    caminho = caminho_mes(sensor_id, ano, mes)
+    if not caminho.exists():
+        return array('q'), array('q'), array('d'), {}
+    return decodificar(caminho.read_bytes())
+
+
+def arquivar_mes(sensor_id, ano, mes, linhas):
+    """Mescla tuplas (id, timestamp, valor, observacao) ao arquivo do mês.
+
+    Leituras já arquivadas (mesmo id) são ignoradas, então repetir o
+    arquivamento após uma falha não duplica dados.
+    """
+    ids, timestamps, valores, observacoes = ler_mes(sensor_id, ano, mes)
+    registros = {
+        ids[i]: (timestamps[i], valores[i], observacoes.get(str(ids[i])))
+        for i in range(len(ids))
+    }
+    for leitura_id, momento, valor, observacao in linhas:
+        registros.setdefault(leitura_id, (para_microssegundos(momento), valor, observacao))
+
+    ordenados = sorted(registros.items(), key=lambda item: (item[1][0], item[0]))
+    conteudo = codificar(
+        [leitura_id for leitura_id, _ in ordenados],
+        [momento for _, (momento, _, _) in ordenados],
+        [valor for _, (_, valor, _) in ordenados],
+        {str(leitura_id): obs for leitura_id, (_, _, obs) in ordenados if obs},
+    )
+
+    caminho = caminho_mes(sensor_id, ano, mes)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_name(caminho.name + '.tmp')
+    temporario.write_bytes(conteudo)
+    os.replace(temporario, caminho)
+    return len(ordenados)
+
+
+def _meses_entre(inicio, fim):
+    ano, mes = mes_local(inicio)
+    ultimo = mes_local(fim)
+    while (ano, mes) <= ultimo:
+        yield ano, mes
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+def _fatia(timestamps, inicio_us, fim_us):
+    """Posições [de, ate) dos timestamps (ordenados) que caem em [inicio_us, fim_us)"""
+    return bisect_left(timestamps, inicio_us), bisect_left(timestamps, fim_us)
+
+
+def iterar_arquivo(sensor_id, inicio, fim):
+    """Gera tuplas (id, timestamp em µs, valor) arquivadas em [inicio, fim), em ordem cronológica.
+
+    Só um mês fica decodificado em memória por vez.
+    """
+    inicio_us, fim_us = para_microssegundos(inicio), para_microssegundos(fim)
+    for ano, mes in _meses_entre(inicio, fim):
+        ids, timestamps, valores, _ = ler_mes(sensor_id, ano, mes)
+        de, ate = _fatia(timestamps, inicio_us, fim_us)
+        for i in range(de, ate):
+            yield ids[i], timestamps[i], valores[i]
+
+
+def _contar(sensor_id, inicio, fim, quentes):
+    """Conta as leituras do intervalo sem repetir as que estão no arquivo e na tabela quente.
+
+    Uma leitura fica nos dois lados se o arquivamento foi interrompido antes de
+    apagar; a tabela quente só é consultada no trecho que o mês arquivado cobre.
+    """
+    inicio_us, fim_us = para_microssegundos(inicio), para_microssegundos(fim)
+    total = quentes.count()
+    for ano, mes in _meses_entre(inicio, fim):
+        _, timestamps, _, _ = ler_mes(sensor_id, ano, mes)
+        de, ate = _fatia(timestamps, inicio_us, fim_us)
+        if de == ate:
+            continue
+        total += ate - de
+        trecho = quentes.filter(
+            timestamp__gte=de_microssegundos(timestamps[de]), timestamp__lte=de_microssegundos(timestamps[ate - 1]),
+        ).values_list('timestamp', flat=True)
+        for momento in trecho.iterator(chunk_size=CHUNK_SIZE):
+            posicao = bisect_left(timestamps, para_microssegundos(momento), de, ate)
+            if posicao < ate and timestamps[posicao] == para_microssegundos(momento):
+                total -= 1
+    return total
+
+
+def iterar_leituras(sensor_id, inicio, fim):
+    """Gera tuplas (timestamp em µs, valor) do arquivo e da tabela quente em [inicio, fim), em ordem cronológica.
+
+    As duas fontes, já ordenadas, são intercaladas enquanto o gerador é
+    consumido. Uma leitura presente nos dois lados (mesmo sensor e timestamp)
+    sai uma vez, com o valor arquivado.
+    """
+    quentes = LeituraSensor.objects.filter(sensor_id=sensor_id, timestamp__gte=inicio, timestamp__lt=fim)
+    # O segundo campo ordena o arquivo antes da tabela quente no mesmo timestamp
+    arquivadas = ((momento, 0, valor) for _, momento, valor in iterar_arquivo(sensor_id, inicio, fim))
+    linhas = quentes.order_by('timestamp').values_list('timestamp', 'valor').iterator(chunk_size=CHUNK_SIZE)
+    recentes = ((para_microssegundos(momento), 1, valor) for momento, valor in linhas)
+    ultimo_arquivado = None
+    for momento, origem, valor in heapq.merge(arquivadas, recentes, key=lambda linha: linha[:2]):
+        if origem == 0:
+            ultimo_arquivado = momento
+        elif momento == ultimo_arquivado:
+            continue
+        yield momento, valor
+
+
+def leituras_no_intervalo(sensor_id, inicio, fim):
+    """Retorna (total, gerador de tuplas (timestamp em µs, valor)) do sensor em [inicio, fim), em ordem cronológica.
+
+    Junta o arquivo e a tabela quente sem carregar nenhum dos dois inteiro
+    (veja ``iterar_leituras``).
+    """
+    quentes = LeituraSensor.objects.filter(sensor_id=sensor_id, timestamp__gte=inicio, timestamp__lt=fim)
+    return _contar(sensor_id, inicio, fim, quentes), iterar_leituras(sensor_id, inicio, fim)
+
+
+def primeiro_mes_arquivado(sensores=None):
+    """Retorna o (ano, mês) mais antigo com arquivo, entre todos os sensores ou os indicados; None se não houver"""
+    diretorio = diretorio_arquivo()
+    if not diretorio.is_dir():
+        return None
+    meses = []
+    for pasta in diretorio.iterdir():
+        if not pasta.is_dir() or not pasta.name.isdigit():
+            continue
+        if sensores is not None and int(pasta.name) not in sensores:
+            continue
+        for caminho in pasta.glob('*.bin.z'):
+            ano, _, mes = caminho.name.split('.', 1)[0].partition('-')
+            meses.append((int(ano), int(mes)))
+    return min(meses, default=None)
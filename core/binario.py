@@ -0,0 +1,158 @@
+"""Formato binário compacto para lotes de leituras de dispositivos com pouca memória.
+
+Um corpo ``application/x-iot-lote`` é uma sequência de frames, um por
+dispositivo, todos little-endian::
+
+    cabeçalho (21 bytes)
+        4s  mágico b'IOTB'
+        B   versão (1)
+        6s  MAC do dispositivo (bytes crus)
+        Q   timestamp base em ms desde a época (0 = dispositivo sem relógio)
+        H   quantidade de registros
+    registro (9 bytes cada)
+        B   slot do sensor (campo ``slot`` do cadastro, fixo por dispositivo)
+        I   ms desde o registro anterior (o primeiro é relativo à base)
+        f   valor (float32, arredondado para a precisão do sensor)
+
+Uma leitura de 9 bytes substitui ~110 bytes de JSON e o firmware só precisa
+de ``memcpy`` para montar o frame. Sem relógio (base 0) a última leitura do
+frame recebe o horário de chegada ao servidor e as anteriores são
+posicionadas pelos deltas; como nada confirma esse horário, leituras mais
+de ``TOLERANCIA_FUTURO`` antes da chegada são rejeitadas, a mesma margem de
+desvio de relógio da ingestão JSON.
+
+A decodificação usa ``struct.iter_unpack`` sobre um ``memoryview`` do corpo,
+sem cópias nem objetos intermediários por campo, e as leituras seguem o
+mesmo caminho de gravação em lote da ingestão JSON.
+"""
+import math
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from sistema_iot.metricas import registro
+
+from .ingestao import TAMANHO_MAXIMO_LOTE, TOLERANCIA_FUTURO, LoteInvalido, persistir_leituras
+from .models import LeituraSensor, Sensor
+
+
+CONTENT_TYPE = 'application/x-iot-lote'
+MAGICO = b'IOTB'
+VERSAO = 1
+CABECALHO = struct.Struct('<4sB6sQH')
+REGISTRO = struct.Struct('<BIf')
+
+
+def mac_para_texto(mac):
+    return ':'.join(f'{byte:02X}' for byte in mac)
+
+
+def mac_para_bytes(mac):
+    return bytes(int(parte, 16) for parte in mac.replace('-', ':').split(':'))
+
+
+def codificar_frame(mac, registros, base_ms=0):
+    """Monta um frame a partir de tuplas (slot, timestamp em ms, valor) em ordem cronológica"""
+    partes = [CABECALHO.pack(MAGICO, VERSAO, mac_para_bytes(mac), base_ms, len(registros))]
+    anterior = base_ms
+    for slot, momento, valor in registros:
+        partes.append(REGISTRO.pack(slot, momento - anterior, valor))
+        anterior = momento
+    return b''.join(partes)
+
+
+def decodificar(corpo):
+    """Retorna a lista de frames (mac, base_ms, slots, timestamps em ms, valores) do corpo"""
+    dados = memoryview(corpo)
+    frames = []
+    posicao = 0
+    total = 0
+    while posicao < len(dados):
+        if len(dados) - posicao < CABECALHO.size:
+            raise LoteInvalido(f'Frame truncado na posição {posicao}.')
+        magico, versao, mac, base_ms, quantidade = CABECALHO.unpack_from(dados, posicao)
+        if magico != MAGICO or versao != VERSAO:
+            raise LoteInvalido(f'Frame com formato desconhecido na posição {posicao}.')
+        posicao += CABECALHO.size
+        fim = posicao + quantidade * REGISTRO.size
+        if fim > len(dados):
+            raise LoteInvalido(f'Frame truncado na posição {posicao}.')
+        total += quantidade
+        if total > TAMANHO_MAXIMO_LOTE:
+            raise LoteInvalido(f'Lote excede o limite de {TAMANHO_MAXIMO_LOTE} leituras.')
+
+        slots, timestamps, valores = [], [], []
+        momento = base_ms
+        for slot, delta, valor in REGISTRO.iter_unpack(dados[posicao:fim]):
+            momento += delta
+            slots.append(slot)
+            timestamps.append(momento)
+            valores.append(valor)
+        frames.append((mac_para_texto(mac), base_ms, slots, timestamps, valores))
+        posicao = fim
+    return frames
+
+
+def resolver_slots(macs):
+    """Mapeia cada MAC para {slot: (id do sensor, id do dispositivo, ativo, precisão, dono)}, em uma consulta"""
+    slots = {mac: {} for mac in macs}
+    linhas = Sensor.objects.filter(dispositivo__mac_address__in=macs, slot__isnull=False).values_list(
+        'dispositivo__mac_address', 'slot', 'id', 'dispositivo_id', 'ativo', 'precisao', 'dispositivo__usuario_id'
+    )
+    for mac, slot, *sensor in linhas:
+        slots[mac][slot] = tuple(sensor)
+    return slots
+
+
+def ingerir_binario(corpo, remetente=None):
+    """Decodifica e grava um lote binário; retorna os totais e a contagem de rejeições por motivo.
+
+    Com ``remetente`` (API HTTP), frames de dispositivos que ele não pode enviar são rejeitados;
+    só então as leituras avaliam as regras de automação.
+    """
+    frames = decodificar(corpo)
+    sensores = resolver_slots({mac for mac, _, _, _, _ in frames})
+    agora = timezone.now()
+    limite_ms = (agora + TOLERANCIA_FUTURO).timestamp() * 1000
+    tolerancia_ms = TOLERANCIA_FUTURO / timedelta(milliseconds=1)
+
+    leituras = []
+    dispositivos = set()
+    erros = {}
+    rejeitadas = 0
+    for mac, base_ms, slots, timestamps, valores in frames:
+        do_dispositivo = sensores[mac]
+        autorizado = remetente is None or (
+            bool(do_dispositivo) and remetente.pode_enviar_por(mac, next(iter(do_dispositivo.values()))[4])
+        )
+        for slot, momento, valor in zip(slots, timestamps, valores):
+            if slot not in do_dispositivo:
+                motivo = 'Sensor não encontrado.'
+            elif not autorizado:
+                motivo = 'Dispositivo não autorizado para este token.'
+            elif not do_dispositivo[slot][2]:
+                motivo = 'Sensor inativo.'
+            elif not math.isfinite(valor):
+                motivo = 'Valor não finito.'
+            elif base_ms and momento > limite_ms:
+                motivo = 'Timestamp no futuro.'
+            elif not base_ms and timestamps[-1] - momento > tolerancia_ms:
+                motivo = 'Leitura antiga demais para dispositivo sem relógio.'
+            else:
+                sensor_id, dispositivo_id, _, precisao, _ = do_dispositivo[slot]
+                if base_ms:
+                    quando = datetime.fromtimestamp(momento / 1000, tz=dt_timezone.utc)
+                else:
+                    # Sem relógio, os deltas posicionam as leituras antes da chegada do frame
+                    quando = agora - timedelta(milliseconds=timestamps[-1] - momento)
+                # float32 não representa 23.4 exatamente; a precisão do sensor devolve o valor medido
+                leituras.append(LeituraSensor(sensor_id=sensor_id, valor=round(valor, precisao), timestamp=quando))
+                dispositivos.add(dispositivo_id)
+                continue
+            erros[motivo] = erros.get(motivo, 0) + 1
+            rejeitadas += 1
+
+    if leituras:
+        persistir_leituras(leituras, dispositivos, automacao=remetente is not None)
+    registro.registrar_ingestao(len(leituras) + rejeitadas, len(leituras))
+    return {'aceitas': len(leituras), 'rejeitadas': rejeitadas, 'erros': erros}
@@ -0,0 +1,6 @@
+from .eventos import fluxo_disponivel
+
+
+def fluxo_ao_vivo(request):
+    """Expõe ``fluxo_ao_vivo`` aos templates: as páginas só abrem o EventSource quando servidas por ASGI"""
+    return {'fluxo_ao_vivo': fluxo_disponivel(request)}
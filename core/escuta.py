@@ -0,0 +1,332 @@
+"""Listener asyncio (TCP e UDP) para gateways que mantêm o socket aberto.
+
+Protocolo TCP, uma mensagem por linha em UTF-8::
+
+    AUTH <mac> <token>                         responde "OK" ou "ERRO <motivo>" e fecha
+    {"tipo": "Temperatura", "valor": 23.5}     leitura de um sensor do próprio dispositivo
+    {"mac": "...", "tipo": "...", "valor": 1}  leitura repassada por um gateway (mesmo dono)
+    PING                                       registra o contato e responde "PONG"
+
+No UDP cada datagrama começa com a linha ``AUTH`` e segue com as leituras.
+
+As conexões só colocam as leituras em um buffer em memória. Uma única
+tarefa de gravação esvazia o buffer quando ele chega a ``lote`` leituras ou
+a cada ``intervalo`` segundos, gravando pela mesma ingestão em lote da API
+(um ``bulk_create`` e um UPDATE de ``ultimo_contato`` por lote) em uma
+thread dedicada, então o banco nunca recebe escritas concorrentes deste
+processo. Com o buffer cheio, as conexões param de ler até a gravação
+liberar espaço.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from .ingestao import ingerir_lote, normalizar_mac
+from .models import Dispositivo, hash_token
+from .presenca import buffer_presenca
+
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_AUTENTICACAO = 10
+TIMEOUT_OCIOSO = 300
+RECARREGAR_CREDENCIAIS = 60
+TAMANHO_MAXIMO_LINHA = 64 * 1024
+
+
+class Credenciais:
+    """MAC -> (id, dono, tipo, hash do token) de todos os dispositivos, recarregado periodicamente"""
+
+    def __init__(self, permitir_sem_token=False):
+        self.permitir_sem_token = permitir_sem_token
+        self._dispositivos = {}
+
+    def recarregar(self):
+        close_old_connections()
+        linhas = Dispositivo.objects.exclude(status='inativo').values_list(
+            'mac_address', 'id', 'usuario_id', 'tipo', 'token_hash'
+        )
+        self._dispositivos = {normalizar_mac(mac): dados for mac, *dados in linhas}
+        return len(self._dispositivos)
+
+    def autenticar(self, mac, token):
+        """Retorna o MAC normalizado se o token confere, senão None"""
+        mac = normalizar_mac(mac)
+        dados = self._dispositivos.get(mac)
+        if dados is None:
+            return None
+        token_hash = dados[3]
+        if not token_hash:
+            return mac if self.permitir_sem_token else None
+        return mac if token and hmac.compare_digest(token_hash, hash_token(token)) else None
+
+    def pode_enviar_por(self, remetente, mac):
+        """Um dispositivo envia as próprias leituras; um gateway também as de dispositivos do mesmo dono"""
+        if mac == remetente:
+            return True
+        origem = self._dispositivos.get(remetente)
+        destino = self._dispositivos.get(mac)
+        return origem is not None and destino is not None and origem[2] == 'gateway' and origem[1] == destino[1]
+
+
+class Metricas:
+    """Contadores do listener, expostos no formato texto do Prometheus"""
+
+    # (atributo, nome exportado, tipo)
+    EXPORTADAS = [
+        ('conexoes_ativas', 'iot_escuta_conexoes_ativas', 'gauge'),
+        ('conexoes_total', 'iot_escuta_conexoes_total', 'counter'),
+        ('autenticacoes_recusadas', 'iot_escuta_autenticacoes_recusadas_total', 'counter'),
+        ('leituras_recebidas', 'iot_escuta_leituras_recebidas_total', 'counter'),
+        ('leituras_gravadas', 'iot_escuta_leituras_gravadas_total', 'counter'),
+        ('leituras_rejeitadas', 'iot_escuta_leituras_rejeitadas_total', 'counter'),
+        ('leituras_perdidas', 'iot_escuta_leituras_perdidas_total', 'counter'),
+        ('linhas_invalidas', 'iot_escuta_linhas_invalidas_total', 'counter'),
+        ('gravacoes', 'iot_escuta_gravacoes_total', 'counter'),
+        ('latencia_soma', 'iot_escuta_gravacao_segundos_soma', 'counter'),
+        ('latencia_ultima', 'iot_escuta_gravacao_segundos_ultima', 'gauge'),
+        ('latencia_maxima', 'iot_escuta_gravacao_segundos_maxima', 'gauge'),
+        ('profundidade', 'iot_escuta_fila_profundidade', 'gauge'),
+        ('profundidade_maxima', 'iot_escuta_fila_profundidade_maxima', 'gauge'),
+    ]
+
+    def __init__(self):
+        self.conexoes_ativas = 0
+        self.conexoes_total = 0
+        self.autenticacoes_recusadas = 0
+        self.leituras_recebidas = 0
+        self.leituras_gravadas = 0
+        self.leituras_rejeitadas = 0
+        self.leituras_perdidas = 0
+        self.linhas_invalidas = 0
+        self.gravacoes = 0
+        self.profundidade = 0
+        self.profundidade_maxima = 0
+        self.latencia_ultima = 0.0
+        self.latencia_maxima = 0.0
+        self.latencia_soma = 0.0
+
+    def como_dict(self):
+        return dict(vars(self))
+
+    def prometheus(self):
+        linhas = []
+        for atributo, nome, tipo in self.EXPORTADAS:
+            linhas.append(f'# TYPE {nome} {tipo}')
+            linhas.append(f'{nome} {getattr(self, atributo)}')
+        return '\n'.join(linhas) + '\n'
+
+
+class Escuta:
+    """Recebe leituras por TCP/UDP e as grava em lotes a partir de um único escritor"""
+
+    def __init__(self, lote=2000, intervalo=1.0, max_pendentes=50000, permitir_sem_token=False):
+        self.lote = lote
+        self.intervalo = intervalo
+        self.max_pendentes = max_pendentes
+        self.credenciais = Credenciais(permitir_sem_token)
+        self.metricas = Metricas()
+        self._pendentes = []
+        self._gatilho = None
+        self._espaco = None
+        self._escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='iot-escuta-escrita')
+        self._datagramas = set()
+
+    # Buffer e gravação
+
+    async def _enfileirar(self, item):
+        if len(self._pendentes) >= self.max_pendentes:
+            # Contrapressão: a conexão para de ler até o escritor liberar espaço
+            self._espaco.clear()
+            self._gatilho.set()
+            await self._espaco.wait()
+        self._pendentes.append(item)
+        self.metricas.leituras_recebidas += 1
+        self._atualizar_profundidade()
+        if len(self._pendentes) >= self.lote:
+            self._gatilho.set()
+
+    def _atualizar_profundidade(self):
+        self.metricas.profundidade = len(self._pendentes)
+        self.metricas.profundidade_maxima = max(self.metricas.profundidade_maxima, self.metricas.profundidade)
+
+    def _gravar(self, itens):
+        close_old_connections()
+        inicio = time.monotonic()
+        try:
+            # Com permitir_sem_token parte das leituras vem sem autenticação: não aciona automações
+            resultado = ingerir_lote(itens, autenticado=not self.credenciais.permitir_sem_token)
+        except Exception:
+            logger.exception('Falha ao gravar %d leituras recebidas pelo listener', len(itens))
+            self.metricas.leituras_perdidas += len(itens)
+            return
+        duracao = time.monotonic() - inicio
+        self.metricas.gravacoes += 1
+        self.metricas.leituras_gravadas += resultado['aceitas']
+        self.metricas.leituras_rejeitadas += resultado['rejeitadas']
+        self.metricas.latencia_ultima = duracao
+        self.metricas.latencia_maxima = max(self.metricas.latencia_maxima, duracao)
+        self.metricas.latencia_soma += duracao
+
+    async def esvaziar(self):
+        """Grava tudo o que está pendente, em blocos de ``lote`` leituras"""
+        loop = asyncio.get_running_loop()
+        while self._pendentes:
+            itens, self._pendentes = self._pendentes[:self.lote], self._pendentes[self.lote:]
+            self._atualizar_profundidade()
+            await loop.run_in_executor(self._escritor, self._gravar, itens)
+            self._espaco.set()
+
+    async def _gravador(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._gatilho.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._gatilho.clear()
+            await self.esvaziar()
+
+    async def _recarregador(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(RECARREGAR_CREDENCIAIS)
+            try:
+                await loop.run_in_executor(None, self.credenciais.recarregar)
+            except Exception:
+                logger.exception('Falha ao recarregar as credenciais dos dispositivos')
+
+    # Protocolo
+
+    def _autenticar(self, linha):
+        partes = linha.split()
+        if len(partes) not in (2, 3) or partes[0].upper() != 'AUTH':
+            return None
+        mac = self.credenciais.autenticar(partes[1], partes[2] if len(partes) == 3 else '')
+        if mac is None:
+            self.metricas.autenticacoes_recusadas += 1
+        return mac
+
+    async def _processar_linha(self, remetente, linha):
+        """Enfileira uma leitura; retorna a resposta a enviar, se houver"""
+        if linha.upper() == 'PING':
+            buffer_presenca().registrar([remetente])
+            return 'PONG'
+        try:
+            item = json.loads(linha)
+        except ValueError:
+            item = None
+        if not isinstance(item, dict):
+            self.metricas.linhas_invalidas += 1
+            return None
+        mac = normalizar_mac(item.get('mac') or remetente)
+        if not self.credenciais.pode_enviar_por(remetente, mac):
+            self.metricas.leituras_rejeitadas += 1
+            return None
+        item['mac'] = mac
+        await self._enfileirar(item)
+        return None
+
+    async def _conexao_tcp(self, reader, writer):
+        self.metricas.conexoes_ativas += 1
+        self.metricas.conexoes_total += 1
+        try:
+            try:
+                linha = await asyncio.wait_for(reader.readline(), timeout=TIMEOUT_AUTENTICACAO)
+            except asyncio.TimeoutError:
+                return
+            remetente = self._autenticar(linha.decode('utf-8', 'replace').strip())
+            if remetente is None:
+                writer.write(b'ERRO autenticacao\n')
+                await writer.drain()
+                return
+            writer.write(b'OK\n')
+            buffer_presenca().registrar([remetente])
+
+            while True:
+                try:
+                    linha = await asyncio.wait_for(reader.readline(), timeout=TIMEOUT_OCIOSO)
+                except (asyncio.TimeoutError, ValueError):
+                    break
+                if not linha:
+                    break
+                linha = linha.decode('utf-8', 'replace').strip()
+                if not linha:
+                    continue
+                resposta = await self._processar_linha(remetente, linha)
+                if resposta:
+                    writer.write(resposta.encode() + b'\n')
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.metricas.conexoes_ativas -= 1
+            writer.close()
+
+    async def _datagrama(self, dados):
+        linhas = dados.decode('utf-8', 'replace').splitlines()
+        remetente = self._autenticar(linhas[0].strip()) if linhas else None
+        if remetente is None:
+            return
+        for linha in linhas[1:]:
+            linha = linha.strip()
+            if linha:
+                await self._processar_linha(remetente, linha)
+
+    async def _conexao_metricas(self, reader, writer):
+        try:
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            corpo = self.metricas.prometheus().encode()
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                + f'Content-Length: {len(corpo)}\r\nConnection: close\r\n\r\n'.encode()
+                + corpo
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def executar(self, host, porta_tcp, porta_udp=None, porta_metricas=None, ao_iniciar=None):
+        """Abre os sockets e grava as leituras até ser cancelado; o buffer é gravado ao sair"""
+        loop = asyncio.get_running_loop()
+        self._gatilho = asyncio.Event()
+        self._espaco = asyncio.Event()
+        self._espaco.set()
+        await loop.run_in_executor(None, self.credenciais.recarregar)
+
+        servidores = [await asyncio.start_server(self._conexao_tcp, host, porta_tcp, limit=TAMANHO_MAXIMO_LINHA)]
+        if porta_metricas:
+            servidores.append(await asyncio.start_server(self._conexao_metricas, host, porta_metricas))
+        transporte = None
+        if porta_udp:
+            escuta = self
+
+            class ProtocoloUDP(asyncio.DatagramProtocol):
+                def datagram_received(self, dados, endereco):
+                    tarefa = loop.create_task(escuta._datagrama(dados))
+                    escuta._datagramas.add(tarefa)
+                    tarefa.add_done_callback(escuta._datagramas.discard)
+
+            transporte, _ = await loop.create_datagram_endpoint(ProtocoloUDP, local_addr=(host, porta_udp))
+
+        tarefas = [loop.create_task(self._gravador()), loop.create_task(self._recarregador())]
+        if ao_iniciar:
+            ao_iniciar(servidores)
+        try:
+            await asyncio.gather(*(servidor.serve_forever() for servidor in servidores))
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            if transporte is not None:
+                transporte.close()
+            for servidor in servidores:
+                servidor.close()
+            await self.esvaziar()
+            self._escritor.shutdown(wait=True)
@@ -0,0 +1,100 @@
+"""Estatísticas do dashboard, calculadas por usuário e guardadas em cache.
+
+Os totais estruturais (ambientes, dispositivos, sensores, usuários) só
+mudam quando um desses objetos é salvo ou removido, e os sinais em
+``core.signals`` invalidam o cache quando a transação que os alterou é
+confirmada. Os alertas abertos também ficam no cache: a ingestão o invalida
+quando um alerta do usuário abre ou encerra. Dispositivos online, leituras
+recentes e os valores dos alertas mudam a cada lote ingerido, por isso o
+cache também expira após ``CACHE_TIMEOUT`` segundos.
+
+O total de usuários do site só é exibido para a equipe (``is_staff``).
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .alertas import alertas_ativos
+from .models import Ambiente, Dispositivo, Sensor, UltimaLeitura, limites_presenca
+
+
+CACHE_TIMEOUT = 30
+TOTAL_RECENTES = 8
+
+
+def _chave_usuario(usuario_id):
+    return f'core:dashboard:{usuario_id}'
+
+
+_CHAVE_TOTAL_USUARIOS = 'core:dashboard:total_usuarios'
+
+
+def invalidar_estatisticas(usuario_id):
+    """Remove do cache as estatísticas do usuário"""
+    cache.delete(_chave_usuario(usuario_id))
+
+
+def invalidar_total_usuarios():
+    """Remove do cache o total de usuários cadastrados"""
+    cache.delete(_CHAVE_TOTAL_USUARIOS)
+
+
+def _leitura_para_dict(ultima):
+    sensor = ultima.sensor
+    return {
+        'sensor_id': sensor.pk,
+        'sensor': sensor.nome,
+        'dispositivo': sensor.dispositivo.nome,
+        'valor': f"{ultima.valor:.{sensor.precisao}f} {sensor.tipo.unidade}",
+        'precisao': sensor.precisao,
+        'unidade': sensor.tipo.unidade,
+        'timestamp': ultima.timestamp,
+        'minimo': sensor.valor_minimo,
+        'maximo': sensor.valor_maximo,
+    }
+
+
+def calcular_estatisticas(usuario):
+    """Calcula as estatísticas do dashboard do usuário direto no banco"""
+    limite_online, _ = limites_presenca()
+    dispositivos = Dispositivo.objects.filter(usuario=usuario).aggregate(
+        total=Count('pk'),
+        online=Count('pk', filter=Q(ultimo_contato__gte=limite_online)),
+        com_erro=Count('pk', filter=Q(status='erro')),
+    )
+
+    ultimas = UltimaLeitura.objects.filter(sensor__usuario=usuario).select_related(
+        'sensor__tipo', 'sensor__dispositivo'
+    )
+    recentes = ultimas.order_by('-timestamp')[:TOTAL_RECENTES]
+
+    return {
+        'total_ambientes': Ambiente.objects.filter(usuario=usuario).count(),
+        'total_dispositivos': dispositivos['total'],
+        'dispositivos_online': dispositivos['online'],
+        'dispositivos_com_erro': dispositivos['com_erro'],
+        'total_sensores': Sensor.objects.filter(usuario=usuario).count(),
+        'leituras_recentes': [_leitura_para_dict(ultima) for ultima in recentes],
+        'alertas': alertas_ativos(usuario),
+    }
+
+
+def total_usuarios():
+    """Retorna o total de usuários, guardado em cache até um usuário ser criado ou removido"""
+    total = cache.get(_CHAVE_TOTAL_USUARIOS)
+    if total is None:
+        total = User.objects.count()
+        cache.set(_CHAVE_TOTAL_USUARIOS, total, None)
+    return total
+
+
+def estatisticas_dashboard(usuario):
+    """Retorna as estatísticas do dashboard do usuário, do cache quando possível"""
+    chave = _chave_usuario(usuario.pk)
+    estatisticas = cache.get(chave)
+    if estatisticas is None:
+        estatisticas = calcular_estatisticas(usuario)
+        cache.set(chave, estatisticas, CACHE_TIMEOUT)
+    if usuario.is_staff:
+        return dict(estatisticas, total_usuarios=total_usuarios())
+    return estatisticas
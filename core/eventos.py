@@ -0,0 +1,165 @@
+"""Fluxo de eventos ao vivo (server-sent events) das leituras e dos aparelhos.
+
+Cada processo ASGI mantém uma única tarefa que consulta o banco a cada
+``IOT_EVENTOS_INTERVALO`` segundos enquanto houver navegadores conectados:
+as leituras novas pelo id (usando a chave primária) e o estado dos
+aparelhos de ar-condicionado, comparado com a consulta anterior. O
+resultado é distribuído em memória para a fila de cada assinante, então o
+custo no banco não cresce com o número de abas abertas.
+
+Como a consulta lê o banco, leituras gravadas por outros processos (WSGI,
+listener, comandos de gerenciamento) também aparecem no fluxo.
+
+O fluxo só funciona servido por ASGI (``uvicorn sistema_iot.asgi:application``).
+No WSGI (runserver, gunicorn sync) o Django consumiria o gerador infinito
+antes de enviar qualquer byte, prendendo a thread do worker: a view responde
+501 e as páginas não abrem o EventSource (``fluxo_disponivel``).
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from ar_condicionado.comandos import CAMPOS_ESTADO
+from ar_condicionado.models import ArCondicionado
+
+from .models import LeituraSensor
+
+
+LIMITE_POR_CONSULTA = 2000
+TAMANHO_FILA = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class Assinatura:
+    """Fila de eventos de um navegador, com os filtros e permissões da conexão.
+
+    ``sensores_permitidos`` e ``ars_permitidos`` valem None quando o usuário
+    pode ver todos os sensores e aparelhos. Sem filtros, o assinante recebe
+    tudo o que pode ver; com filtros, só o que combinar com algum deles. Os
+    aparelhos seguem a regra da API de comandos (``aparelhos_do_usuario``).
+    """
+
+    def __init__(self, sensores=(), ambientes=(), ars=(), sensores_permitidos=None, ars_permitidos=None):
+        self.sensores = set(sensores)
+        self.ambientes = set(ambientes)
+        self.ars = set(ars)
+        self.sensores_permitidos = sensores_permitidos
+        self.ars_permitidos = ars_permitidos
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        self.descartados = 0
+
+    @property
+    def filtrada(self):
+        return bool(self.sensores or self.ambientes or self.ars)
+
+    def aceita(self, tipo, dados):
+        if tipo == 'leitura':
+            if self.sensores_permitidos is not None and dados['sensor'] not in self.sensores_permitidos:
+                return False
+            return not self.filtrada or dados['sensor'] in self.sensores or dados['ambiente'] in self.ambientes
+        if self.ars_permitidos is not None and dados['pk'] not in self.ars_permitidos:
+            return False
+        return not self.filtrada or dados['pk'] in self.ars or dados['ambiente'] in self.ambientes
+
+    def entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Um navegador lento perde eventos em vez de acumular memória sem limite
+            self.descartados += 1
+
+
+class Distribuidor:
+    """Consulta o banco uma vez por ciclo e repassa os eventos aos assinantes"""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._assinantes = set()
+        self._tarefa = None
+        self._ultimo_id = None
+        self._estado_ars = None
+
+    @property
+    def total_assinantes(self):
+        return len(self._assinantes)
+
+    def assinar(self, assinatura):
+        self._assinantes.add(assinatura)
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.get_running_loop().create_task(self._executar())
+        return assinatura
+
+    def cancelar(self, assinatura):
+        self._assinantes.discard(assinatura)
+
+    async def _executar(self):
+        try:
+            while self._assinantes:
+                try:
+                    eventos = await sync_to_async(self._consultar, thread_sensitive=True)()
+                except Exception:
+                    # Uma falha no banco não derruba os navegadores; o próximo ciclo tenta de novo
+                    logger.exception('Falha ao consultar os eventos do fluxo ao vivo')
+                    eventos = []
+                for tipo, dados in eventos:
+                    for assinatura in list(self._assinantes):
+                        if assinatura.aceita(tipo, dados):
+                            assinatura.entregar((tipo, dados))
+                await asyncio.sleep(self.intervalo)
+        finally:
+            # Sem assinantes o estado é descartado; a próxima conexão recomeça do ponto atual
+            self._ultimo_id = None
+            self._estado_ars = None
+
+    def _consultar(self):
+        close_old_connections()
+        eventos = []
+
+        if self._ultimo_id is None:
+            self._ultimo_id = LeituraSensor.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        novas = LeituraSensor.objects.filter(pk__gt=self._ultimo_id).order_by('pk').values_list(
+            'pk', 'sensor_id', 'sensor__ambiente_id', 'valor', 'timestamp'
+        )[:LIMITE_POR_CONSULTA]
+        for pk, sensor_id, ambiente_id, valor, timestamp in novas:
+            self._ultimo_id = pk
+            eventos.append(('leitura', {
+                'id': pk, 'sensor': sensor_id, 'ambiente': ambiente_id, 'valor': valor, 'timestamp': timestamp,
+            }))
+
+        estado = {linha['pk']: linha for linha in ArCondicionado.objects.values(*CAMPOS_ESTADO)}
+        if self._estado_ars is not None:
+            for pk, linha in estado.items():
+                if self._estado_ars.get(pk) != linha:
+                    dados = dict(linha)
+                    dados['ambiente'] = dados.pop('ambiente_id')
+                    eventos.append(('ar', dados))
+        self._estado_ars = estado
+        return eventos
+
+
+_distribuidor = None
+
+
+def distribuidor():
+    """Retorna o distribuidor de eventos do processo, criando-o no primeiro uso"""
+    global _distribuidor
+    if _distribuidor is None:
+        _distribuidor = Distribuidor(getattr(settings, 'IOT_EVENTOS_INTERVALO', 1))
+    return _distribuidor
+
+
+def fluxo_disponivel(request):
+    """Indica se a requisição chegou por ASGI, o único modo em que o fluxo de eventos pode ser servido"""
+    return isinstance(request, ASGIRequest)
+
+
+def formatar_evento(tipo, dados):
+    """Formata um evento no protocolo text/event-stream"""
+    return f'event: {tipo}\ndata: {json.dumps(dados, cls=DjangoJSONEncoder)}\n\n'
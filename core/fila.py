@@ -0,0 +1,138 @@
+"""Fila de escritor único para a ingestão de leituras.
+
+No SQLite só uma conexão escreve por vez; com várias requisições gravando
+ao mesmo tempo, cada uma disputa o lock e as que esperam demais falham com
+"database is locked". Com ``IOT_INGESTAO_FILA`` ativo, as requisições
+entregam as leituras já validadas a esta fila e aguardam: uma única thread
+grava tudo o que estiver pendente em uma só transação, de modo que sob
+carga muitos lotes pequenos viram poucas transações grandes.
+
+``gravar`` levanta ``TimeoutError`` se a thread não gravar o lote em
+``timeout`` segundos (o lote continua na fila e ainda pode ser gravado) e
+``FalhaGravacao`` se a transação do lote falhou.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+
+from .ingestao import gravar_leituras
+
+
+logger = logging.getLogger(__name__)
+
+
+class FalhaGravacao(Exception):
+    """A thread de escrita não conseguiu gravar o lote; a causa fica em ``__cause__``"""
+
+
+class _Pedido:
+    __slots__ = ('leituras', 'dispositivos', 'automacao', 'concluido', 'erro')
+
+    def __init__(self, leituras, dispositivos, automacao):
+        self.leituras = leituras
+        self.dispositivos = dispositivos
+        self.automacao = automacao
+        self.concluido = threading.Event()
+        self.erro = None
+
+
+class FilaEscrita:
+    """Thread única que agrupa os pedidos pendentes em uma transação"""
+
+    def __init__(self, max_leituras=10000, timeout=30):
+        self.max_leituras = max_leituras
+        self.timeout = timeout
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.transacoes = 0
+        self.leituras_gravadas = 0
+        self.ultima_duracao = 0.0
+
+    @property
+    def profundidade(self):
+        """Quantidade de pedidos aguardando a thread de escrita"""
+        return self._fila.qsize()
+
+    def gravar(self, leituras, dispositivos, automacao=False):
+        """Entrega as leituras à thread de escrita e aguarda a gravação"""
+        pedido = _Pedido(leituras, dispositivos, automacao)
+        self._iniciar()
+        self._fila.put(pedido)
+        if not pedido.concluido.wait(self.timeout):
+            raise TimeoutError('A fila de escrita não gravou o lote a tempo.')
+        if pedido.erro is not None:
+            raise FalhaGravacao('A fila de escrita não conseguiu gravar o lote.') from pedido.erro
+
+    def _iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name='iot-fila-escrita', daemon=True)
+                self._thread.start()
+
+    def _executar(self):
+        while True:
+            pedidos = [self._fila.get()]
+            total = len(pedidos[0].leituras)
+            while total < self.max_leituras:
+                try:
+                    pedido = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                pedidos.append(pedido)
+                total += len(pedido.leituras)
+            self._processar(pedidos)
+
+    def _processar(self, pedidos):
+        close_old_connections()
+        inicio = time.monotonic()
+        # Pedidos que avaliam automações e os que não avaliam vão em transações separadas
+        grupos = {}
+        for pedido in pedidos:
+            grupos.setdefault(pedido.automacao, []).append(pedido)
+        try:
+            for automacao, grupo in grupos.items():
+                self._gravar_grupo(grupo, automacao)
+        finally:
+            self.ultima_duracao = time.monotonic() - inicio
+            for pedido in pedidos:
+                pedido.concluido.set()
+
+    def _gravar_grupo(self, pedidos, automacao):
+        try:
+            leituras = [leitura for pedido in pedidos for leitura in pedido.leituras]
+            dispositivos = set().union(*(pedido.dispositivos for pedido in pedidos))
+            gravar_leituras(leituras, dispositivos, automacao)
+            self.transacoes += 1
+            self.leituras_gravadas += len(leituras)
+        except Exception:
+            # Isola o pedido com problema: cada um é regravado na sua própria transação
+            for pedido in pedidos:
+                for leitura in pedido.leituras:
+                    leitura.pk = None
+                try:
+                    gravar_leituras(pedido.leituras, pedido.dispositivos, automacao)
+                    self.transacoes += 1
+                    self.leituras_gravadas += len(pedido.leituras)
+                except Exception as erro:
+                    logger.exception('Falha ao gravar um lote de %d leituras pela fila de escrita', len(pedido.leituras))
+                    pedido.erro = erro
+
+
+_fila = None
+_fila_lock = threading.Lock()
+
+
+def fila_de_escrita():
+    """Retorna a fila de escrita do processo, criando-a no primeiro uso"""
+    global _fila
+    if _fila is None:
+        with _fila_lock:
+            if _fila is None:
+                _fila = FilaEscrita()
+    return _fila
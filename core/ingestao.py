@@ -0,0 +1,393 @@
+"""Ingestão em lote de leituras de sensores enviadas pelos dispositivos.
+
+Um lote chega como JSON (lista de objetos, ou objeto com a chave
+``leituras``) ou como NDJSON (um objeto por linha). Cada item identifica o
+sensor pelo MAC do dispositivo e pelo nome do tipo de sensor::
+
+    {"mac": "24:6F:28:AB:12:34", "tipo": "Temperatura", "valor": 23.5}
+
+Todos os sensores do lote são resolvidos com uma única consulta e as
+leituras válidas são gravadas com um ``bulk_create`` dentro de uma
+transação.
+
+Pela API HTTP o dispositivo se identifica com o token de acesso gerado no
+admin (``Authorization: Bearer <token>``) e só envia leituras dos próprios
+sensores; um gateway também envia as dos dispositivos do mesmo dono, como
+no listener (``core.escuta``).
+
+O campo opcional ``timestamp`` (ISO 8601 ou segundos desde a época) guarda o
+momento medido pelo dispositivo; sem ele vale o horário de chegada. Cada
+leitura é única por ``(sensor, timestamp)``: um lote reenviado pelo
+dispositivo custa uma consulta que encontra as leituras já gravadas, que
+são ignoradas sem alterar contagens, agregados, alertas e automações. Com
+``IOT_INGESTAO_REPETIDAS = 'atualizar'`` valor e observação são
+sobrescritos e o valor atual e os agregados dos períodos afetados são
+refeitos; contagens, alertas e automações continuam sem mudança.
+"""
+import json
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from ar_condicionado.automacao import motor_automacao
+from sistema_iot.metricas import registro
+
+from .agregados import atualizar_agregados, recalcular_agregados
+from .alertas import avaliar_alertas
+from .estatisticas import invalidar_estatisticas
+from .models import Dispositivo, LeituraSensor, Sensor, UltimaLeitura, hash_token, normalizar_mac
+from .recentes import cache_recentes
+
+
+TAMANHO_MAXIMO_LOTE = 10000
+BATCH_SIZE = 500
+# Quantas vezes o INSERT é refeito quando outro processo grava as mesmas leituras antes dele
+TENTATIVAS_CONFLITO = 3
+# Desvio de relógio aceito: timestamps à frente do servidor e, nos frames binários
+# sem relógio, quanto antes da chegada do frame a leitura pode ter sido feita
+TOLERANCIA_FUTURO = timedelta(minutes=5)
+
+
+class LoteInvalido(Exception):
+    """O corpo da requisição não pôde ser interpretado como um lote"""
+
+
+class Remetente:
+    """Dispositivo autenticado pelo token de uma requisição"""
+
+    def __init__(self, mac, usuario_id, tipo):
+        self.mac = mac
+        self.usuario_id = usuario_id
+        self.tipo = tipo
+
+    def pode_enviar_por(self, mac, usuario_id):
+        """O dispositivo envia as próprias leituras; um gateway também as de dispositivos do mesmo dono"""
+        return mac == self.mac or (self.tipo == 'gateway' and usuario_id == self.usuario_id)
+
+
+def autenticar_dispositivo(autorizacao):
+    """Retorna o Remetente do cabeçalho ``Authorization: Bearer <token>``, ou None se ausente ou inválido"""
+    esquema, _, token = (autorizacao or '').partition(' ')
+    token = token.strip()
+    if esquema.lower() != 'bearer' or not token:
+        return None
+    linha = Dispositivo.objects.exclude(status='inativo').filter(token_hash=hash_token(token)).values_list(
+        'mac_address', 'usuario_id', 'tipo'
+    ).first()
+    if linha is None:
+        return None
+    mac, usuario_id, tipo = linha
+    return Remetente(normalizar_mac(mac), usuario_id, tipo)
+
+
+def parse_lote(corpo, content_type=''):
+    """Converte o corpo da requisição (JSON ou NDJSON) em uma lista de itens"""
+    if isinstance(corpo, bytes):
+        try:
+            corpo = corpo.decode('utf-8')
+        except UnicodeDecodeError:
+            raise LoteInvalido('Corpo da requisição não está em UTF-8.')
+
+    if 'ndjson' in content_type or 'x-ndjson' in content_type:
+        itens = []
+        for numero, linha in enumerate(corpo.splitlines(), start=1):
+            if not linha.strip():
+                continue
+            try:
+                itens.append(json.loads(linha))
+            except ValueError:
+                raise LoteInvalido(f'Linha {numero} não é um JSON válido.')
+    else:
+        try:
+            dados = json.loads(corpo)
+        except ValueError:
+            raise LoteInvalido('Corpo da requisição não é um JSON válido.')
+        if isinstance(dados, dict):
+            dados = dados.get('leituras')
+        if not isinstance(dados, list):
+            raise LoteInvalido('Esperada uma lista de leituras.')
+        itens = dados
+
+    if len(itens) > TAMANHO_MAXIMO_LOTE:
+        raise LoteInvalido(f'Lote excede o limite de {TAMANHO_MAXIMO_LOTE} leituras.')
+    return itens
+
+
+def resolver_sensores(chaves):
+    """Mapeia pares (mac, tipo) para (id do sensor, id do dispositivo, ativo, dono) em uma consulta"""
+    if not chaves:
+        return {}
+    macs = {mac for mac, _ in chaves}
+    tipos = {tipo for _, tipo in chaves}
+    linhas = Sensor.objects.filter(
+        dispositivo__mac_address__in=macs,
+        tipo__nome__in=tipos,
+    ).values_list('id', 'dispositivo_id', 'dispositivo__mac_address', 'tipo__nome', 'ativo', 'dispositivo__usuario_id')
+    return {
+        (normalizar_mac(mac), tipo): (sensor_id, dispositivo_id, ativo, usuario_id)
+        for sensor_id, dispositivo_id, mac, tipo, ativo, usuario_id in linhas
+    }
+
+
+def _validar_timestamp(bruto):
+    """Converte o timestamp do dispositivo (ISO 8601 ou segundos desde a época) em datetime com fuso"""
+    if isinstance(bruto, bool):
+        raise ValueError('Campo "timestamp" inválido.')
+    if isinstance(bruto, (int, float)):
+        if not math.isfinite(bruto):
+            raise ValueError('Campo "timestamp" inválido.')
+        try:
+            momento = datetime.fromtimestamp(bruto, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError('Campo "timestamp" inválido.')
+    elif isinstance(bruto, str):
+        try:
+            momento = parse_datetime(bruto)
+        except ValueError:
+            momento = None
+        if momento is None:
+            raise ValueError('Campo "timestamp" deve ser ISO 8601 ou segundos desde a época.')
+        if timezone.is_naive(momento):
+            momento = momento.replace(tzinfo=dt_timezone.utc)
+    else:
+        raise ValueError('Campo "timestamp" deve ser ISO 8601 ou segundos desde a época.')
+    if momento > timezone.now() + TOLERANCIA_FUTURO:
+        raise ValueError('Campo "timestamp" está no futuro.')
+    return momento
+
+
+def _validar_item(item):
+    """Retorna ((mac, tipo), valor, observacao, timestamp ou None) ou levanta ValueError com o motivo"""
+    if not isinstance(item, dict):
+        raise ValueError('Item não é um objeto.')
+    mac = item.get('mac')
+    tipo = item.get('tipo')
+    if not mac or not tipo:
+        raise ValueError('Campos "mac" e "tipo" são obrigatórios.')
+    valor = item.get('valor')
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        raise ValueError('Campo "valor" deve ser numérico.')
+    valor = float(valor)
+    if not math.isfinite(valor):
+        raise ValueError('Campo "valor" deve ser finito.')
+    observacao = item.get('observacao')
+    if observacao is not None:
+        observacao = str(observacao)[:200]
+    momento = item.get('timestamp')
+    if momento is not None:
+        momento = _validar_timestamp(momento)
+    return (normalizar_mac(mac), str(tipo)), valor, observacao, momento
+
+
+def atualizar_ultimas_leituras(leituras):
+    """Atualiza UltimaLeitura com a leitura mais recente e o total de leituras de cada sensor.
+
+    Recebe tuplas (sensor_id, valor, timestamp). Leituras mais antigas que o
+    valor já armazenado são ignoradas, de modo que lotes fora de ordem não
+    fazem o valor atual retroceder.
+    """
+    mais_recentes = {}
+    contagens = {}
+    for sensor_id, valor, momento in leituras:
+        contagens[sensor_id] = contagens.get(sensor_id, 0) + 1
+        atual = mais_recentes.get(sensor_id)
+        if atual is None or momento >= atual[1]:
+            mais_recentes[sensor_id] = (valor, momento)
+    if not mais_recentes:
+        return
+
+    existentes = UltimaLeitura.objects.in_bulk(list(mais_recentes))
+    atualizadas = []
+    for sensor_id, (valor, momento) in mais_recentes.items():
+        ultima = existentes.get(sensor_id)
+        if ultima is None:
+            ultima = UltimaLeitura(sensor_id=sensor_id, valor=valor, timestamp=momento)
+        elif momento >= ultima.timestamp:
+            ultima.valor = valor
+            ultima.timestamp = momento
+        ultima.total_leituras += contagens[sensor_id]
+        atualizadas.append(ultima)
+
+    UltimaLeitura.objects.bulk_create(
+        atualizadas,
+        update_conflicts=True,
+        unique_fields=['sensor'],
+        update_fields=['valor', 'timestamp', 'total_leituras'],
+    )
+
+
+def apos_gravar_leituras(leituras, automacao=False):
+    """Atualiza as estruturas derivadas (valor atual, agregados, alertas, cache de recentes).
+
+    Com ``automacao`` (leituras de origem autenticada) também avalia as regras de automação.
+    """
+    linhas = [(leitura.sensor_id, leitura.valor, leitura.timestamp) for leitura in leituras]
+    atualizar_ultimas_leituras(linhas)
+    atualizar_agregados(linhas)
+    # Os alertas abertos fazem parte das estatísticas em cache do dashboard
+    for usuario_id in avaliar_alertas(linhas):
+        transaction.on_commit(partial(invalidar_estatisticas, usuario_id))
+    transaction.on_commit(partial(cache_recentes.registrar, leituras))
+    if not automacao:
+        return
+    # Depois do commit: o estado das regras só avança com leituras gravadas; uma falha
+    # ao comandar os aparelhos é registrada no log sem afetar a ingestão
+    transaction.on_commit(partial(motor_automacao.avaliar, linhas), robust=True)
+
+
+def separar_repetidas(leituras):
+    """Separa o lote em (novas, repetidas) por (sensor, timestamp).
+
+    Repetidas são as já gravadas e as que aparecem mais de uma vez no lote
+    (vale a primeira). As gravadas são encontradas com uma consulta no índice
+    único, limitada ao intervalo de timestamps do lote.
+    """
+    unicas = {}
+    repetidas = []
+    for leitura in leituras:
+        chave = (leitura.sensor_id, leitura.timestamp)
+        if chave in unicas:
+            repetidas.append(leitura)
+        else:
+            unicas[chave] = leitura
+    if not unicas:
+        return [], repetidas
+    momentos = [momento for _, momento in unicas]
+    gravadas = set(
+        LeituraSensor.objects.filter(
+            sensor_id__in={sensor_id for sensor_id, _ in unicas},
+            timestamp__gte=min(momentos),
+            timestamp__lte=max(momentos),
+        ).values_list('sensor_id', 'timestamp')
+    )
+    novas = []
+    for chave, leitura in unicas.items():
+        (repetidas if chave in gravadas else novas).append(leitura)
+    return novas, repetidas
+
+
+def atualizar_repetidas(leituras):
+    """Sobrescreve valor e observação de leituras já gravadas e refaz o que deriva delas.
+
+    Se a mesma leitura aparece mais de uma vez, vale a última. O valor atual
+    do sensor muda quando a leitura sobrescrita é a mais recente dele, os
+    agregados dos períodos afetados são recalculados e os sensores saem do
+    cache de recentes; o total de leituras não muda.
+    """
+    por_chave = {(leitura.sensor_id, leitura.timestamp): leitura for leitura in leituras}
+    LeituraSensor.objects.bulk_create(
+        list(por_chave.values()),
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['sensor', 'timestamp'],
+        update_fields=['valor', 'observacao'],
+    )
+
+    sensores = {sensor_id for sensor_id, _ in por_chave}
+    alteradas = []
+    for ultima in UltimaLeitura.objects.filter(sensor_id__in=sensores):
+        leitura = por_chave.get((ultima.sensor_id, ultima.timestamp))
+        if leitura is not None and leitura.valor != ultima.valor:
+            ultima.valor = leitura.valor
+            alteradas.append(ultima)
+    if alteradas:
+        UltimaLeitura.objects.bulk_update(alteradas, ['valor'])
+    recalcular_agregados(por_chave)
+    transaction.on_commit(lambda: [cache_recentes.descartar(sensor_id) for sensor_id in sensores])
+
+
+def gravar_leituras(leituras, dispositivos, automacao=False):
+    """Grava as leituras novas, as estruturas derivadas e o último contato dos dispositivos em uma transação.
+
+    Retorna quantas leituras eram novas; só elas passam pelas estruturas
+    derivadas (as repetidas, quando atualizadas, por ``atualizar_repetidas``).
+    """
+    with transaction.atomic():
+        novas, repetidas = separar_repetidas(leituras)
+        tentativas = TENTATIVAS_CONFLITO
+        while novas:
+            try:
+                with transaction.atomic():
+                    LeituraSensor.objects.bulk_create(novas, batch_size=BATCH_SIZE)
+                break
+            except IntegrityError:
+                tentativas -= 1
+                if not tentativas:
+                    raise
+                # Outro processo gravou parte das leituras entre a consulta e o INSERT:
+                # separa de novo para que só as gravadas aqui sigam como novas
+                for leitura in novas:
+                    leitura.pk = None
+                novas, gravadas = separar_repetidas(novas)
+                repetidas += gravadas
+        if novas:
+            apos_gravar_leituras(novas, automacao)
+        if repetidas and getattr(settings, 'IOT_INGESTAO_REPETIDAS', 'ignorar') == 'atualizar':
+            atualizar_repetidas(repetidas)
+        Dispositivo.objects.filter(pk__in=dispositivos).update(ultimo_contato=timezone.now())
+    return len(novas)
+
+
+def persistir_leituras(leituras, dispositivos, automacao=False):
+    """Grava pela fila de escrita quando ativa (IOT_INGESTAO_FILA), senão direto nesta thread"""
+    if getattr(settings, 'IOT_INGESTAO_FILA', False):
+        from .fila import fila_de_escrita
+        fila_de_escrita().gravar(leituras, dispositivos, automacao)
+    else:
+        gravar_leituras(leituras, dispositivos, automacao)
+
+
+def ingerir_lote(itens, remetente=None, autenticado=None):
+    """Valida e grava um lote de leituras.
+
+    Retorna um dicionário com os totais e o resultado de cada item, na
+    mesma ordem do lote recebido. Leituras já gravadas contam como aceitas,
+    então reenviar um lote é seguro. Com ``remetente`` (API HTTP), itens de
+    dispositivos que ele não pode enviar são rejeitados; sem ele o chamador
+    já verificou a origem (listener, comandos). Só lotes ``autenticado``
+    (padrão: quando há remetente) avaliam as regras de automação.
+    """
+    resultados = [None] * len(itens)
+    validos = []
+    for indice, item in enumerate(itens):
+        try:
+            validos.append((indice,) + _validar_item(item))
+        except ValueError as erro:
+            resultados[indice] = {'linha': indice, 'status': 'rejeitada', 'erro': str(erro)}
+
+    sensores = resolver_sensores({chave for _, chave, _, _, _ in validos})
+
+    leituras = []
+    dispositivos = set()
+    for indice, chave, valor, observacao, momento in validos:
+        encontrado = sensores.get(chave)
+        if encontrado is None:
+            resultados[indice] = {'linha': indice, 'status': 'rejeitada', 'erro': 'Sensor não encontrado.'}
+            continue
+        sensor_id, dispositivo_id, ativo, usuario_id = encontrado
+        if remetente is not None and not remetente.pode_enviar_por(chave[0], usuario_id):
+            resultados[indice] = {'linha': indice, 'status': 'rejeitada', 'erro': 'Dispositivo não autorizado para este token.'}
+            continue
+        if not ativo:
+            resultados[indice] = {'linha': indice, 'status': 'rejeitada', 'erro': 'Sensor inativo.'}
+            continue
+        leitura = LeituraSensor(sensor_id=sensor_id, valor=valor, observacao=observacao)
+        if momento is not None:
+            leitura.timestamp = momento
+        leituras.append(leitura)
+        dispositivos.add(dispositivo_id)
+        resultados[indice] = {'linha': indice, 'status': 'aceita'}
+
+    if leituras:
+        persistir_leituras(leituras, dispositivos, remetente is not None if autenticado is None else autenticado)
+    registro.registrar_ingestao(len(itens), len(leituras))
+
+    return {
+        'aceitas': len(leituras),
+        'rejeitadas': len(itens) - len(leituras),
+        'resultados': resultados,
+    }
@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from core.arquivo import arquivar_mes, inicio_mes, mes_local
+from core.models import LeituraSensor, Sensor, UltimaLeitura
+
+
+class Command(BaseCommand):
+    help = 'Move para o arquivo frio as leituras mais antigas que a retenção de cada sensor'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sensor',
+            type=int,
+            action='append',
+            help='Processa apenas este sensor (pode ser repetido)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Leituras apagadas por transação (default: 5000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas informa quantas leituras seriam arquivadas',
+        )
+
+    def handle(self, *args, **options):
+        padrao = getattr(settings, 'IOT_RETENCAO_DIAS', None)
+        agora = timezone.now()
+
+        sensores = Sensor.objects.values_list('id', 'retencao_dias', 'tipo__retencao_dias').order_by('id')
+        if options['sensor']:
+            sensores = sensores.filter(id__in=options['sensor'])
+
+        total = 0
+        for sensor_id, retencao_sensor, retencao_tipo in sensores:
+            retencao = retencao_sensor or retencao_tipo or padrao
+            if not retencao:
+                continue
+            limite = agora - timedelta(days=retencao)
+            antigas = LeituraSensor.objects.filter(sensor_id=sensor_id, timestamp__lt=limite)
+
+            if options['dry_run']:
+                quantidade = antigas.count()
+                if quantidade:
+                    self.stdout.write(f'- Sensor {sensor_id}: {quantidade} leituras anteriores a {limite:%Y-%m-%d}')
+                total += quantidade
+                continue
+
+            total += self.arquivar_sensor(sensor_id, antigas, options['lote'])
+
+        acao = 'seriam arquivadas' if options['dry_run'] else 'arquivadas'
+        self.stdout.write(self.style.SUCCESS(f'Leituras {acao}: {total}'))
+
+    def arquivar_sensor(self, sensor_id, antigas, tamanho):
+        """Arquiva as leituras mês a mês e só então as apaga da tabela quente.
+
+        As leituras do mês são lidas em páginas de ``tamanho`` por chave em
+        ``(timestamp, id)``, cada página uma consulta completa; os DELETEs só
+        começam depois da última página, então nenhum cursor fica aberto na
+        tabela enquanto ela é alterada (o SQLite não isola consultas de uma
+        mesma conexão).
+        """
+        antigas = antigas.order_by('timestamp', 'id')
+        arquivadas = 0
+        desde = None
+        while True:
+            restantes = antigas if desde is None else antigas.filter(timestamp__gte=desde)
+            primeira = restantes.values_list('timestamp', flat=True).first()
+            if primeira is None:
+                return arquivadas
+            ano, mes = mes_local(primeira)
+            desde = inicio_mes(ano + mes // 12, mes % 12 + 1)
+            linhas = self.ler_mes(restantes.filter(timestamp__lt=desde), tamanho)
+            arquivadas += self.gravar_mes(sensor_id, (ano, mes), linhas, tamanho)
+
+    def ler_mes(self, leituras, tamanho):
+        linhas = []
+        pagina = leituras
+        while True:
+            parte = list(pagina.values_list('id', 'timestamp', 'valor', 'observacao')[:tamanho])
+            linhas += parte
+            if len(parte) < tamanho:
+                return linhas
+            ultimo_id, momento = parte[-1][:2]
+            pagina = leituras.filter(Q(timestamp__gt=momento) | Q(timestamp=momento, id__gt=ultimo_id))
+
+    def gravar_mes(self, sensor_id, mes, linhas, tamanho):
+        ano, numero_mes = mes
+        arquivar_mes(sensor_id, ano, numero_mes, linhas)
+        ids = [linha[0] for linha in linhas]
+        for i in range(0, len(ids), tamanho):
+            parte = ids[i:i + tamanho]
+            with transaction.atomic():
+                apagadas, _ = LeituraSensor.objects.filter(pk__in=parte).delete()
+                # O contador de UltimaLeitura acompanha o total da tabela quente
+                UltimaLeitura.objects.filter(sensor_id=sensor_id).update(
+                    total_leituras=Greatest(F('total_leituras') - Value(apagadas), Value(0))
+                )
+        self.stdout.write(f'- Sensor {sensor_id} {ano:04d}-{numero_mes:02d}: {len(ids)} leituras arquivadas')
+        return len(ids)
+
@@ -0,0 +1,115 @@
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from core.binario import codificar_frame, decodificar
+from core.ingestao import _validar_item, parse_lote
+
+
+TIPOS = ['Temperatura', 'Umidade', 'Luminosidade', 'Pressão']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara bytes trafegados e velocidade de decodificação dos lotes em JSON, NDJSON e binário compacto. '
+        'Não acessa o banco.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dispositivos',
+            type=int,
+            default=50,
+            help='Dispositivos no lote, um frame binário por dispositivo (default: 50)',
+        )
+        parser.add_argument(
+            '--leituras',
+            type=int,
+            default=40,
+            help='Leituras por dispositivo (default: 40)',
+        )
+        parser.add_argument(
+            '--repeticoes',
+            type=int,
+            default=20,
+            help='Repetições da decodificação; vale a mais rápida (default: 20)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Semente do gerador aleatório (default: 0)',
+        )
+        parser.add_argument(
+            '--json',
+            type=str,
+            help='Grava o resultado em JSON neste arquivo',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        base = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        base_ms = int(base.timestamp() * 1000)
+
+        itens = []
+        frames = []
+        for d in range(options['dispositivos']):
+            mac = ':'.join(f'{byte:02X}' for byte in (0x246F28AB1234 + d).to_bytes(6, 'big'))
+            registros = []
+            for i in range(options['leituras']):
+                slot = i % len(TIPOS)
+                momento = base_ms + i * 15000
+                valor = round(rng.uniform(0, 100), 2)
+                registros.append((slot, momento, valor))
+                itens.append({
+                    'mac': mac,
+                    'tipo': TIPOS[slot],
+                    'valor': valor,
+                    'timestamp': (base + timedelta(milliseconds=momento - base_ms)).isoformat(),
+                })
+            frames.append(codificar_frame(mac, registros, base_ms))
+
+        corpos = {
+            'json': (json.dumps(itens).encode('utf-8'), 'application/json'),
+            'ndjson': ('\n'.join(json.dumps(item) for item in itens).encode('utf-8'), 'application/x-ndjson'),
+            'binario': (b''.join(frames), None),
+        }
+        total = len(itens)
+
+        def decodificar_texto(corpo, content_type):
+            return [_validar_item(item) for item in parse_lote(corpo, content_type)]
+
+        resultado = {'leituras': total, 'dispositivos': options['dispositivos'], 'formatos': {}}
+        for nome, (corpo, content_type) in corpos.items():
+            melhor = None
+            for _ in range(options['repeticoes']):
+                inicio = time.perf_counter()
+                if content_type is None:
+                    decodificar(corpo)
+                else:
+                    decodificar_texto(corpo, content_type)
+                duracao = time.perf_counter() - inicio
+                melhor = duracao if melhor is None else min(melhor, duracao)
+            resultado['formatos'][nome] = {
+                'bytes': len(corpo),
+                'bytes_por_leitura': round(len(corpo) / total, 1),
+                'bytes_gzip': len(gzip.compress(corpo)),
+                'decodificacao_ms': round(melhor * 1000, 3),
+                'leituras_por_segundo': round(total / melhor) if melhor else None,
+            }
+
+        referencia = resultado['formatos']['json']
+        for nome, dados in resultado['formatos'].items():
+            self.stdout.write(
+                f'- {nome}: {dados["bytes"]} bytes ({dados["bytes_por_leitura"]}/leitura, '
+                f'{dados["bytes_gzip"]} com gzip), decodificação {dados["decodificacao_ms"]} ms '
+                f'({dados["leituras_por_segundo"]} leituras/s, '
+                f'{referencia["decodificacao_ms"] / dados["decodificacao_ms"]:.1f}x o JSON)'
+            )
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS('Benchmark concluído.'))
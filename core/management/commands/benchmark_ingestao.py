@@ -0,0 +1,115 @@
+import json
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.ingestao import ingerir_lote
+from core.models import Sensor
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede leituras/s sustentadas com N escritores concorrentes usando a ingestão em lote. '
+        'Grava leituras de verdade: use um banco descartável populado com popular_dados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--escritores',
+            type=int,
+            default=8,
+            help='Threads gravando ao mesmo tempo (default: 8)',
+        )
+        parser.add_argument(
+            '--lotes',
+            type=int,
+            default=50,
+            help='Lotes enviados por escritor (default: 50)',
+        )
+        parser.add_argument(
+            '--tamanho',
+            type=int,
+            default=100,
+            help='Leituras por lote (default: 100)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Semente do gerador aleatório (default: 0)',
+        )
+        parser.add_argument(
+            '--json',
+            type=str,
+            help='Grava o resultado em JSON neste arquivo',
+        )
+
+    def handle(self, *args, **options):
+        chaves = list(
+            Sensor.objects.filter(ativo=True).values_list('dispositivo__mac_address', 'tipo__nome')[:500]
+        )
+        if not chaves:
+            raise CommandError('Nenhum sensor ativo encontrado. Rode popular_dados primeiro.')
+
+        escritores = options['escritores']
+        latencias = []
+        erros = []
+        aceitas = [0]
+        lock = threading.Lock()
+
+        def escritor(indice):
+            rng = random.Random(options['seed'] + indice)
+            try:
+                for _ in range(options['lotes']):
+                    itens = [
+                        {'mac': mac, 'tipo': tipo, 'valor': round(rng.uniform(0, 100), 2)}
+                        for mac, tipo in (rng.choice(chaves) for _ in range(options['tamanho']))
+                    ]
+                    inicio = time.perf_counter()
+                    try:
+                        resultado = ingerir_lote(itens)
+                    except Exception as erro:
+                        with lock:
+                            erros.append(f'{type(erro).__name__}: {erro}')
+                        continue
+                    duracao = time.perf_counter() - inicio
+                    with lock:
+                        latencias.append(duracao)
+                        aceitas[0] += resultado['aceitas']
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=escritor, args=(i,)) for i in range(escritores)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        decorrido = time.perf_counter() - inicio
+
+        latencias.sort()
+        resultado = {
+            'modo': 'producao' if getattr(settings, 'IOT_DB_PRODUCAO', False) else 'padrao',
+            'fila': getattr(settings, 'IOT_INGESTAO_FILA', False),
+            'escritores': escritores,
+            'lotes_por_escritor': options['lotes'],
+            'leituras_por_lote': options['tamanho'],
+            'leituras_gravadas': aceitas[0],
+            'lotes_com_erro': len(erros),
+            'segundos': round(decorrido, 3),
+            'leituras_por_segundo': round(aceitas[0] / decorrido, 1) if decorrido else 0,
+            'latencia_p50_ms': round(statistics.median(latencias) * 1000, 2) if latencias else None,
+            'latencia_p95_ms': round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))] * 1000, 2) if latencias else None,
+            'exemplos_de_erro': sorted(set(erros))[:3],
+        }
+
+        for chave, valor in resultado.items():
+            self.stdout.write(f'- {chave}: {valor}')
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS('Benchmark concluído.'))
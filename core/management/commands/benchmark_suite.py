@@ -0,0 +1,247 @@
+import json
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from ar_condicionado.models import ArCondicionado
+from core.ingestao import ingerir_lote
+from core.models import Ambiente, Dispositivo, LeituraSensor, Sensor
+
+
+# Tamanhos de dados gerados com popular_dados (--gerar); intervalo em minutos
+PRESETS = {
+    'pequeno': {'usuarios': 1, 'ambientes': 5, 'dispositivos': 2, 'sensores': 2, 'dias': 2, 'intervalo': 10},  # ~6 mil leituras
+    'medio': {'usuarios': 3, 'ambientes': 10, 'dispositivos': 3, 'sensores': 3, 'dias': 7, 'intervalo': 10},  # ~270 mil
+    'grande': {'usuarios': 5, 'ambientes': 20, 'dispositivos': 5, 'sensores': 4, 'dias': 30, 'intervalo': 15},  # ~5,8 milhões
+}
+
+# Máximo de consultas SQL por requisição; a suíte falha se alguma view passar do limite.
+# None apenas registra a contagem.
+LIMITES_CONSULTAS = {
+    'dashboard': 6,
+    'dashboard_sem_cache': 12,
+    'ambiente_detail': 5,
+    'dispositivo_detail': 4,
+    'painel': 4,
+    'admin_sensor': 12,
+    'admin_leiturasensor': 8,
+    'admin_ambiente': 10,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede ingestão e latência/consultas das views principais e grava o resultado em JSON. '
+        'Grava leituras de verdade: use um banco descartável.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--gerar',
+            choices=list(PRESETS),
+            help='Popula o banco com popular_dados neste tamanho antes de medir',
+        )
+        parser.add_argument(
+            '--repeticoes',
+            type=int,
+            default=20,
+            help='Requisições medidas por view (default: 20)',
+        )
+        parser.add_argument(
+            '--lotes',
+            type=int,
+            default=50,
+            help='Lotes de ingestão medidos (default: 50)',
+        )
+        parser.add_argument(
+            '--tamanho',
+            type=int,
+            default=200,
+            help='Leituras por lote de ingestão (default: 200)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Semente do gerador aleatório (default: 0)',
+        )
+        parser.add_argument(
+            '--json',
+            type=str,
+            help='Grava o resultado em JSON neste arquivo',
+        )
+        parser.add_argument(
+            '--comparar',
+            type=str,
+            help='JSON de uma execução anterior para comparar',
+        )
+
+    def handle(self, *args, **options):
+        if options['gerar']:
+            if not User.objects.filter(username='admin').exists():
+                User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+            call_command('popular_dados', seed=options['seed'], stdout=self.stdout, **PRESETS[options['gerar']])
+
+        usuario = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if usuario is None or not Sensor.objects.exists():
+            raise CommandError('Banco sem superusuário ou sem sensores. Use --gerar ou rode popular_dados.')
+
+        resultado = {
+            'executado_em': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'banco': connection.vendor,
+            'dados': {
+                'ambientes': Ambiente.objects.count(),
+                'dispositivos': Dispositivo.objects.count(),
+                'sensores': Sensor.objects.count(),
+                'leituras': LeituraSensor.objects.count(),
+            },
+            'ingestao': self.medir_ingestao(options),
+            'views': {},
+            'falhas': [],
+        }
+
+        with override_settings(ALLOWED_HOSTS=['testserver', 'localhost']):
+            cliente = Client()
+            cliente.force_login(usuario)
+            for nome, url, limpar_cache in self.views():
+                medida = self.medir_view(cliente, url, options['repeticoes'], limpar_cache)
+                limite = LIMITES_CONSULTAS.get(nome)
+                medida['limite_consultas'] = limite
+                if medida['status'] != 200:
+                    resultado['falhas'].append(f'{nome}: status {medida["status"]}')
+                elif limite is not None and medida['consultas'] > limite:
+                    resultado['falhas'].append(f'{nome}: {medida["consultas"]} consultas (limite {limite})')
+                resultado['views'][nome] = medida
+
+        anterior = self.ler_anterior(options['comparar'])
+        self.exibir(resultado, anterior)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+        if resultado['falhas']:
+            raise CommandError('Limites excedidos: ' + '; '.join(resultado['falhas']))
+        self.stdout.write(self.style.SUCCESS('Benchmark concluído.'))
+
+    def views(self):
+        """Retorna (nome, url, limpar cache) de cada view medida, usando os objetos com mais filhos"""
+        ambiente = Ambiente.objects.annotate(n=Count('sensores')).order_by('-n', 'pk').first()
+        dispositivo = Dispositivo.objects.annotate(n=Count('sensores')).order_by('-n', 'pk').first()
+        ar = ArCondicionado.objects.order_by('pk').first() or ArCondicionado.objects.create()
+        return [
+            ('dashboard', reverse('dashboard'), False),
+            ('dashboard_sem_cache', reverse('dashboard'), True),
+            ('ambiente_detail', reverse('ambiente_detail', args=[ambiente.pk]), False),
+            ('dispositivo_detail', reverse('dispositivo_detail', args=[dispositivo.pk]), False),
+            ('painel', reverse('painel_pk', args=[ar.pk]), False),
+            ('admin_sensor', reverse('admin:core_sensor_changelist'), False),
+            ('admin_leiturasensor', reverse('admin:core_leiturasensor_changelist'), False),
+            ('admin_ambiente', reverse('admin:core_ambiente_changelist'), False),
+        ]
+
+    def medir_view(self, cliente, url, repeticoes, limpar_cache):
+        cliente.get(url)  # aquecimento: templates, sessão, cache
+        duracoes = []
+        consultas = 0
+        status = None
+        for _ in range(repeticoes):
+            if limpar_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                resposta = cliente.get(url)
+                duracoes.append(time.perf_counter() - inicio)
+            consultas = max(consultas, len(capturadas))
+            status = resposta.status_code
+        return {
+            'url': url,
+            'status': status,
+            'consultas': consultas,
+            'bytes': len(resposta.content),
+            **self.percentis(duracoes),
+        }
+
+    def medir_ingestao(self, options):
+        chaves = list(
+            Sensor.objects.filter(ativo=True).values_list('dispositivo__mac_address', 'tipo__nome')[:500]
+        )
+        if not chaves:
+            return None
+        rng = random.Random(options['seed'])
+        duracoes = []
+        gravadas = 0
+        for _ in range(options['lotes']):
+            itens = [
+                {'mac': mac, 'tipo': tipo, 'valor': round(rng.uniform(0, 100), 2)}
+                for mac, tipo in (rng.choice(chaves) for _ in range(options['tamanho']))
+            ]
+            inicio = time.perf_counter()
+            gravadas += ingerir_lote(itens)['aceitas']
+            duracoes.append(time.perf_counter() - inicio)
+        total = sum(duracoes)
+        return {
+            'lotes': options['lotes'],
+            'leituras_por_lote': options['tamanho'],
+            'leituras_por_segundo': round(gravadas / total, 1) if total else None,
+            **self.percentis(duracoes),
+        }
+
+    def percentis(self, duracoes):
+        duracoes = sorted(duracoes)
+        return {
+            'min_ms': round(duracoes[0] * 1000, 2),
+            'p50_ms': round(statistics.median(duracoes) * 1000, 2),
+            'p95_ms': round(duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.95))] * 1000, 2),
+            'max_ms': round(duracoes[-1] * 1000, 2),
+        }
+
+    def ler_anterior(self, caminho):
+        if not caminho:
+            return None
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError) as erro:
+            raise CommandError(f'Não foi possível ler {caminho}: {erro}')
+
+    def variacao(self, atual, anterior):
+        if not anterior:
+            return ''
+        return f' ({(atual - anterior) / anterior * 100:+.0f}%)'
+
+    def exibir(self, resultado, anterior):
+        dados = resultado['dados']
+        self.stdout.write(
+            f'Dados: {dados["ambientes"]} ambientes, {dados["dispositivos"]} dispositivos, '
+            f'{dados["sensores"]} sensores, {dados["leituras"]} leituras'
+        )
+        ingestao = resultado['ingestao']
+        if ingestao:
+            antes = ((anterior or {}).get('ingestao') or {}).get('leituras_por_segundo')
+            self.stdout.write(
+                f'- ingestão: {ingestao["leituras_por_segundo"]} leituras/s'
+                f'{self.variacao(ingestao["leituras_por_segundo"], antes)}, p50 {ingestao["p50_ms"]} ms por lote'
+            )
+        for nome, medida in resultado['views'].items():
+            antes = ((anterior or {}).get('views') or {}).get(nome, {})
+            limite = medida['limite_consultas']
+            self.stdout.write(
+                f'- {nome}: p50 {medida["p50_ms"]} ms{self.variacao(medida["p50_ms"], antes.get("p50_ms"))}, '
+                f'p95 {medida["p95_ms"]} ms, {medida["consultas"]} consultas'
+                + (f' (limite {limite})' if limite is not None else '')
+                + (f' [antes: {antes["consultas"]}]' if antes.get('consultas') not in (None, medida['consultas']) else '')
+            )
@@ -0,0 +1,125 @@
+import asyncio
+import contextlib
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core.escuta import Escuta
+
+
+class Command(BaseCommand):
+    help = 'Recebe leituras de gateways por TCP/UDP (uma por linha) e as grava em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            type=str,
+            default='0.0.0.0',
+            help='Endereço de escuta (default: 0.0.0.0)',
+        )
+        parser.add_argument(
+            '--porta',
+            type=int,
+            default=9100,
+            help='Porta TCP (default: 9100)',
+        )
+        parser.add_argument(
+            '--porta-udp',
+            type=int,
+            default=None,
+            help='Porta UDP; sem ela o UDP fica desligado',
+        )
+        parser.add_argument(
+            '--porta-metricas',
+            type=int,
+            default=None,
+            help='Porta HTTP com as métricas no formato do Prometheus',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=2000,
+            help='Leituras acumuladas que disparam uma gravação (default: 2000)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Segundos máximos entre gravações (default: 1)',
+        )
+        parser.add_argument(
+            '--max-pendentes',
+            type=int,
+            default=50000,
+            help='Leituras em memória antes de parar de ler das conexões (default: 50000)',
+        )
+        parser.add_argument(
+            '--log-intervalo',
+            type=float,
+            default=60,
+            help='Segundos entre os resumos de métricas no terminal; 0 desliga (default: 60)',
+        )
+        parser.add_argument(
+            '--permitir-sem-token',
+            action='store_true',
+            help='Aceita só o MAC para dispositivos sem token cadastrado (apenas em redes de teste)',
+        )
+
+    def handle(self, *args, **options):
+        escuta = Escuta(
+            lote=options['lote'],
+            intervalo=options['intervalo'],
+            max_pendentes=options['max_pendentes'],
+            permitir_sem_token=options['permitir_sem_token'],
+        )
+
+        def ao_iniciar(servidores):
+            self.stdout.write(f'Escutando TCP em {options["host"]}:{options["porta"]}.')
+            if options['porta_udp']:
+                self.stdout.write(f'Escutando UDP em {options["host"]}:{options["porta_udp"]}.')
+            if options['porta_metricas']:
+                self.stdout.write(f'Métricas em http://{options["host"]}:{options["porta_metricas"]}/metrics.')
+            self.stdout.write('Ctrl+C ou SIGTERM para sair; as leituras pendentes são gravadas antes.')
+
+        async def principal():
+            tarefas = [asyncio.create_task(escuta.executar(
+                options['host'], options['porta'], options['porta_udp'], options['porta_metricas'], ao_iniciar,
+            ))]
+            if options['log_intervalo']:
+                tarefas.append(asyncio.create_task(self.resumir(escuta, options['log_intervalo'])))
+
+            def encerrar():
+                self.stdout.write('SIGTERM recebido: gravando as leituras pendentes...')
+                tarefas[0].cancel()
+
+            # SIGTERM (systemd, docker stop) encerra como o Ctrl+C: executar() grava o buffer ao ser cancelado
+            with contextlib.suppress(NotImplementedError):
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, encerrar)
+            try:
+                await asyncio.wait([tarefas[0]])
+                if not tarefas[0].cancelled():
+                    tarefas[0].result()
+            finally:
+                for tarefa in tarefas[1:]:
+                    tarefa.cancel()
+
+        try:
+            asyncio.run(principal())
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.resumo(escuta.metricas))
+        self.stdout.write('Listener encerrado.')
+
+    async def resumir(self, escuta, intervalo):
+        while True:
+            await asyncio.sleep(intervalo)
+            self.stdout.write(self.resumo(escuta.metricas))
+
+    def resumo(self, metricas):
+        media = metricas.latencia_soma / metricas.gravacoes if metricas.gravacoes else 0
+        return (
+            f'- conexões: {metricas.conexoes_ativas} ativas | leituras: {metricas.leituras_recebidas} recebidas, '
+            f'{metricas.leituras_gravadas} gravadas, {metricas.leituras_rejeitadas} rejeitadas | '
+            f'fila: {metricas.profundidade} (máx. {metricas.profundidade_maxima}) | '
+            f'gravação: {media * 1000:.1f} ms em média, {metricas.latencia_maxima * 1000:.1f} ms máx.'
+        )
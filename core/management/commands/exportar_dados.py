@@ -0,0 +1,142 @@
+import csv
+import gzip
+import json
+import os
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from ar_condicionado.models import ArCondicionado
+from core.models import Ambiente, Dispositivo, TipoSensor, Sensor, LeituraSensor
+
+
+# (nome do arquivo, model, colunas, exportação incremental por id)
+# Colunas None exportam todos os campos do model
+TABELAS = [
+    ('auth_user', User, ['id', 'username', 'email', 'date_joined'], False),
+    ('core_ambiente', Ambiente, None, False),
+    ('core_dispositivo', Dispositivo, None, False),
+    ('core_tiposensor', TipoSensor, None, False),
+    ('core_sensor', Sensor, None, False),
+    ('core_leiturasensor', LeituraSensor, None, True),
+    ('ar_condicionado', ArCondicionado, None, False),
+]
+
+
+class Command(BaseCommand):
+    help = 'Exporta as tabelas para CSV/NDJSON em streaming, com exportação incremental das leituras'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--saida',
+            type=str,
+            default='export',
+            help='Diretório de saída (default: export)',
+        )
+        parser.add_argument(
+            '--formato',
+            choices=['csv', 'ndjson'],
+            default='csv',
+            help='Formato dos arquivos (default: csv)',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Comprime os arquivos com gzip',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Exporta apenas leituras novas desde a última execução, em um arquivo por execução',
+        )
+        parser.add_argument(
+            '--marcas',
+            type=str,
+            default=None,
+            help='Arquivo com as marcas da exportação incremental (default: <saida>/.marcas_exportacao.json)',
+        )
+        parser.add_argument(
+            '--tabela',
+            action='append',
+            choices=[nome for nome, _, _, _ in TABELAS],
+            help='Exporta apenas esta tabela (pode ser repetido)',
+        )
+        parser.add_argument(
+            '--chunk',
+            type=int,
+            default=2000,
+            help='Linhas lidas do banco por vez (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        saida = Path(options['saida'])
+        saida.mkdir(parents=True, exist_ok=True)
+        caminho_marcas = Path(options['marcas']) if options['marcas'] else saida / '.marcas_exportacao.json'
+        marcas = self.ler_marcas(caminho_marcas)
+
+        self.stdout.write(f'Exportando tabelas para {saida} ({options["formato"]})...')
+        for nome, model, colunas, incremental in TABELAS:
+            if options['tabela'] and nome not in options['tabela']:
+                continue
+            colunas = colunas or [campo.attname for campo in model._meta.concrete_fields]
+            queryset = model.objects.order_by('pk')
+
+            sufixo = ''
+            if incremental and options['incremental']:
+                # O limite superior é fixado no início para a marca refletir exatamente o que foi exportado
+                ultimo_id = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+                desde = marcas.get(nome, 0)
+                if ultimo_id is None or ultimo_id <= desde:
+                    self.stdout.write(f' - {nome}: nenhuma linha nova')
+                    continue
+                queryset = queryset.filter(pk__gt=desde, pk__lte=ultimo_id)
+                sufixo = f'_{desde + 1}-{ultimo_id}'
+
+            arquivo = saida / f'{nome}{sufixo}.{options["formato"]}'
+            if options['gzip']:
+                arquivo = arquivo.with_name(arquivo.name + '.gz')
+
+            linhas = queryset.values_list(*colunas).iterator(chunk_size=options['chunk'])
+            total = self.escrever(arquivo, colunas, linhas, options['formato'], options['gzip'])
+            self.stdout.write(f' - {arquivo.name}: {total} linhas')
+
+            if incremental and options['incremental']:
+                marcas[nome] = ultimo_id
+                self.gravar_marcas(caminho_marcas, marcas)
+
+        self.stdout.write(self.style.SUCCESS('Exportação concluída.'))
+
+    def escrever(self, arquivo, colunas, linhas, formato, comprimir):
+        """Escreve as linhas em um arquivo temporário e o renomeia ao final"""
+        temporario = arquivo.with_name(arquivo.name + '.tmp')
+        abrir = gzip.open if comprimir else open
+        total = 0
+        with abrir(temporario, 'wt', newline='', encoding='utf-8') as destino:
+            if formato == 'csv':
+                writer = csv.writer(destino)
+                writer.writerow(colunas)
+                for linha in linhas:
+                    writer.writerow(linha)
+                    total += 1
+            else:
+                encoder = DjangoJSONEncoder(ensure_ascii=False)
+                for linha in linhas:
+                    destino.write(encoder.encode(dict(zip(colunas, linha))))
+                    destino.write('\n')
+                    total += 1
+        os.replace(temporario, arquivo)
+        return total
+
+    def ler_marcas(self, caminho):
+        if not caminho.exists():
+            return {}
+        try:
+            return json.loads(caminho.read_text(encoding='utf-8'))
+        except ValueError:
+            raise CommandError(f'Arquivo de marcas inválido: {caminho}')
+
+    def gravar_marcas(self, caminho, marcas):
+        temporario = caminho.with_name(caminho.name + '.tmp')
+        temporario.write_text(json.dumps(marcas, indent=2), encoding='utf-8')
+        os.replace(temporario, caminho)
@@ -1,13 +1,86 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.db import connection, transaction
+from core.agregados import atualizar_agregados
+from core.ingestao import atualizar_ultimas_leituras
 from core.models import Ambiente, Dispositivo, TipoSensor, Sensor, LeituraSensor
 from django.utils import timezone
 import random
+import time
 from datetime import timedelta
 
 
+TIPOS_SENSORES = [
+    {'nome': 'Temperatura', 'unidade': '°C', 'descricao': 'Sensor de temperatura ambiente'},
+    {'nome': 'Umidade', 'unidade': '%', 'descricao': 'Sensor de umidade relativa do ar'},
+    {'nome': 'Luminosidade', 'unidade': 'lux', 'descricao': 'Sensor de luminosidade'},
+    {'nome': 'Pressão', 'unidade': 'hPa', 'descricao': 'Sensor de pressão atmosférica'},
+    {'nome': 'Movimento', 'unidade': 'bool', 'descricao': 'Sensor de presença/movimento'},
+    {'nome': 'pH', 'unidade': 'pH', 'descricao': 'Sensor de pH da água'},
+]
+
+# Configurações específicas por tipo (valor_minimo, valor_maximo, precisao)
+CONFIG_SENSORES = {
+    'Temperatura': (-10.0, 50.0, 1),
+    'Umidade': (0.0, 100.0, 1),
+    'Luminosidade': (0.0, 1000.0, 0),
+    'Pressão': (950.0, 1050.0, 1),
+    'Movimento': (None, None, 2),
+    'pH': (0.0, 14.0, 2),
+}
+
+# Ordem em que os tipos são atribuídos aos sensores de cada dispositivo
+# (o primeiro sensor é sempre de temperatura)
+ROTACAO_TIPOS = ['Umidade', 'Movimento', 'pH', 'Luminosidade', 'Pressão']
+
+AMBIENTES = [
+    {'nome': 'Sala de Estar', 'descricao': 'Ambiente principal da casa'},
+    {'nome': 'Cozinha', 'descricao': 'Área de preparo de alimentos'},
+    {'nome': 'Quarto Principal', 'descricao': 'Dormitório principal'},
+    {'nome': 'Jardim', 'descricao': 'Área externa com plantas'},
+    {'nome': 'Escritório', 'descricao': 'Local de trabalho'},
+]
+
+MODELOS_DISPOSITIVO = [
+    {'nome': 'ESP32', 'tipo': 'controlador', 'modelo': 'ESP32-WROOM-32', 'fabricante': 'Espressif'},
+    {'nome': 'Arduino', 'tipo': 'controlador', 'modelo': 'Arduino Uno', 'fabricante': 'Arduino'},
+    {'nome': 'Raspberry Pi', 'tipo': 'gateway', 'modelo': 'Raspberry Pi 4B', 'fabricante': 'Raspberry Pi Foundation'},
+    {'nome': 'NodeMCU', 'tipo': 'controlador', 'modelo': 'NodeMCU v3', 'fabricante': 'NodeMCU'},
+    {'nome': 'ESP8266', 'tipo': 'controlador', 'modelo': 'ESP8266', 'fabricante': 'Espressif'},
+]
+
+# MAC do primeiro dispositivo gerado; os demais são sequenciais
+MAC_BASE = 0x246F28AB1234
+
+
+def formatar_mac(numero):
+    return ':'.join(f'{(numero >> deslocamento) & 0xFF:02X}' for deslocamento in range(40, -8, -8))
+
+
+def gerar_valores(tipo_nome, ambiente_nome, horas, rng):
+    """Gera os valores de um sensor para toda a grade de horários de uma vez"""
+    uniform = rng.uniform
+    n = len(horas)
+    if tipo_nome == 'Temperatura':
+        base_temp = 22 if ambiente_nome != 'Jardim' else 18
+        return [base_temp + uniform(-5, 8) + uniform(-2, 2) for _ in range(n)]
+    if tipo_nome == 'Umidade':
+        return [uniform(40, 80) for _ in range(n)]
+    if tipo_nome == 'Luminosidade':
+        # Simular ciclo dia/noite
+        return [uniform(300, 800) if 6 <= hora <= 18 else uniform(0, 50) for hora in horas]
+    if tipo_nome == 'Pressão':
+        return [uniform(1000, 1030) for _ in range(n)]
+    if tipo_nome == 'Movimento':
+        return [float(rng.getrandbits(1)) for _ in range(n)]
+    if tipo_nome == 'pH':
+        return [uniform(6.5, 8.5) for _ in range(n)]
+    return [uniform(0, 100) for _ in range(n)]
+
+
 class Command(BaseCommand):
-    help = 'Popula o banco de dados com dados de exemplo'
+    help = 'Popula o banco de dados com dados de exemplo (em qualquer escala)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,10 +89,67 @@ class Command(BaseCommand):
             default='admin',
             help='Nome de usuário para associar os dados (default: admin)',
         )
+        parser.add_argument(
+            '--usuarios',
+            type=int,
+            default=1,
+            help='Total de usuários; os extras são criados como <username>_2, <username>_3... (default: 1)',
+        )
+        parser.add_argument(
+            '--ambientes',
+            type=int,
+            default=5,
+            help='Ambientes por usuário (default: 5)',
+        )
+        parser.add_argument(
+            '--dispositivos',
+            type=int,
+            default=1,
+            help='Dispositivos por ambiente (default: 1)',
+        )
+        parser.add_argument(
+            '--sensores',
+            type=int,
+            default=2,
+            help=f'Sensores por dispositivo, até {len(TIPOS_SENSORES)} (default: 2)',
+        )
+        parser.add_argument(
+            '--dias',
+            type=float,
+            default=7,
+            help='Dias de histórico de leituras (default: 7)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=120,
+            help='Intervalo entre leituras de um sensor, em minutos (default: 120)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Semente do gerador aleatório, para gerar sempre os mesmos dados',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Leituras gravadas por bulk_create/transação (default: 5000)',
+        )
+        parser.add_argument(
+            '--sem-agregados',
+            action='store_true',
+            help='Não atualiza os agregados (rode reconstruir_agregados depois)',
+        )
 
     def handle(self, *args, **options):
         username = options['username']
-        
+        if not 1 <= options['sensores'] <= len(TIPOS_SENSORES):
+            raise CommandError(f'--sensores deve estar entre 1 e {len(TIPOS_SENSORES)}.')
+        if options['intervalo'] <= 0 or options['dias'] <= 0:
+            raise CommandError('--intervalo e --dias devem ser positivos.')
+
         try:
             user = User.objects.get(username=username)
         except User.DoesNotExist:
@@ -28,180 +158,192 @@ class Command(BaseCommand):
             )
             return
 
-        self.stdout.write(f'Populando dados para o usuário: {user.username}')
+        rng = random.Random(options['seed'])
+
+        usuarios = [user] + self.criar_usuarios(username, options['usuarios'] - 1)
+        self.stdout.write(f'Populando dados para {len(usuarios)} usuário(s) a partir de: {user.username}')
+
+        tipos = self.criar_tipos()
+        ambientes = self.criar_ambientes(usuarios, options['ambientes'])
+        dispositivos = self.criar_dispositivos(ambientes, options['dispositivos'], rng)
+        sensores = self.criar_sensores(dispositivos, tipos, options['sensores'])
 
-        # Criar tipos de sensores
-        tipos_sensores = [
-            {'nome': 'Temperatura', 'unidade': '°C', 'descricao': 'Sensor de temperatura ambiente'},
-            {'nome': 'Umidade', 'unidade': '%', 'descricao': 'Sensor de umidade relativa do ar'},
-            {'nome': 'Luminosidade', 'unidade': 'lux', 'descricao': 'Sensor de luminosidade'},
-            {'nome': 'Pressão', 'unidade': 'hPa', 'descricao': 'Sensor de pressão atmosférica'},
-            {'nome': 'Movimento', 'unidade': 'bool', 'descricao': 'Sensor de presença/movimento'},
-            {'nome': 'pH', 'unidade': 'pH', 'descricao': 'Sensor de pH da água'},
-        ]
+        self.criar_leituras(sensores, options, rng)
 
-        for tipo_data in tipos_sensores:
+        total_leituras = LeituraSensor.objects.count()
+        self.stdout.write(
+            self.style.SUCCESS(f'Banco de dados populado com sucesso! Total de leituras: {total_leituras}')
+        )
+
+        self.stdout.write('\nResumo:')
+        self.stdout.write(f'- Tipos de Sensores: {TipoSensor.objects.count()}')
+        self.stdout.write(f'- Ambientes: {Ambiente.objects.filter(usuario__in=usuarios).count()}')
+        self.stdout.write(f'- Dispositivos: {Dispositivo.objects.filter(usuario__in=usuarios).count()}')
+        self.stdout.write(f'- Sensores: {Sensor.objects.filter(usuario__in=usuarios).count()}')
+        self.stdout.write(f'- Leituras: {total_leituras}')
+
+        self.stdout.write('\nCredenciais de acesso:')
+        self.stdout.write(f'- Admin: admin / admin123')
+        self.stdout.write(f'- URL Admin: http://127.0.0.1:8000/admin/')
+        self.stdout.write(f'- URL Principal: http://127.0.0.1:8000/')
+
+    def criar_usuarios(self, username, quantidade):
+        if quantidade <= 0:
+            return []
+        nomes = [f'{username}_{i}' for i in range(2, quantidade + 2)]
+        existentes = set(User.objects.filter(username__in=nomes).values_list('username', flat=True))
+        # Um único hash para todos os usuários gerados (hashing é caro)
+        senha = make_password('senha123')
+        User.objects.bulk_create(
+            [User(username=nome, password=senha) for nome in nomes if nome not in existentes]
+        )
+        self.stdout.write(f'Usuários criados: {quantidade - len(existentes)} (senha: senha123)')
+        return list(User.objects.filter(username__in=nomes).order_by('pk'))
+
+    def criar_tipos(self):
+        for tipo_data in TIPOS_SENSORES:
             tipo, created = TipoSensor.objects.get_or_create(
                 nome=tipo_data['nome'],
                 defaults=tipo_data
             )
             if created:
                 self.stdout.write(f'Tipo de sensor criado: {tipo.nome}')
+        return {tipo.nome: tipo for tipo in TipoSensor.objects.all()}
 
-        # Criar ambientes
-        ambientes_data = [
-            {'nome': 'Sala de Estar', 'descricao': 'Ambiente principal da casa'},
-            {'nome': 'Cozinha', 'descricao': 'Área de preparo de alimentos'},
-            {'nome': 'Quarto Principal', 'descricao': 'Dormitório principal'},
-            {'nome': 'Jardim', 'descricao': 'Área externa com plantas'},
-            {'nome': 'Escritório', 'descricao': 'Local de trabalho'},
-        ]
-
+    def criar_ambientes(self, usuarios, por_usuario):
         ambientes = []
-        for amb_data in ambientes_data:
-            ambiente, created = Ambiente.objects.get_or_create(
-                nome=amb_data['nome'],
-                usuario=user,
-                defaults=amb_data
+        for usuario in usuarios:
+            existentes = {amb.nome: amb for amb in Ambiente.objects.filter(usuario=usuario)}
+            novos = []
+            for i in range(por_usuario):
+                amb_data = AMBIENTES[i % len(AMBIENTES)]
+                nome = amb_data['nome'] if i < len(AMBIENTES) else f"{amb_data['nome']} {i // len(AMBIENTES) + 1}"
+                if nome not in existentes:
+                    novos.append(Ambiente(nome=nome, descricao=amb_data['descricao'], usuario=usuario))
+            Ambiente.objects.bulk_create(novos)
+            ambientes.extend(
+                Ambiente.objects.filter(usuario=usuario).order_by('pk')[:por_usuario]
             )
-            ambientes.append(ambiente)
-            if created:
-                self.stdout.write(f'Ambiente criado: {ambiente.nome}')
-
-        # Criar dispositivos
-        dispositivos_data = [
-            {'nome': 'ESP32 Sala', 'tipo': 'controlador', 'modelo': 'ESP32-WROOM-32', 'fabricante': 'Espressif', 'mac_address': '24:6F:28:AB:12:34'},
-            {'nome': 'Arduino Cozinha', 'tipo': 'controlador', 'modelo': 'Arduino Uno', 'fabricante': 'Arduino', 'mac_address': '24:6F:28:AB:12:35'},
-            {'nome': 'Raspberry Pi Jardim', 'tipo': 'gateway', 'modelo': 'Raspberry Pi 4B', 'fabricante': 'Raspberry Pi Foundation', 'mac_address': '24:6F:28:AB:12:36'},
-            {'nome': 'NodeMCU Quarto', 'tipo': 'controlador', 'modelo': 'NodeMCU v3', 'fabricante': 'NodeMCU', 'mac_address': '24:6F:28:AB:12:37'},
-            {'nome': 'ESP8266 Escritório', 'tipo': 'controlador', 'modelo': 'ESP8266', 'fabricante': 'Espressif', 'mac_address': '24:6F:28:AB:12:38'},
-        ]
+        self.stdout.write(f'Ambientes: {len(ambientes)}')
+        return ambientes
 
+    def criar_dispositivos(self, ambientes, por_ambiente, rng):
+        agora = timezone.now()
+        novos = []
+        macs = []
+        for a, ambiente in enumerate(ambientes):
+            for d in range(por_ambiente):
+                indice = a * por_ambiente + d
+                modelo = MODELOS_DISPOSITIVO[indice % len(MODELOS_DISPOSITIVO)]
+                mac = formatar_mac(MAC_BASE + indice)
+                macs.append(mac)
+                novos.append(Dispositivo(
+                    nome=f"{modelo['nome']} {ambiente.nome}" + (f' {d + 1}' if por_ambiente > 1 else ''),
+                    tipo=modelo['tipo'],
+                    modelo=modelo['modelo'],
+                    fabricante=modelo['fabricante'],
+                    mac_address=mac,
+                    ip_address=f'10.{(indice >> 16) & 0xFF}.{(indice >> 8) & 0xFF}.{indice & 0xFF}',
+                    status=rng.choice(['ativo', 'ativo', 'ativo', 'inativo']),  # Maioria ativo
+                    ambiente=ambiente,
+                    usuario_id=ambiente.usuario_id,
+                    ultimo_contato=agora - timedelta(minutes=rng.randint(1, 60)),
+                ))
+        Dispositivo.objects.bulk_create(novos, batch_size=500, ignore_conflicts=True)
         dispositivos = []
-        for i, disp_data in enumerate(dispositivos_data):
-            ambiente = ambientes[i % len(ambientes)]
-            disp_data['ambiente'] = ambiente
-            disp_data['usuario'] = user
-            disp_data['ip_address'] = f'192.168.1.{100 + i}'
-            disp_data['status'] = random.choice(['ativo', 'ativo', 'ativo', 'inativo'])  # Maioria ativo
-            disp_data['ultimo_contato'] = timezone.now() - timedelta(minutes=random.randint(1, 60))
-            
-            dispositivo, created = Dispositivo.objects.get_or_create(
-                mac_address=disp_data['mac_address'],
-                defaults=disp_data
+        for i in range(0, len(macs), 500):
+            dispositivos.extend(
+                Dispositivo.objects.filter(mac_address__in=macs[i:i + 500]).select_related('ambiente')
             )
-            dispositivos.append(dispositivo)
-            if created:
-                self.stdout.write(f'Dispositivo criado: {dispositivo.nome}')
-
-        # Criar sensores
-        sensores_por_dispositivo = [
-            ['Temperatura', 'Umidade'],  # ESP32 Sala
-            ['Temperatura', 'Movimento'], # Arduino Cozinha  
-            ['Temperatura', 'Umidade', 'pH'], # Raspberry Pi Jardim
-            ['Temperatura', 'Luminosidade'], # NodeMCU Quarto
-            ['Temperatura', 'Pressão'], # ESP8266 Escritório
-        ]
+        dispositivos.sort(key=lambda disp: disp.mac_address)
+        self.stdout.write(f'Dispositivos: {len(dispositivos)}')
+        return dispositivos
 
-        sensores = []
+    def criar_sensores(self, dispositivos, tipos, por_dispositivo):
+        novos = []
         for i, dispositivo in enumerate(dispositivos):
-            tipos_para_dispositivo = sensores_por_dispositivo[i]
-            
-            for tipo_nome in tipos_para_dispositivo:
-                tipo_sensor = TipoSensor.objects.get(nome=tipo_nome)
-                
-                sensor_data = {
-                    'nome': f'{tipo_nome} - {dispositivo.nome}',
-                    'tipo': tipo_sensor,
-                    'dispositivo': dispositivo,
-                    'ambiente': dispositivo.ambiente,
-                    'usuario': user,
-                    'ativo': True,
-                }
-                
-                # Configurar valores específicos por tipo
-                if tipo_nome == 'Temperatura':
-                    sensor_data['valor_minimo'] = -10.0
-                    sensor_data['valor_maximo'] = 50.0
-                    sensor_data['precisao'] = 1
-                elif tipo_nome == 'Umidade':
-                    sensor_data['valor_minimo'] = 0.0
-                    sensor_data['valor_maximo'] = 100.0
-                    sensor_data['precisao'] = 1
-                elif tipo_nome == 'Luminosidade':
-                    sensor_data['valor_minimo'] = 0.0
-                    sensor_data['valor_maximo'] = 1000.0
-                    sensor_data['precisao'] = 0
-                elif tipo_nome == 'Pressão':
-                    sensor_data['valor_minimo'] = 950.0
-                    sensor_data['valor_maximo'] = 1050.0
-                    sensor_data['precisao'] = 1
-                elif tipo_nome == 'pH':
-                    sensor_data['valor_minimo'] = 0.0
-                    sensor_data['valor_maximo'] = 14.0
-                    sensor_data['precisao'] = 2
-                
-                sensor, created = Sensor.objects.get_or_create(
+            nomes_tipos = ['Temperatura'] + [
+                ROTACAO_TIPOS[(i + k) % len(ROTACAO_TIPOS)] for k in range(por_dispositivo - 1)
+            ]
+            for slot, tipo_nome in enumerate(nomes_tipos):
+                valor_minimo, valor_maximo, precisao = CONFIG_SENSORES[tipo_nome]
+                novos.append(Sensor(
+                    nome=f'{tipo_nome} - {dispositivo.nome}',
+                    tipo=tipos[tipo_nome],
                     dispositivo=dispositivo,
-                    tipo=tipo_sensor,
-                    defaults=sensor_data
-                )
-                sensores.append(sensor)
-                if created:
-                    self.stdout.write(f'Sensor criado: {sensor.nome}')
-
-        # Criar leituras dos sensores (últimos 7 dias)
-        self.stdout.write('Criando leituras dos sensores...')
-        
+                    ambiente_id=dispositivo.ambiente_id,
+                    usuario_id=dispositivo.usuario_id,
+                    ativo=True,
+                    valor_minimo=valor_minimo,
+                    valor_maximo=valor_maximo,
+                    precisao=precisao,
+                    slot=slot,
+                ))
+        Sensor.objects.bulk_create(novos, batch_size=500, ignore_conflicts=True)
+
+        ids = [disp.pk for disp in dispositivos]
+        sensores = []
+        for i in range(0, len(ids), 500):
+            sensores.extend(
+                Sensor.objects.filter(dispositivo_id__in=ids[i:i + 500]).select_related('tipo', 'ambiente')
+            )
+        sensores.sort(key=lambda sensor: sensor.pk)
+        self.stdout.write(f'Sensores: {len(sensores)}')
+        return sensores
+
+    def criar_leituras(self, sensores, options, rng):
+        agora = timezone.now()
+        intervalo = timedelta(minutes=options['intervalo'])
+        passos = int(timedelta(days=options['dias']) / intervalo)
+        # A grade de horários é a mesma para todos os sensores, então cada
+        # timestamp é convertido para o formato do banco uma única vez
+        timestamps = [agora - intervalo * passo for passo in range(passos, 0, -1)]
+        timestamps_db = [connection.ops.adapt_datetimefield_value(momento) for momento in timestamps]
+        horas = [timezone.localtime(momento).hour for momento in timestamps]
+        total = len(timestamps) * len(sensores)
+        tamanho = options['lote']
+
+        self.stdout.write(f'Criando {total} leituras ({len(sensores)} sensores x {len(timestamps)} horários)...')
+        inicio = time.monotonic()
+        gravadas = 0
+        lote = []
         for sensor in sensores:
-            # Criar leituras para os últimos 7 dias
-            for dia in range(7):
-                for hora in range(0, 24, 2):  # A cada 2 horas
-                    timestamp = timezone.now() - timedelta(days=dia, hours=hora)
-                    
-                    # Gerar valor baseado no tipo de sensor
-                    if sensor.tipo.nome == 'Temperatura':
-                        base_temp = 22 if sensor.ambiente.nome != 'Jardim' else 18
-                        valor = base_temp + random.uniform(-5, 8) + random.uniform(-2, 2)
-                    elif sensor.tipo.nome == 'Umidade':
-                        valor = random.uniform(40, 80)
-                    elif sensor.tipo.nome == 'Luminosidade':
-                        # Simular ciclo dia/noite
-                        if 6 <= timestamp.hour <= 18:
-                            valor = random.uniform(300, 800)
-                        else:
-                            valor = random.uniform(0, 50)
-                    elif sensor.tipo.nome == 'Pressão':
-                        valor = random.uniform(1000, 1030)
-                    elif sensor.tipo.nome == 'Movimento':
-                        valor = random.choice([0, 1])
-                    elif sensor.tipo.nome == 'pH':
-                        valor = random.uniform(6.5, 8.5)
-                    else:
-                        valor = random.uniform(0, 100)
-                    
-                    # Arredondar baseado na precisão
-                    valor = round(valor, sensor.precisao)
-                    
-                    LeituraSensor.objects.create(
-                        sensor=sensor,
-                        valor=valor,
-                        timestamp=timestamp
-                    )
+            valores = gerar_valores(sensor.tipo.nome, sensor.ambiente.nome, horas, rng)
+            precisao = sensor.precisao
+            sensor_id = sensor.pk
+            lote.extend(
+                (sensor_id, round(valor, precisao), indice)
+                for indice, valor in enumerate(valores)
+            )
+            while len(lote) >= tamanho:
+                self.gravar_lote(lote[:tamanho], timestamps, timestamps_db, options['sem_agregados'])
+                del lote[:tamanho]
+                gravadas += tamanho
+                if gravadas % (tamanho * 20) == 0:
+                    self.relatar_progresso(gravadas, total, inicio)
+        if lote:
+            self.gravar_lote(lote, timestamps, timestamps_db, options['sem_agregados'])
+            gravadas += len(lote)
+            self.relatar_progresso(gravadas, total, inicio)
 
-        total_leituras = LeituraSensor.objects.count()
-        self.stdout.write(
-            self.style.SUCCESS(f'Banco de dados populado com sucesso! Total de leituras: {total_leituras}')
-        )
-        
-        self.stdout.write('\nResumo:')
-        self.stdout.write(f'- Tipos de Sensores: {TipoSensor.objects.count()}')
-        self.stdout.write(f'- Ambientes: {Ambiente.objects.filter(usuario=user).count()}')
-        self.stdout.write(f'- Dispositivos: {Dispositivo.objects.filter(usuario=user).count()}')
-        self.stdout.write(f'- Sensores: {Sensor.objects.filter(usuario=user).count()}')
-        self.stdout.write(f'- Leituras: {total_leituras}')
-        
-        self.stdout.write('\nCredenciais de acesso:')
-        self.stdout.write(f'- Admin: admin / admin123')
-        self.stdout.write(f'- URL Admin: http://127.0.0.1:8000/admin/')
-        self.stdout.write(f'- URL Principal: http://127.0.0.1:8000/')
\ No newline at end of file
+    def gravar_lote(self, lote, timestamps, timestamps_db, sem_agregados):
+        """Grava tuplas (sensor_id, valor, índice do horário) em uma transação.
+
+        As leituras são inseridas com um único executemany na tabela de
+        LeituraSensor: instanciar milhões de models é o que limita o
+        bulk_create nessa escala.
+        """
+        tabela = connection.ops.quote_name(LeituraSensor._meta.db_table)
+        sql = f'INSERT INTO {tabela} ("sensor_id", "valor", "timestamp", "observacao") VALUES (%s, %s, %s, NULL)'
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, [(sensor_id, valor, timestamps_db[i]) for sensor_id, valor, i in lote])
+            linhas = [(sensor_id, valor, timestamps[i]) for sensor_id, valor, i in lote]
+            atualizar_ultimas_leituras(linhas)
+            if not sem_agregados:
+                atualizar_agregados(linhas)
+
+    def relatar_progresso(self, gravadas, total, inicio):
+        decorrido = time.monotonic() - inicio
+        taxa = gravadas / decorrido if decorrido else 0
+        self.stdout.write(f'- {gravadas}/{total} leituras ({taxa:.0f}/s)')
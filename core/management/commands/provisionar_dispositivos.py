@@ -0,0 +1,94 @@
+import csv
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.provisionamento import AplicacaoInterrompida, ManifestoInvalido, aplicar_plano, ler_manifesto, validar_manifesto
+
+
+class Command(BaseCommand):
+    help = 'Cadastra dispositivos e sensores em lote a partir de um manifesto CSV ou JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'manifesto',
+            type=str,
+            help='Arquivo do manifesto (.csv ou .json)',
+        )
+        parser.add_argument(
+            '--usuario',
+            type=str,
+            required=True,
+            help='Usuário dono dos dispositivos, sensores e ambientes criados',
+        )
+        parser.add_argument(
+            '--formato',
+            choices=['csv', 'json'],
+            help='Formato do manifesto (default: pela extensão do arquivo)',
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Apenas valida e relata o que seria criado e os conflitos, sem gravar',
+        )
+        parser.add_argument(
+            '--ignorar-existentes',
+            action='store_true',
+            help='Pula MACs já cadastrados em vez de tratá-los como erro (permite reexecutar o manifesto)',
+        )
+        parser.add_argument(
+            '--tokens',
+            type=str,
+            help='Gera tokens de acesso para os dispositivos criados e grava "mac,token" neste CSV',
+        )
+
+    def handle(self, *args, **options):
+        caminho = Path(options['manifesto'])
+        formato = options['formato'] or caminho.suffix.lstrip('.').lower()
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f'Usuário "{options["usuario"]}" não encontrado.')
+        try:
+            entradas = ler_manifesto(caminho.read_bytes(), formato)
+        except OSError as erro:
+            raise CommandError(f'Não foi possível ler {caminho}: {erro}')
+        except ManifestoInvalido as erro:
+            raise CommandError(str(erro))
+
+        plano = validar_manifesto(entradas, usuario, options['ignorar_existentes'])
+        for linha, mac, erro in plano.erros:
+            self.stdout.write(self.style.ERROR(f'- {linha} ({mac}): {erro}'))
+        for nome in plano.ambientes_novos:
+            self.stdout.write(f'- ambiente novo: {nome}')
+        self.stdout.write(plano.resumo())
+
+        if plano.erros:
+            raise CommandError('Manifesto com erros; nada foi gravado.')
+        if options['simular']:
+            self.stdout.write(self.style.WARNING('Simulação: nada foi gravado.'))
+            return
+
+        try:
+            tokens = aplicar_plano(plano, usuario, gerar_tokens=bool(options['tokens']))
+        except AplicacaoInterrompida as erro:
+            if erro.tokens:
+                self._gravar_tokens(options['tokens'], erro.tokens)
+            raise CommandError(
+                f'Conflito ao gravar (cadastro concorrente?): {erro}. '
+                f'{erro.gravados} dispositivos dos blocos anteriores foram gravados; '
+                'reexecute com --ignorar-existentes para gravar o restante.'
+            )
+        if options['tokens']:
+            self._gravar_tokens(options['tokens'], tokens)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(plano.dispositivos)} dispositivos e {plano.total_sensores} sensores cadastrados.'
+        ))
+
+    def _gravar_tokens(self, caminho, tokens):
+        with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(['mac', 'token'])
+            escritor.writerows(tokens)
+        self.stdout.write(f'Tokens gravados em {caminho}; o banco guarda só o hash.')
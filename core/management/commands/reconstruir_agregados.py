@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.agregados import GRANULARIDADES, atualizar_agregados, inicio_do_periodo
+from core.arquivo import de_microssegundos, inicio_mes, iterar_leituras, primeiro_mes_arquivado
+from core.models import AgregadoLeitura, LeituraSensor, Sensor
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói os agregados (minuto/hora/dia) das leituras em um intervalo de datas, '
+        'incluindo as leituras já movidas para o arquivo frio'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--inicio',
+            type=str,
+            help='Data inicial (AAAA-MM-DD). Default: data da leitura mais antiga',
+        )
+        parser.add_argument(
+            '--fim',
+            type=str,
+            help='Data final, inclusive (AAAA-MM-DD). Default: hoje',
+        )
+        parser.add_argument(
+            '--sensor',
+            type=int,
+            action='append',
+            help='Restringe a reconstrução a um sensor (pode ser repetido)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=20000,
+            help='Quantidade de leituras agregadas de cada vez (default: 20000)',
+        )
+
+    def _data(self, valor, padrao):
+        if not valor:
+            return padrao
+        try:
+            return timezone.make_aware(datetime.strptime(valor, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f'Data inválida: {valor}. Use o formato AAAA-MM-DD.')
+
+    def handle(self, *args, **options):
+        leituras = LeituraSensor.objects.all()
+        if options['sensor']:
+            leituras = leituras.filter(sensor_id__in=options['sensor'])
+        # A leitura mais antiga pode já estar no arquivo frio
+        candidatas = [leituras.order_by('timestamp').values_list('timestamp', flat=True).first()]
+        mes = primeiro_mes_arquivado(set(options['sensor']) if options['sensor'] else None)
+        if mes is not None:
+            candidatas.append(inicio_mes(*mes))
+        candidatas = [momento for momento in candidatas if momento is not None]
+        if not candidatas:
+            self.stdout.write('Nenhuma leitura encontrada.')
+            return
+
+        # O intervalo é alinhado a dias inteiros para não deixar agregados parciais
+        inicio = inicio_do_periodo(self._data(options['inicio'], min(candidatas)), 'dia')
+        fim = inicio_do_periodo(self._data(options['fim'], timezone.now()), 'dia') + timedelta(days=1)
+        if fim <= inicio:
+            raise CommandError('A data final deve ser posterior à inicial.')
+
+        sensores = Sensor.objects.order_by('pk').values_list('pk', flat=True)
+        if options['sensor']:
+            sensores = sensores.filter(pk__in=options['sensor'])
+
+        self.stdout.write(f'Reconstruindo agregados de {inicio:%Y-%m-%d} a {fim - timedelta(days=1):%Y-%m-%d}...')
+        removidos = total = 0
+        for sensor_id in sensores:
+            # Uma transação por sensor: uma falha deixa os agregados antigos dele no lugar, nunca o intervalo vazio
+            with transaction.atomic():
+                removidos += AgregadoLeitura.objects.filter(
+                    sensor_id=sensor_id, inicio__gte=inicio, inicio__lt=fim,
+                ).delete()[0]
+                total += self.reconstruir_sensor(sensor_id, inicio, fim, options['lote'])
+
+        self.stdout.write(f'- Agregados removidos: {removidos}')
+        self.stdout.write(
+            self.style.SUCCESS(f'Agregados reconstruídos a partir de {total} leituras.')
+        )
+
+    def reconstruir_sensor(self, sensor_id, inicio, fim, tamanho):
+        """Agrega as leituras do sensor no intervalo (arquivo frio e tabela quente); retorna quantas foram lidas"""
+        total = 0
+        lote = []
+        for momento, valor in iterar_leituras(sensor_id, inicio, fim):
+            lote.append((sensor_id, valor, de_microssegundos(momento)))
+            if len(lote) >= tamanho:
+                atualizar_agregados(lote, GRANULARIDADES)
+                total += len(lote)
+                lote = []
+        if lote:
+            atualizar_agregados(lote, GRANULARIDADES)
+            total += len(lote)
+        if total:
+            self.stdout.write(f'- Sensor {sensor_id}: {total} leituras')
+        return total
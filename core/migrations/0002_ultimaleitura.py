@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_ultimas_leituras(apps, schema_editor):
+    Sensor = apps.get_model('core', 'Sensor')
+    LeituraSensor = apps.get_model('core', 'LeituraSensor')
+    UltimaLeitura = apps.get_model('core', 'UltimaLeitura')
+
+    ultima = LeituraSensor.objects.filter(sensor=OuterRef('pk')).order_by('-timestamp', '-id')
+    sensores = Sensor.objects.annotate(
+        ultimo_valor=Subquery(ultima.values('valor')[:1]),
+        ultimo_timestamp=Subquery(ultima.values('timestamp')[:1]),
+    ).filter(ultimo_timestamp__isnull=False).values_list('pk', 'ultimo_valor', 'ultimo_timestamp')
+
+    UltimaLeitura.objects.bulk_create(
+        [UltimaLeitura(sensor_id=pk, valor=valor, timestamp=ts) for pk, valor, ts in sensores],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UltimaLeitura',
+            fields=[
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leitura_atual', serialize=False, to='core.sensor', verbose_name='Sensor')),
+                ('valor', models.FloatField(verbose_name='Valor')),
+                ('timestamp', models.DateTimeField(verbose_name='Timestamp')),
+            ],
+            options={
+                'verbose_name': 'Última Leitura',
+                'verbose_name_plural': 'Últimas Leituras',
+            },
+        ),
+        migrations.RunPython(preencher_ultimas_leituras, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_ultimaleitura'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgregadoLeitura',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularidade', models.CharField(choices=[('minuto', 'Minuto'), ('hora', 'Hora'), ('dia', 'Dia')], max_length=10, verbose_name='Granularidade')),
+                ('inicio', models.DateTimeField(verbose_name='Início do Período')),
+                ('minimo', models.FloatField(verbose_name='Mínimo')),
+                ('maximo', models.FloatField(verbose_name='Máximo')),
+                ('soma', models.FloatField(verbose_name='Soma')),
+                ('contagem', models.PositiveIntegerField(verbose_name='Contagem')),
+                ('ultimo_valor', models.FloatField(verbose_name='Último Valor')),
+                ('ultimo_timestamp', models.DateTimeField(verbose_name='Timestamp do Último Valor')),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agregados', to='core.sensor', verbose_name='Sensor')),
+            ],
+            options={
+                'verbose_name': 'Agregado de Leituras',
+                'verbose_name_plural': 'Agregados de Leituras',
+                'ordering': ['sensor', 'granularidade', 'inicio'],
+                'constraints': [models.UniqueConstraint(fields=('sensor', 'granularidade', 'inicio'), name='agregado_sensor_periodo_unico')],
+            },
+        ),
+    ]
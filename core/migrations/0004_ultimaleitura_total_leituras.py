@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def preencher_total_leituras(apps, schema_editor):
+    LeituraSensor = apps.get_model('core', 'LeituraSensor')
+    UltimaLeitura = apps.get_model('core', 'UltimaLeitura')
+
+    contagens = LeituraSensor.objects.order_by().values('sensor_id').annotate(n=Count('id')).values_list('sensor_id', 'n')
+    ultimas = UltimaLeitura.objects.in_bulk()
+    for sensor_id, total in contagens:
+        if sensor_id in ultimas:
+            ultimas[sensor_id].total_leituras = total
+    UltimaLeitura.objects.bulk_update(ultimas.values(), ['total_leituras'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_agregadoleitura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ultimaleitura',
+            name='total_leituras',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Total de Leituras'),
+        ),
+        migrations.RunPython(preencher_total_leituras, migrations.RunPython.noop),
+    ]
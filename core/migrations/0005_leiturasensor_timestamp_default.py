@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_ultimaleitura_total_leituras'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='leiturasensor',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Timestamp'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_leiturasensor_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='retencao_dias',
+            field=models.PositiveIntegerField(blank=True, help_text='Sobrescreve a retenção do tipo de sensor. Vazio usa a do tipo.', null=True, verbose_name='Retenção (dias)'),
+        ),
+        migrations.AddField(
+            model_name='tiposensor',
+            name='retencao_dias',
+            field=models.PositiveIntegerField(blank=True, help_text='Leituras mais antigas são arquivadas. Vazio usa o padrão do sistema.', null=True, verbose_name='Retenção (dias)'),
+        ),
+    ]
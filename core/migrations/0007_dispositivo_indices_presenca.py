@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_retencao_dias'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dispositivo',
+            index=models.Index(fields=['ultimo_contato'], name='core_dispos_ultimo__47bec3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dispositivo',
+            index=models.Index(fields=['usuario', 'ultimo_contato'], name='core_dispos_usuario_2b7263_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_dispositivo_indices_presenca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alerta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('acima', 'Acima do máximo'), ('abaixo', 'Abaixo do mínimo')], max_length=10, verbose_name='Tipo')),
+                ('limite', models.FloatField(verbose_name='Limite Ultrapassado')),
+                ('valor_extremo', models.FloatField(verbose_name='Valor Mais Distante do Limite')),
+                ('ultimo_valor', models.FloatField(verbose_name='Último Valor')),
+                ('contagem', models.PositiveIntegerField(default=1, verbose_name='Leituras Fora da Faixa')),
+                ('inicio', models.DateTimeField(verbose_name='Início')),
+                ('ultimo_timestamp', models.DateTimeField(verbose_name='Última Leitura Fora da Faixa')),
+                ('encerrado_em', models.DateTimeField(blank=True, null=True, verbose_name='Encerrado em')),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='core.sensor', verbose_name='Sensor')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Alerta',
+                'verbose_name_plural': 'Alertas',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(condition=models.Q(('encerrado_em__isnull', True)), fields=['usuario', '-inicio'], name='alerta_ativo_usuario_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('encerrado_em__isnull', True)), fields=('sensor',), name='alerta_aberto_unico_por_sensor')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_alerta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispositivo',
+            name='token_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Hash do Token'),
+        ),
+    ]
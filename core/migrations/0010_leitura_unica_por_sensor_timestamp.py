@@ -0,0 +1,106 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:34
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+
+# Cópia congelada de core.agregados: a migração não pode mudar junto com o código da aplicação
+GRANULARIDADES = ('minuto', 'hora', 'dia')
+
+
+def inicio_do_periodo(momento, granularidade):
+    """Trunca o momento para o início do período no fuso horário local"""
+    local = timezone.localtime(momento)
+    if granularidade == 'minuto':
+        return local.replace(second=0, microsecond=0)
+    if granularidade == 'hora':
+        return local.replace(minute=0, second=0, microsecond=0)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def resumir(leituras, granularidade):
+    """Agrupa tuplas (sensor_id, valor, timestamp) em {(sensor_id, inicio): [min, max, soma, n, último, ts]}"""
+    resumo = {}
+    for sensor_id, valor, momento in leituras:
+        chave = (sensor_id, inicio_do_periodo(momento, granularidade))
+        atual = resumo.get(chave)
+        if atual is None:
+            resumo[chave] = [valor, valor, valor, 1, valor, momento]
+            continue
+        atual[0] = min(atual[0], valor)
+        atual[1] = max(atual[1], valor)
+        atual[2] += valor
+        atual[3] += 1
+        if momento >= atual[5]:
+            atual[4] = valor
+            atual[5] = momento
+    return resumo
+
+
+def reconstruir_agregados(LeituraSensor, AgregadoLeitura, dias):
+    """Refaz os agregados dos pares (sensor_id, início do dia) a partir das leituras que ficaram"""
+    for sensor_id, dia in sorted(dias):
+        fim = dia + timedelta(days=1)
+        AgregadoLeitura.objects.filter(sensor_id=sensor_id, inicio__gte=dia, inicio__lt=fim).delete()
+        leituras = list(
+            LeituraSensor.objects.filter(sensor_id=sensor_id, timestamp__gte=dia, timestamp__lt=fim)
+            .values_list('sensor_id', 'valor', 'timestamp')
+        )
+        AgregadoLeitura.objects.bulk_create([
+            AgregadoLeitura(
+                sensor_id=sensor_id, granularidade=granularidade, inicio=inicio,
+                minimo=minimo, maximo=maximo, soma=soma, contagem=contagem,
+                ultimo_valor=ultimo, ultimo_timestamp=momento,
+            )
+            for granularidade in GRANULARIDADES
+            for (sensor_id, inicio), (minimo, maximo, soma, contagem, ultimo, momento)
+            in resumir(leituras, granularidade).items()
+        ], batch_size=500)
+
+
+def remover_repetidas(apps, schema_editor):
+    """Mantém a primeira leitura de cada (sensor, timestamp), desconta as removidas do total do sensor
+    e refaz os agregados dos dias afetados, que tinham contado as repetidas"""
+    LeituraSensor = apps.get_model('core', 'LeituraSensor')
+    UltimaLeitura = apps.get_model('core', 'UltimaLeitura')
+    AgregadoLeitura = apps.get_model('core', 'AgregadoLeitura')
+
+    grupos = (
+        LeituraSensor.objects.order_by().values('sensor_id', 'timestamp')
+        .annotate(n=Count('id'), primeira=Min('id')).filter(n__gt=1)
+    )
+    removidas = {}
+    dias = set()
+    for grupo in grupos.iterator():
+        LeituraSensor.objects.filter(sensor_id=grupo['sensor_id'], timestamp=grupo['timestamp']).exclude(
+            pk=grupo['primeira']
+        ).delete()
+        removidas[grupo['sensor_id']] = removidas.get(grupo['sensor_id'], 0) + grupo['n'] - 1
+        dias.add((grupo['sensor_id'], inicio_do_periodo(grupo['timestamp'], 'dia')))
+    reconstruir_agregados(LeituraSensor, AgregadoLeitura, dias)
+    for sensor_id, total in removidas.items():
+        UltimaLeitura.objects.filter(sensor_id=sensor_id, total_leituras__gte=total).update(
+            total_leituras=F('total_leituras') - total
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_dispositivo_token_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_repetidas, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='leiturasensor',
+            name='core_leitur_sensor__d2c88a_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='leiturasensor',
+            constraint=models.UniqueConstraint(fields=('sensor', 'timestamp'), name='leitura_unica_por_sensor_timestamp'),
+        ),
+    ]
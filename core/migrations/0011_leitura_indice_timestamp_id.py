@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_leitura_unica_por_sensor_timestamp'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='leiturasensor',
+            name='core_leitur_timesta_e829f3_idx',
+        ),
+        migrations.AddIndex(
+            model_name='leiturasensor',
+            index=models.Index(fields=['-timestamp', '-id'], name='leitura_timestamp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_leitura_indice_timestamp_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dispositivo',
+            index=models.Index(fields=['token_hash'], name='dispositivo_token_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:56
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+def atribuir_slots(apps, schema_editor):
+    """Mantém os slots usados até aqui: a posição do sensor no dispositivo por ordem de id"""
+    Sensor = apps.get_model('core', 'Sensor')
+    sensores = []
+    anterior, slot = None, 0
+    for sensor in Sensor.objects.order_by('dispositivo_id', 'pk').only('pk', 'dispositivo_id').iterator():
+        slot = slot + 1 if sensor.dispositivo_id == anterior else 0
+        anterior = sensor.dispositivo_id
+        sensor.slot = slot
+        sensores.append(sensor)
+    Sensor.objects.bulk_update(sensores, ['slot'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_dispositivo_indice_token'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='slot',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Número do sensor nos lotes binários do dispositivo (0 a 255). Vazio usa o próximo livre.', null=True, validators=[django.core.validators.MaxValueValidator(255)], verbose_name='Slot'),
+        ),
+        migrations.RunPython(atribuir_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sensor',
+            constraint=models.UniqueConstraint(fields=('dispositivo', 'slot'), name='sensor_slot_por_dispositivo'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:57
+
+from django.db import migrations
+
+
+def normalizar_macs(apps, schema_editor):
+    """Grava os MACs em maiúsculas com ':', a forma usada nas buscas da ingestão"""
+    Dispositivo = apps.get_model('core', 'Dispositivo')
+    dispositivos = []
+    normalizados = {}
+    for dispositivo in Dispositivo.objects.only('pk', 'mac_address').iterator():
+        mac = dispositivo.mac_address.strip().upper().replace('-', ':')
+        if mac in normalizados:
+            raise RuntimeError(
+                f'Os dispositivos {normalizados[mac]} e {dispositivo.pk} têm o mesmo MAC ({mac}) '
+                'com grafias diferentes; corrija um deles antes de migrar.'
+            )
+        normalizados[mac] = dispositivo.pk
+        if mac != dispositivo.mac_address:
+            dispositivo.mac_address = mac
+            dispositivos.append(dispositivo)
+    Dispositivo.objects.bulk_update(dispositivos, ['mac_address'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_sensor_slot'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_macs, migrations.RunPython.noop),
+    ]
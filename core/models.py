@@ -1,10 +1,21 @@
 from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
 from django.contrib.auth.models import User
 from django.contrib.auth.models import AbstractUser
 
+from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+import hashlib
+import hmac
+import secrets
 
 
+# Maior slot que cabe no campo de um byte dos lotes binários (core.binario)
+SLOT_MAXIMO = 255
+
 class Ambiente(models.Model):
     """Model para representar ambientes (ex: Sala, Cozinha, Jardim)"""
     nome = models.CharField(max_length=100, verbose_name='Nome')
@@ -33,6 +44,52 @@ class Ambiente(models.Model):
         return self.sensores.count()
 
 
+def normalizar_mac(mac):
+    """Retorna o MAC em maiúsculas com ':' como separador"""
+    return str(mac).strip().upper().replace('-', ':')
+
+
+def hash_token(token):
+    """Retorna o hash guardado no banco para o token de acesso de um dispositivo"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def limites_presenca():
+    """Retorna (online_desde, instavel_desde) conforme os limites de presença configurados"""
+    agora = timezone.now()
+    online = getattr(settings, 'IOT_PRESENCA_ONLINE_MINUTOS', 5)
+    offline = getattr(settings, 'IOT_PRESENCA_OFFLINE_MINUTOS', 30)
+    return agora - timedelta(minutes=online), agora - timedelta(minutes=offline)
+
+
+class DispositivoQuerySet(models.QuerySet):
+    """Consultas de presença calculadas no banco a partir de ultimo_contato"""
+
+    def com_presenca(self):
+        """Anota cada dispositivo com presenca = 'online', 'instavel' ou 'offline'"""
+        online_desde, instavel_desde = limites_presenca()
+        return self.annotate(presenca=models.Case(
+            models.When(ultimo_contato__gte=online_desde, then=models.Value('online')),
+            models.When(ultimo_contato__gte=instavel_desde, then=models.Value('instavel')),
+            default=models.Value('offline'),
+            output_field=models.CharField(),
+        ))
+
+    def por_presenca(self, presenca):
+        """Filtra por presença usando intervalos em ultimo_contato (aproveita o índice)"""
+        online_desde, instavel_desde = limites_presenca()
+        if presenca == 'online':
+            return self.filter(ultimo_contato__gte=online_desde)
+        if presenca == 'instavel':
+            return self.filter(ultimo_contato__gte=instavel_desde, ultimo_contato__lt=online_desde)
+        if presenca == 'offline':
+            return self.filter(models.Q(ultimo_contato__lt=instavel_desde) | models.Q(ultimo_contato__isnull=True))
+        raise ValueError(f'Presença desconhecida: {presenca}')
+
+    def online(self):
+        return self.por_presenca('online')
+
+
 class Dispositivo(models.Model):
     """Model para representar dispositivos IoT"""
     TIPOS_DISPOSITIVO = [
@@ -50,6 +107,12 @@ class Dispositivo(models.Model):
         ('erro', 'Erro'),
     ]
 
+    PRESENCA_CHOICES = [
+        ('online', 'Online'),
+        ('instavel', 'Instável'),
+        ('offline', 'Offline'),
+    ]
+
     nome = models.CharField(max_length=100, verbose_name='Nome')
     tipo = models.CharField(max_length=20, choices=TIPOS_DISPOSITIVO, verbose_name='Tipo')
     modelo = models.CharField(max_length=100, blank=True, null=True, verbose_name='Modelo')
@@ -67,11 +130,20 @@ class Dispositivo(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
     atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
     ultimo_contato = models.DateTimeField(blank=True, null=True, verbose_name='Último Contato')
+    token_hash = models.CharField(max_length=64, blank=True, default='', editable=False, verbose_name='Hash do Token')
+
+    objects = DispositivoQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Dispositivo'
         verbose_name_plural = 'Dispositivos'
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['ultimo_contato']),
+            models.Index(fields=['usuario', 'ultimo_contato']),
+            # Autenticação da API: o dispositivo é encontrado pelo hash do token enviado
+            models.Index(fields=['token_hash'], name='dispositivo_token_idx'),
+        ]
 
     def __str__(self):
         return getattr(self, 'nome', f'Dispositivo {self.pk}')
@@ -79,14 +151,36 @@ class Dispositivo(models.Model):
     def get_absolute_url(self):
         return reverse('dispositivo_detail', kwargs={'pk': self.pk})
 
+    def clean(self):
+        # Antes da validação de unicidade, para "aa-bb-..." colidir com "AA:BB:..."
+        if self.mac_address:
+            self.mac_address = normalizar_mac(self.mac_address)
+
+    def save(self, *args, **kwargs):
+        """Grava o MAC normalizado, a forma usada nas buscas da ingestão"""
+        if self.mac_address:
+            self.mac_address = normalizar_mac(self.mac_address)
+        super().save(*args, **kwargs)
+
     @property
     def is_online(self):
         """Verifica se o dispositivo está online baseado no último contato"""
+        if hasattr(self, 'presenca'):
+            return self.presenca == 'online'
         if not self.ultimo_contato:
             return False
-        from django.utils import timezone
-        from datetime import timedelta
-        return timezone.now() - self.ultimo_contato < timedelta(minutes=5)
+        online_desde, _ = limites_presenca()
+        return self.ultimo_contato >= online_desde
+
+    def gerar_token(self):
+        """Gera um novo token de acesso e retorna o token; só o hash é guardado (chame save() depois)"""
+        token = secrets.token_urlsafe(24)
+        self.token_hash = hash_token(token)
+        return token
+
+    def verificar_token(self, token):
+        """Verifica o token de acesso enviado pelo dispositivo"""
+        return bool(self.token_hash) and hmac.compare_digest(self.token_hash, hash_token(token))
 
     @property
     def status_badge_class(self):
@@ -105,6 +199,10 @@ class TipoSensor(models.Model):
     nome = models.CharField(max_length=50, unique=True, verbose_name='Nome')
     unidade = models.CharField(max_length=10, verbose_name='Unidade de Medida')
     descricao = models.TextField(blank=True, null=True, verbose_name='Descrição')
+    retencao_dias = models.PositiveIntegerField(
+        blank=True, null=True, verbose_name='Retenção (dias)',
+        help_text='Leituras mais antigas são arquivadas. Vazio usa o padrão do sistema.',
+    )
     
     class Meta:
         verbose_name = 'Tipo de Sensor'
@@ -126,6 +224,14 @@ class Sensor(models.Model):
     valor_minimo = models.FloatField(blank=True, null=True, verbose_name='Valor Mínimo')
     valor_maximo = models.FloatField(blank=True, null=True, verbose_name='Valor Máximo')
     precisao = models.IntegerField(default=2, verbose_name='Precisão (casas decimais)')
+    slot = models.PositiveSmallIntegerField(
+        blank=True, null=True, validators=[MaxValueValidator(SLOT_MAXIMO)], verbose_name='Slot',
+        help_text='Número do sensor nos lotes binários do dispositivo (0 a 255). Vazio usa o próximo livre.',
+    )
+    retencao_dias = models.PositiveIntegerField(
+        blank=True, null=True, verbose_name='Retenção (dias)',
+        help_text='Sobrescreve a retenção do tipo de sensor. Vazio usa a do tipo.',
+    )
     
     ativo = models.BooleanField(default=True, verbose_name='Ativo')
     descricao = models.TextField(blank=True, null=True, verbose_name='Descrição')
@@ -138,29 +244,59 @@ class Sensor(models.Model):
         verbose_name_plural = 'Sensores'
         ordering = ['nome']
         unique_together = ['dispositivo', 'tipo']
+        constraints = [
+            models.UniqueConstraint(fields=['dispositivo', 'slot'], name='sensor_slot_por_dispositivo'),
+        ]
 
     def __str__(self):
         return f"{self.nome} - {self.tipo.nome}"
 
+    def save(self, *args, **kwargs):
+        """Sem slot, o sensor recebe o próximo livre do dispositivo"""
+        if self.slot is None and self.dispositivo_id is not None:
+            self.slot = self._slot_livre()
+        super().save(*args, **kwargs)
+
+    def _slot_livre(self):
+        """Retorna o slot seguinte ao maior em uso ou, acima de 255, o menor livre"""
+        usados = set(
+            Sensor.objects.filter(dispositivo_id=self.dispositivo_id, slot__isnull=False)
+            .exclude(pk=self.pk).values_list('slot', flat=True)
+        )
+        if not usados:
+            return 0
+        if max(usados) < SLOT_MAXIMO:
+            return max(usados) + 1
+        livres = set(range(SLOT_MAXIMO + 1)) - usados
+        if not livres:
+            raise ValidationError(
+                {'slot': f'O dispositivo já usa todos os {SLOT_MAXIMO + 1} slots dos lotes binários.'}
+            )
+        return min(livres)
+
     def get_absolute_url(self):
         return reverse('sensor_detail', kwargs={'pk': self.pk})
 
     @property
     def ultima_leitura(self):
-        """Retorna a última leitura do sensor"""
-        return self.leituras.first()
+        """Retorna a última leitura do sensor (tabela UltimaLeitura, sem varrer as leituras)"""
+        try:
+            return self.leitura_atual
+        except UltimaLeitura.DoesNotExist:
+            return None
 
     @property
     def total_leituras(self):
-        """Retorna o total de leituras do sensor"""
-        return self.leituras.count()
+        """Retorna o total de leituras do sensor (contador mantido em UltimaLeitura)"""
+        leitura = self.ultima_leitura
+        return leitura.total_leituras if leitura else 0
 
 
 class LeituraSensor(models.Model):
     """Model para armazenar leituras dos sensores"""
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='leituras', verbose_name='Sensor')
     valor = models.FloatField(verbose_name='Valor')
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name='Timestamp')
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name='Timestamp')
     observacao = models.CharField(max_length=200, blank=True, null=True, verbose_name='Observação')
 
     class Meta:
@@ -168,8 +304,12 @@ class LeituraSensor(models.Model):
         verbose_name_plural = 'Leituras dos Sensores'
         ordering = ['-timestamp']
         indexes = [
-            models.Index(fields=['sensor', '-timestamp']),
-            models.Index(fields=['-timestamp']),
+            # Ordem da listagem do admin, paginada por (timestamp, id)
+            models.Index(fields=['-timestamp', '-id'], name='leitura_timestamp_id_idx'),
+        ]
+        constraints = [
+            # Também serve de índice para as consultas por sensor e período (percorrido nos dois sentidos)
+            models.UniqueConstraint(fields=['sensor', 'timestamp'], name='leitura_unica_por_sensor_timestamp'),
         ]
 
     def __str__(self):
@@ -180,3 +320,101 @@ class LeituraSensor(models.Model):
         """Retorna o valor formatado com a precisão definida"""
         precisao = self.sensor.precisao
         return f"{self.valor:.{precisao}f} {self.sensor.tipo.unidade}"
+
+
+class UltimaLeitura(models.Model):
+    """Valor atual de cada sensor, mantido pela ingestão para evitar buscar em LeituraSensor"""
+    sensor = models.OneToOneField(Sensor, on_delete=models.CASCADE, primary_key=True, related_name='leitura_atual', verbose_name='Sensor')
+    valor = models.FloatField(verbose_name='Valor')
+    timestamp = models.DateTimeField(verbose_name='Timestamp')
+    total_leituras = models.PositiveBigIntegerField(default=0, verbose_name='Total de Leituras')
+
+    class Meta:
+        verbose_name = 'Última Leitura'
+        verbose_name_plural = 'Últimas Leituras'
+
+    def __str__(self):
+        return f"{self.sensor_id}: {self.valor} ({self.timestamp})"
+
+    @property
+    def valor_formatado(self):
+        """Retorna o valor formatado com a precisão definida"""
+        precisao = self.sensor.precisao
+        return f"{self.valor:.{precisao}f} {self.sensor.tipo.unidade}"
+
+
+class AgregadoLeitura(models.Model):
+    """Resumo (mín/máx/média/contagem/último) das leituras de um sensor por minuto, hora ou dia"""
+    GRANULARIDADES = [
+        ('minuto', 'Minuto'),
+        ('hora', 'Hora'),
+        ('dia', 'Dia'),
+    ]
+
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='agregados', verbose_name='Sensor')
+    granularidade = models.CharField(max_length=10, choices=GRANULARIDADES, verbose_name='Granularidade')
+    inicio = models.DateTimeField(verbose_name='Início do Período')
+    minimo = models.FloatField(verbose_name='Mínimo')
+    maximo = models.FloatField(verbose_name='Máximo')
+    soma = models.FloatField(verbose_name='Soma')
+    contagem = models.PositiveIntegerField(verbose_name='Contagem')
+    ultimo_valor = models.FloatField(verbose_name='Último Valor')
+    ultimo_timestamp = models.DateTimeField(verbose_name='Timestamp do Último Valor')
+
+    class Meta:
+        verbose_name = 'Agregado de Leituras'
+        verbose_name_plural = 'Agregados de Leituras'
+        ordering = ['sensor', 'granularidade', 'inicio']
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'granularidade', 'inicio'], name='agregado_sensor_periodo_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor_id} {self.granularidade} {self.inicio}: média {self.media}"
+
+    @property
+    def media(self):
+        """Retorna a média das leituras do período"""
+        return self.soma / self.contagem if self.contagem else None
+
+
+class Alerta(models.Model):
+    """Período em que as leituras de um sensor ficaram fora da faixa mínimo/máximo"""
+    TIPOS = [
+        ('acima', 'Acima do máximo'),
+        ('abaixo', 'Abaixo do mínimo'),
+    ]
+
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='alertas', verbose_name='Sensor')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='alertas', verbose_name='Usuário')
+    tipo = models.CharField(max_length=10, choices=TIPOS, verbose_name='Tipo')
+    limite = models.FloatField(verbose_name='Limite Ultrapassado')
+    valor_extremo = models.FloatField(verbose_name='Valor Mais Distante do Limite')
+    ultimo_valor = models.FloatField(verbose_name='Último Valor')
+    contagem = models.PositiveIntegerField(default=1, verbose_name='Leituras Fora da Faixa')
+    inicio = models.DateTimeField(verbose_name='Início')
+    ultimo_timestamp = models.DateTimeField(verbose_name='Última Leitura Fora da Faixa')
+    encerrado_em = models.DateTimeField(blank=True, null=True, verbose_name='Encerrado em')
+
+    class Meta:
+        verbose_name = 'Alerta'
+        verbose_name_plural = 'Alertas'
+        ordering = ['-inicio']
+        constraints = [
+            # Deduplicação: no máximo um alerta aberto por sensor
+            models.UniqueConstraint(
+                fields=['sensor'], condition=models.Q(encerrado_em__isnull=True), name='alerta_aberto_unico_por_sensor',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['usuario', '-inicio'], condition=models.Q(encerrado_em__isnull=True), name='alerta_ativo_usuario_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor_id} {self.get_tipo_display()} desde {self.inicio}"
+
+    @property
+    def ativo(self):
+        return self.encerrado_em is None
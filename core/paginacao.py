@@ -0,0 +1,220 @@
+"""Listagem das leituras no admin sem varrer a tabela.
+
+A ChangeList padrão pagina com OFFSET e conta as linhas com ``COUNT(*)``
+a cada página, e a navegação por datas (``date_hierarchy``) busca os anos,
+meses e dias com um ``SELECT DISTINCT`` sobre as leituras filtradas. Com
+milhões de leituras cada uma dessas consultas leva segundos.
+
+``ChangeListLeituras`` troca isso por:
+
+* paginação por chave em ``(timestamp, id)``: o parâmetro ``apos`` guarda a
+  última leitura da página e a próxima começa logo depois dela, pelo índice
+  ``(-timestamp, -id)``. Ao ordenar por outra coluna volta à paginação por
+  número de página;
+* total estimado: sem busca nem filtros de período, a soma dos contadores
+  ``UltimaLeitura.total_leituras`` dos sensores filtrados (dono, tipo,
+  ambiente); nos demais casos um ``COUNT`` limitado a ``LIMITE_CONTAGEM``
+  linhas, guardado em cache por ``CACHE_TIMEOUT`` segundos;
+* navegação por datas montada a partir da primeira e da última leitura
+  (duas buscas no índice de timestamp). Os períodos entre elas aparecem
+  mesmo que não tenham leituras.
+"""
+import calendar
+import datetime
+import hashlib
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db.models import Q, Sum
+from django.utils import formats, timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+from django.utils.text import capfirst
+from django.utils.translation import gettext
+
+from .models import Sensor, UltimaLeitura
+
+
+CURSOR_VAR = 'apos'
+LIMITE_CONTAGEM = 10000
+CACHE_TIMEOUT = 60
+# Filtros que restringem só os sensores: o total sai dos contadores de UltimaLeitura
+FILTROS_SENSOR = {
+    'sensor__tipo__id__exact': 'tipo_id',
+    'sensor__ambiente__id__exact': 'ambiente_id',
+}
+
+
+def formatar_cursor(leitura):
+    return f'{leitura.timestamp.isoformat()}_{leitura.pk}'
+
+
+def ler_cursor(valor):
+    """(timestamp, id) do parâmetro ``apos``; IncorrectLookupParameters se inválido"""
+    texto, _, pk = valor.replace(' ', '+').rpartition('_')
+    try:
+        momento = parse_datetime(texto)
+        pk = int(pk)
+    except ValueError:
+        momento = None
+    if momento is None:
+        raise IncorrectLookupParameters(f'Parâmetro "{CURSOR_VAR}" inválido.')
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento, datetime.timezone.utc)
+    return momento, pk
+
+
+class ChangeListLeituras(ChangeList):
+    """ChangeList com paginação por chave, total estimado e navegação por datas sem DISTINCT"""
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filtros, ordenação e datas sempre recomeçam da primeira página
+        if not new_params or CURSOR_VAR not in new_params:
+            remove = [*(remove or []), CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    @property
+    def paginacao_por_chave(self):
+        return ORDER_VAR not in self.params
+
+    def get_results(self, request):
+        self.result_count, self.prefixo_total = self.estimar_total(request)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.proxima_pagina = self.pagina_inicial = None
+        if self.paginacao_por_chave:
+            self._pagina_por_chave()
+            return
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        paginator.count = self.result_count
+        self.multi_page = self.result_count > self.list_per_page
+        try:
+            self.result_list = paginator.page(self.page_num).object_list
+        except InvalidPage:
+            raise IncorrectLookupParameters
+        self.paginator = paginator
+
+    def _pagina_por_chave(self):
+        qs = self.queryset.order_by('-timestamp', '-pk')
+        cursor = self.params.get(CURSOR_VAR)
+        if cursor:
+            momento, pk = ler_cursor(cursor)
+            # O timestamp__lte delimita a faixa no índice; o Q desempata leituras no mesmo instante
+            qs = qs.filter(Q(timestamp__lt=momento) | Q(timestamp=momento, pk__lt=pk), timestamp__lte=momento)
+        linhas = list(qs[:self.list_per_page + 1])
+        self.result_list = linhas[:self.list_per_page]
+        if len(linhas) > self.list_per_page:
+            self.proxima_pagina = self.get_query_string({CURSOR_VAR: formatar_cursor(self.result_list[-1])})
+        self.pagina_inicial = self.get_query_string() if cursor else None
+        # Sem números de página: os links ficam no pagination.html das leituras
+        self.multi_page = False
+
+    def estimar_total(self, request):
+        """(total, prefixo exibido antes dele no rodapé: '', 'cerca de' ou 'mais de')"""
+        filtros = self.get_filters_params()
+        if not self.query and set(filtros) <= set(FILTROS_SENSOR):
+            sensores = Sensor.objects.all()
+            if not request.user.is_superuser:
+                sensores = sensores.filter(usuario=request.user)
+            try:
+                sensores = sensores.filter(**{
+                    FILTROS_SENSOR[chave]: int(valores[-1]) for chave, valores in filtros.items()
+                })
+            except ValueError:
+                raise IncorrectLookupParameters
+            total = UltimaLeitura.objects.filter(sensor__in=sensores).aggregate(total=Sum('total_leituras'))['total']
+            return total or 0, 'cerca de' if total else ''
+
+        chave = 'core:admin_leituras:' + hashlib.md5(urlencode(sorted(
+            [(nome, valores) for nome, valores in filtros.items()]
+            + [('q', self.query), ('usuario', '' if request.user.is_superuser else request.user.pk)]
+        ), doseq=True).encode()).hexdigest()
+        total = cache.get(chave)
+        if total is None:
+            total = self.queryset.order_by()[:LIMITE_CONTAGEM + 1].count()
+            cache.set(chave, total, CACHE_TIMEOUT)
+        return min(total, LIMITE_CONTAGEM), 'mais de' if total > LIMITE_CONTAGEM else ''
+
+
+def _extremos(queryset, campo):
+    """Primeiro e último valor do campo, cada um com uma busca ordenada pelo índice"""
+    valores = [
+        queryset.order_by(ordem).values_list(campo, flat=True).first()
+        for ordem in (campo, '-' + campo)
+    ]
+    return [timezone.localtime(valor) if valor and timezone.is_aware(valor) else valor for valor in valores]
+
+
+def hierarquia_datas(cl):
+    """Mesmo contexto de admin/date_hierarchy.html que o date_hierarchy do Django, sem SELECT DISTINCT"""
+    campo = cl.date_hierarchy
+    campo_ano, campo_mes, campo_dia = f'{campo}__year', f'{campo}__month', f'{campo}__day'
+    ano, mes, dia = (cl.params.get(nome) for nome in (campo_ano, campo_mes, campo_dia))
+
+    def link(filtros):
+        return cl.get_query_string(filtros, [f'{campo}__'])
+
+    if ano and mes and dia:
+        data = datetime.date(int(ano), int(mes), int(dia))
+        return {
+            'show': True,
+            'back': {
+                'link': link({campo_ano: ano, campo_mes: mes}),
+                'title': capfirst(formats.date_format(data, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(data, 'MONTH_DAY_FORMAT'))}],
+        }
+
+    primeiro, ultimo = _extremos(cl.queryset, campo)
+    if primeiro is None:
+        return {'show': False}
+    if not ano and primeiro.year == ultimo.year:
+        ano = primeiro.year
+        if primeiro.month == ultimo.month:
+            mes = primeiro.month
+
+    if ano and mes:
+        ano, mes = int(ano), int(mes)
+        inicio = primeiro.day if (primeiro.year, primeiro.month) == (ano, mes) else 1
+        fim = ultimo.day if (ultimo.year, ultimo.month) == (ano, mes) else calendar.monthrange(ano, mes)[1]
+        return {
+            'show': True,
+            'back': {'link': link({campo_ano: ano}), 'title': str(ano)},
+            'choices': [
+                {
+                    'link': link({campo_ano: ano, campo_mes: mes, campo_dia: d}),
+                    'title': capfirst(formats.date_format(datetime.date(ano, mes, d), 'MONTH_DAY_FORMAT')),
+                }
+                for d in range(inicio, fim + 1)
+            ],
+        }
+    if ano:
+        ano = int(ano)
+        inicio = primeiro.month if primeiro.year == ano else 1
+        fim = ultimo.month if ultimo.year == ano else 12
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': gettext('All dates')},
+            'choices': [
+                {
+                    'link': link({campo_ano: ano, campo_mes: m}),
+                    'title': capfirst(formats.date_format(datetime.date(ano, m, 1), 'YEAR_MONTH_FORMAT')),
+                }
+                for m in range(inicio, fim + 1)
+            ],
+        }
+    return {
+        'show': True,
+        'back': None,
+        'choices': [{'link': link({campo_ano: a}), 'title': str(a)} for a in range(primeiro.year, ultimo.year + 1)],
+    }
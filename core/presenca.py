@@ -0,0 +1,106 @@
+"""Buffer em memória dos heartbeats dos dispositivos.
+
+Cada heartbeat só registra o momento do contato em um dicionário; uma
+thread grava o que foi acumulado a cada ``IOT_HEARTBEAT_FLUSH_SEGUNDOS``
+com um único UPDATE por bloco de dispositivos, em vez de um UPDATE por
+ping.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, F, Q, Value, When
+from django.utils import timezone
+
+from .models import Dispositivo
+
+
+TAMANHO_BLOCO = 500
+
+logger = logging.getLogger(__name__)
+
+
+class BufferPresenca:
+    """Acumula o último contato de cada MAC e grava tudo periodicamente"""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._contatos = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._parar = threading.Event()
+
+    def registrar(self, macs, momento=None):
+        """Registra um contato para cada MAC; nada é gravado no banco aqui"""
+        momento = momento or timezone.now()
+        with self._lock:
+            for mac in macs:
+                self._contatos[mac] = momento
+        self._iniciar()
+
+    @property
+    def pendentes(self):
+        return len(self._contatos)
+
+    def gravar(self):
+        """Grava os contatos acumulados; retorna quantos dispositivos foram atualizados.
+
+        Um contato acumulado nunca faz ``ultimo_contato`` retroceder: a ingestão
+        pode ter gravado um contato mais recente depois do heartbeat.
+        """
+        with self._lock:
+            contatos, self._contatos = self._contatos, {}
+        if not contatos:
+            return 0
+        atualizados = 0
+        itens = list(contatos.items())
+        for i in range(0, len(itens), TAMANHO_BLOCO):
+            bloco = itens[i:i + TAMANHO_BLOCO]
+            atualizados += Dispositivo.objects.filter(mac_address__in=[mac for mac, _ in bloco]).update(
+                ultimo_contato=Case(
+                    *(
+                        When(
+                            Q(ultimo_contato__isnull=True) | Q(ultimo_contato__lt=momento),
+                            mac_address=mac, then=Value(momento),
+                        )
+                        for mac, momento in bloco
+                    ),
+                    default=F('ultimo_contato'),
+                    output_field=DateTimeField(),
+                )
+            )
+        return atualizados
+
+    def _iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name='iot-presenca', daemon=True)
+                self._thread.start()
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            close_old_connections()
+            try:
+                self.gravar()
+            except Exception:
+                # Os contatos deste ciclo se perdem, mas o próximo heartbeat os repõe
+                logger.exception('Falha ao gravar os contatos acumulados dos dispositivos')
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def buffer_presenca():
+    """Retorna o buffer de presença do processo, criando-o no primeiro uso"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = BufferPresenca(getattr(settings, 'IOT_HEARTBEAT_FLUSH_SEGUNDOS', 5))
+                atexit.register(_buffer.gravar)
+    return _buffer
@@ -0,0 +1,299 @@
+"""Cadastro em lote de dispositivos e sensores a partir de um manifesto.
+
+O manifesto pode ser JSON (lista de dispositivos, ou objeto com a chave
+``dispositivos``)::
+
+    [{"mac": "24:6F:28:AB:12:34", "nome": "ESP32 Estufa 1", "tipo": "sensor",
+      "modelo": "ESP32-WROOM-32", "fabricante": "Espressif", "ambiente": "Estufa",
+      "firmware": "1.4.2",
+      "sensores": ["Temperatura", {"tipo": "Umidade", "valor_minimo": 20, "valor_maximo": 90}]}]
+
+ou CSV com uma linha por sensor, repetindo as colunas do dispositivo::
+
+    mac,nome,tipo,modelo,fabricante,ambiente,firmware,sensor_tipo,sensor_nome,valor_minimo,valor_maximo,precisao
+
+Tudo é validado em memória antes de gravar, contra uma consulta de cada:
+MACs já cadastrados, tipos de sensor e ambientes do usuário. Com erros nada
+é gravado. Ambientes que não existem são criados. Os sensores recebem os
+slots do formato binário na ordem em que aparecem no manifesto (0, 1, ...). Os dispositivos e seus
+sensores são gravados com ``bulk_create`` em transações de
+``TAMANHO_BLOCO`` dispositivos.
+"""
+import csv
+import io
+import json
+import re
+
+from django.db import DatabaseError, transaction
+
+from .estatisticas import invalidar_estatisticas
+from .models import SLOT_MAXIMO, Ambiente, Dispositivo, Sensor, TipoSensor, normalizar_mac
+
+
+TAMANHO_BLOCO = 500
+MAC_VALIDO = re.compile(r'^[0-9A-F]{2}(:[0-9A-F]{2}){5}$')
+CAMPOS_DISPOSITIVO = ['nome', 'tipo', 'modelo', 'fabricante', 'ambiente', 'firmware']
+
+
+class ManifestoInvalido(Exception):
+    """O arquivo não pôde ser lido como manifesto"""
+
+
+class AplicacaoInterrompida(Exception):
+    """Um bloco falhou ao gravar; os anteriores ficaram gravados.
+
+    ``gravados`` é quantos dispositivos foram gravados e ``tokens`` os
+    [(mac, token)] deles, que não podem ser gerados de novo; a causa fica em
+    ``__cause__``.
+    """
+
+    def __init__(self, mensagem, gravados, tokens):
+        super().__init__(mensagem)
+        self.gravados = gravados
+        self.tokens = tokens
+
+
+def ler_manifesto(conteudo, formato):
+    """Retorna a lista de dispositivos do manifesto ('json' ou 'csv'); cada um com a linha/posição de origem"""
+    if isinstance(conteudo, bytes):
+        try:
+            conteudo = conteudo.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ManifestoInvalido('O manifesto deve estar em UTF-8.')
+    if formato == 'json':
+        return _ler_json(conteudo)
+    if formato == 'csv':
+        return _ler_csv(conteudo)
+    raise ManifestoInvalido(f'Formato desconhecido: {formato}. Use json ou csv.')
+
+
+def _ler_json(conteudo):
+    try:
+        dados = json.loads(conteudo)
+    except ValueError as erro:
+        raise ManifestoInvalido(f'JSON inválido: {erro}')
+    if isinstance(dados, dict):
+        dados = dados.get('dispositivos')
+    if not isinstance(dados, list):
+        raise ManifestoInvalido('Esperada uma lista de dispositivos (ou um objeto com a chave "dispositivos").')
+
+    entradas = []
+    for posicao, item in enumerate(dados, start=1):
+        if not isinstance(item, dict):
+            raise ManifestoInvalido(f'Dispositivo {posicao} não é um objeto.')
+        sensores = item.get('sensores') or []
+        if not isinstance(sensores, list):
+            raise ManifestoInvalido(f'Dispositivo {posicao}: "sensores" deve ser uma lista.')
+        entradas.append({
+            'linha': posicao,
+            'mac': item.get('mac'),
+            **{campo: item.get(campo) for campo in CAMPOS_DISPOSITIVO},
+            'sensores': [sensor if isinstance(sensor, dict) else {'tipo': sensor} for sensor in sensores],
+            'conflitos': [],
+        })
+    return entradas
+
+
+def _ler_csv(conteudo):
+    leitor = csv.DictReader(io.StringIO(conteudo))
+    if not leitor.fieldnames or 'mac' not in leitor.fieldnames:
+        raise ManifestoInvalido('O CSV precisa de um cabeçalho com a coluna "mac".')
+
+    por_mac = {}
+    for linha in leitor:
+        valores = {chave: (valor or '').strip() for chave, valor in linha.items() if chave}
+        mac = normalizar_mac(valores.get('mac', ''))
+        entrada = por_mac.get(mac)
+        if entrada is None:
+            entrada = por_mac[mac] = {
+                'linha': leitor.line_num,
+                'mac': valores.get('mac'),
+                **{campo: valores.get(campo) or None for campo in CAMPOS_DISPOSITIVO},
+                'sensores': [],
+                'conflitos': [],
+            }
+        else:
+            for campo in CAMPOS_DISPOSITIVO:
+                if valores.get(campo) and valores[campo] != entrada[campo]:
+                    entrada['conflitos'].append(
+                        f'Linha {leitor.line_num}: "{campo}" diferente da linha {entrada["linha"]} para o mesmo MAC.'
+                    )
+        if valores.get('sensor_tipo'):
+            entrada['sensores'].append({
+                'tipo': valores['sensor_tipo'],
+                'nome': valores.get('sensor_nome') or None,
+                'valor_minimo': valores.get('valor_minimo') or None,
+                'valor_maximo': valores.get('valor_maximo') or None,
+                'precisao': valores.get('precisao') or None,
+            })
+    return list(por_mac.values())
+
+
+class Plano:
+    """Resultado da validação: o que será criado, o que já existe e os erros"""
+
+    def __init__(self):
+        self.dispositivos = []  # (Dispositivo, nome do ambiente, [Sensor]) ainda não gravados
+        self.ambientes_novos = []
+        self.existentes = []
+        self.erros = []
+
+    @property
+    def total_sensores(self):
+        return sum(len(sensores) for _, _, sensores in self.dispositivos)
+
+    def resumo(self):
+        return (
+            f'{len(self.dispositivos)} dispositivos e {self.total_sensores} sensores a criar, '
+            f'{len(self.ambientes_novos)} ambientes novos, {len(self.existentes)} MACs já cadastrados ignorados, '
+            f'{len(self.erros)} erros'
+        )
+
+
+def _texto(valor, tamanho, campo, erros):
+    if valor is None or valor == '':
+        return None
+    valor = str(valor).strip()
+    if len(valor) > tamanho:
+        erros.append(f'"{campo}" tem mais de {tamanho} caracteres.')
+    return valor
+
+
+def _numero(valor, campo, erros, tipo=float):
+    if valor is None or valor == '':
+        return None
+    try:
+        if isinstance(valor, bool):
+            raise ValueError
+        return tipo(valor)
+    except (TypeError, ValueError):
+        erros.append(f'"{campo}" deve ser numérico.')
+        return None
+
+
+def validar_manifesto(entradas, usuario, ignorar_existentes=False):
+    """Valida o manifesto para o usuário e monta o plano de criação, sem gravar nada"""
+    plano = Plano()
+    macs = {normalizar_mac(entrada['mac']) for entrada in entradas if entrada['mac']}
+    cadastrados = set()
+    lista_macs = list(macs)
+    for i in range(0, len(lista_macs), TAMANHO_BLOCO):
+        cadastrados.update(
+            Dispositivo.objects.filter(mac_address__in=lista_macs[i:i + TAMANHO_BLOCO]).values_list('mac_address', flat=True)
+        )
+    tipos_sensor = {tipo.nome: tipo for tipo in TipoSensor.objects.all()}
+    ambientes = set(Ambiente.objects.filter(usuario=usuario).values_list('nome', flat=True))
+    tipos_dispositivo = dict(Dispositivo.TIPOS_DISPOSITIVO)
+
+    vistos = set()
+    for entrada in entradas:
+        erros = list(entrada['conflitos'])
+        mac = normalizar_mac(entrada['mac'] or '')
+        if not MAC_VALIDO.match(mac):
+            erros.append(f'MAC inválido: "{entrada["mac"] or ""}".')
+        elif mac in vistos:
+            erros.append('MAC repetido no manifesto.')
+        elif mac in cadastrados:
+            if ignorar_existentes:
+                plano.existentes.append(mac)
+                vistos.add(mac)
+                continue
+            erros.append('MAC já cadastrado.')
+        vistos.add(mac)
+
+        tipo = entrada['tipo'] or 'sensor'
+        if tipo not in tipos_dispositivo:
+            erros.append(f'Tipo de dispositivo inválido: "{tipo}". Use um de: {", ".join(tipos_dispositivo)}.')
+        ambiente = _texto(entrada['ambiente'], 100, 'ambiente', erros)
+        if not ambiente:
+            erros.append('"ambiente" é obrigatório.')
+        modelo = _texto(entrada['modelo'], 100, 'modelo', erros)
+        nome = _texto(entrada['nome'], 100, 'nome', erros) or (f'{modelo} {mac}' if modelo else mac)[:100]
+        dispositivo = Dispositivo(
+            nome=nome,
+            tipo=tipo,
+            modelo=modelo,
+            fabricante=_texto(entrada['fabricante'], 100, 'fabricante', erros),
+            firmware_versao=_texto(entrada['firmware'], 50, 'firmware', erros),
+            mac_address=mac,
+            usuario=usuario,
+        )
+
+        sensores = []
+        tipos_usados = set()
+        for sensor in entrada['sensores']:
+            tipo_sensor = tipos_sensor.get(str(sensor.get('tipo') or '').strip())
+            if tipo_sensor is None:
+                erros.append(f'Tipo de sensor desconhecido: "{sensor.get("tipo") or ""}".')
+                continue
+            if tipo_sensor.nome in tipos_usados:
+                # unique_together (dispositivo, tipo)
+                erros.append(f'Sensor "{tipo_sensor.nome}" repetido no dispositivo.')
+                continue
+            tipos_usados.add(tipo_sensor.nome)
+            minimo = _numero(sensor.get('valor_minimo'), 'valor_minimo', erros)
+            maximo = _numero(sensor.get('valor_maximo'), 'valor_maximo', erros)
+            if minimo is not None and maximo is not None and minimo > maximo:
+                erros.append(f'Sensor "{tipo_sensor.nome}": valor_minimo maior que valor_maximo.')
+            precisao = _numero(sensor.get('precisao'), 'precisao', erros, int)
+            if precisao is not None and precisao < 0:
+                erros.append(f'Sensor "{tipo_sensor.nome}": precisao não pode ser negativa.')
+            sensores.append(Sensor(
+                nome=(_texto(sensor.get('nome'), 100, 'sensor_nome', erros) or f'{tipo_sensor.nome} - {nome}')[:100],
+                tipo=tipo_sensor,
+                usuario=usuario,
+                valor_minimo=minimo,
+                valor_maximo=maximo,
+                precisao=2 if precisao is None else precisao,
+                slot=len(sensores),
+            ))
+        # bulk_create não passa pelos validadores do modelo: o slot (0 a SLOT_MAXIMO) é conferido aqui
+        if len(sensores) > SLOT_MAXIMO + 1:
+            erros.append(f'O dispositivo tem {len(sensores)} sensores; o máximo é {SLOT_MAXIMO + 1}.')
+
+        if erros:
+            plano.erros.extend((entrada['linha'], entrada['mac'] or '', erro) for erro in erros)
+            continue
+        if ambiente not in ambientes and ambiente not in plano.ambientes_novos:
+            plano.ambientes_novos.append(ambiente)
+        plano.dispositivos.append((dispositivo, ambiente, sensores))
+    return plano
+
+
+def aplicar_plano(plano, usuario, gerar_tokens=False):
+    """Grava o plano validado; retorna [(mac, token)] dos dispositivos criados quando gerar_tokens.
+
+    Se um bloco falhar, levanta AplicacaoInterrompida com os tokens dos blocos já gravados.
+    """
+    with transaction.atomic():
+        Ambiente.objects.bulk_create([Ambiente(nome=nome, usuario=usuario) for nome in plano.ambientes_novos])
+    nomes = {ambiente.nome: ambiente for ambiente in Ambiente.objects.filter(usuario=usuario)}
+
+    tokens = []
+    gravados = 0
+    try:
+        for i in range(0, len(plano.dispositivos), TAMANHO_BLOCO):
+            bloco = plano.dispositivos[i:i + TAMANHO_BLOCO]
+            do_bloco = []
+            for dispositivo, ambiente, _ in bloco:
+                dispositivo.ambiente = nomes[ambiente]
+                if gerar_tokens:
+                    do_bloco.append((dispositivo.mac_address, dispositivo.gerar_token()))
+            with transaction.atomic():
+                Dispositivo.objects.bulk_create([dispositivo for dispositivo, _, _ in bloco])
+                sensores = []
+                for dispositivo, _, do_dispositivo in bloco:
+                    for sensor in do_dispositivo:
+                        sensor.dispositivo = dispositivo
+                        sensor.ambiente = dispositivo.ambiente
+                        sensores.append(sensor)
+                Sensor.objects.bulk_create(sensores, batch_size=TAMANHO_BLOCO)
+            # Só os tokens de blocos gravados valem
+            tokens.extend(do_bloco)
+            gravados += len(bloco)
+    except DatabaseError as erro:
+        raise AplicacaoInterrompida(str(erro), gravados, tokens) from erro
+    finally:
+        # bulk_create não dispara os sinais que invalidam o dashboard
+        invalidar_estatisticas(usuario.pk)
+    return tokens
@@ -0,0 +1,228 @@
+"""Cache em memória das leituras mais recentes de cada sensor.
+
+Cada sensor em cache tem um buffer circular com as últimas
+``IOT_CACHE_RECENTES_LEITURAS`` leituras, guardadas em ``array`` (id,
+timestamp em µs e valor: 24 bytes por leitura, sem um objeto Python por
+leitura). O número de sensores é limitado pelo orçamento
+``IOT_CACHE_RECENTES_MB``; ao passar dele, sai o sensor usado há mais tempo
+(LRU).
+
+A ingestão acrescenta as leituras gravadas aos sensores que já estão em
+cache. Um sensor fora do cache é carregado na primeira consulta com uma
+busca no índice ``(sensor, timestamp)``. Como leituras podem ser gravadas
+por outros processos, um buffer consultado mais de
+``IOT_CACHE_RECENTES_SEGUNDOS`` depois da última verificação busca as
+leituras com id acima do último visto, uma consulta curta pelo índice do
+sensor.
+
+O cache é por processo; ``estatisticas()`` traz acertos e faltas, também
+exportados em /metrics.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from sistema_iot.metricas import registro
+
+from .arquivo import para_microssegundos
+from .models import LeituraSensor
+
+
+BYTES_POR_LEITURA = 24
+
+
+class BufferCircular:
+    """Últimas ``capacidade`` leituras de um sensor, da mais antiga para a mais recente"""
+
+    __slots__ = ('capacidade', 'ids', 'momentos', 'valores', 'inicio', 'tamanho', 'ultimo_id', 'verificado_em')
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self.ids = array('q', bytes(8 * capacidade))
+        self.momentos = array('q', bytes(8 * capacidade))
+        self.valores = array('d', bytes(8 * capacidade))
+        self.inicio = 0
+        self.tamanho = 0
+        self.ultimo_id = 0
+        self.verificado_em = time.monotonic()
+
+    def acrescentar(self, leitura_id, momento, valor):
+        """Acrescenta no fim; retorna False se a leitura é mais antiga que a última (fora de ordem)"""
+        if self.tamanho and momento < self.momentos[(self.inicio + self.tamanho - 1) % self.capacidade]:
+            return False
+        if self.tamanho < self.capacidade:
+            posicao = (self.inicio + self.tamanho) % self.capacidade
+            self.tamanho += 1
+        else:
+            posicao = self.inicio
+            self.inicio = (self.inicio + 1) % self.capacidade
+        self.ids[posicao] = leitura_id
+        self.momentos[posicao] = momento
+        self.valores[posicao] = valor
+        return True
+
+    def _indice(self, posicao):
+        return (self.inicio + posicao) % self.capacidade
+
+    def mais_antigo(self):
+        return self.momentos[self.inicio] if self.tamanho else None
+
+    def ids_desde(self, leitura_id):
+        return {self.ids[self._indice(i)] for i in range(self.tamanho) if self.ids[self._indice(i)] > leitura_id}
+
+    def linhas(self, primeira=0):
+        """Lista de (timestamp em µs, valor) a partir da posição ``primeira``"""
+        return [(self.momentos[self._indice(i)], self.valores[self._indice(i)]) for i in range(primeira, self.tamanho)]
+
+    def posicao(self, momento):
+        """Posição da primeira leitura com timestamp >= momento"""
+        momentos = self.momentos
+        return bisect_left(range(self.tamanho), momento, key=lambda i: momentos[self._indice(i)])
+
+
+class CacheRecentes:
+    """Buffers circulares por sensor com descarte LRU e contadores de acerto/falta"""
+
+    def __init__(self, capacidade, max_sensores, validade):
+        self.capacidade = capacidade
+        self.max_sensores = max(1, max_sensores)
+        self.validade = validade
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.verificacoes = 0
+        self.descartes = 0
+
+    def _carregar(self, sensor_id):
+        linhas = list(
+            LeituraSensor.objects.filter(sensor_id=sensor_id)
+            .order_by('-timestamp', '-id')
+            .values_list('id', 'timestamp', 'valor')[:self.capacidade]
+        )
+        buffer = BufferCircular(self.capacidade)
+        for leitura_id, momento, valor in reversed(linhas):
+            buffer.acrescentar(leitura_id, para_microssegundos(momento), valor)
+        buffer.ultimo_id = max((linha[0] for linha in linhas), default=0)
+        return buffer
+
+    def _verificar(self, sensor_id, buffer):
+        """Acrescenta as leituras gravadas por outros processos desde a última verificação"""
+        linhas = list(
+            LeituraSensor.objects.filter(sensor_id=sensor_id, pk__gt=buffer.ultimo_id)
+            .order_by('timestamp', 'id')
+            .values_list('id', 'timestamp', 'valor')
+        )
+        with self._lock:
+            self.verificacoes += 1
+            conhecidos = buffer.ids_desde(buffer.ultimo_id)
+            for leitura_id, momento, valor in linhas:
+                if leitura_id not in conhecidos and not buffer.acrescentar(leitura_id, para_microssegundos(momento), valor):
+                    return None
+            buffer.ultimo_id = max([buffer.ultimo_id] + [linha[0] for linha in linhas])
+            buffer.verificado_em = time.monotonic()
+        return buffer
+
+    def _buffer(self, sensor_id):
+        """Retorna (buffer atualizado do sensor, se já estava em cache), carregando-o do banco se preciso"""
+        with self._lock:
+            buffer = self._buffers.get(sensor_id)
+            if buffer is not None:
+                self._buffers.move_to_end(sensor_id)
+        em_cache = buffer is not None
+        if em_cache and self.validade is not None and time.monotonic() - buffer.verificado_em > self.validade:
+            buffer = self._verificar(sensor_id, buffer)
+        if buffer is None:
+            buffer = self._carregar(sensor_id)
+            with self._lock:
+                self._buffers[sensor_id] = buffer
+                while len(self._buffers) > self.max_sensores:
+                    self._buffers.popitem(last=False)
+                    self.descartes += 1
+        return buffer, em_cache
+
+    def _contar(self, acerto):
+        if acerto:
+            self.acertos += 1
+        else:
+            self.faltas += 1
+
+    def intervalo(self, sensor_id, inicio, fim):
+        """Leituras em [inicio, fim) como (timestamp em µs, valor), ou None se o buffer não cobre o início.
+
+        O buffer cobre o intervalo quando a leitura mais antiga guardada não
+        é posterior a ``inicio``; fora disso quem chamou deve ir ao banco.
+        """
+        inicio_us, fim_us = para_microssegundos(inicio), para_microssegundos(fim)
+        buffer, em_cache = self._buffer(sensor_id)
+        with self._lock:
+            mais_antigo = buffer.mais_antigo()
+            if mais_antigo is None or mais_antigo > inicio_us:
+                self._contar(False)
+                return None
+            self._contar(em_cache)
+            return [linha for linha in buffer.linhas(buffer.posicao(inicio_us)) if linha[0] < fim_us]
+
+    def registrar(self, leituras):
+        """Acrescenta leituras recém-gravadas aos sensores em cache; os demais são carregados sob demanda"""
+        with self._lock:
+            for leitura in sorted(leituras, key=lambda leitura: leitura.timestamp):
+                buffer = self._buffers.get(leitura.sensor_id)
+                if buffer is None or leitura.pk is None:
+                    continue
+                if not buffer.acrescentar(leitura.pk, para_microssegundos(leitura.timestamp), leitura.valor):
+                    # Leitura fora de ordem: o sensor é recarregado do banco na próxima consulta
+                    del self._buffers[leitura.sensor_id]
+
+    def descartar(self, sensor_id=None):
+        with self._lock:
+            if sensor_id is None:
+                self._buffers.clear()
+            else:
+                self._buffers.pop(sensor_id, None)
+
+    def estatisticas(self):
+        with self._lock:
+            leituras = sum(buffer.tamanho for buffer in self._buffers.values())
+            return {
+                'sensores': len(self._buffers),
+                'max_sensores': self.max_sensores,
+                'leituras': leituras,
+                'bytes': len(self._buffers) * self.capacidade * BYTES_POR_LEITURA,
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+                'verificacoes': self.verificacoes,
+                'descartes': self.descartes,
+            }
+
+    def prometheus(self):
+        dados = self.estatisticas()
+        return [
+            '# TYPE iot_cache_recentes_acertos_total counter',
+            f'iot_cache_recentes_acertos_total {dados["acertos"]}',
+            '# TYPE iot_cache_recentes_faltas_total counter',
+            f'iot_cache_recentes_faltas_total {dados["faltas"]}',
+            '# TYPE iot_cache_recentes_descartes_total counter',
+            f'iot_cache_recentes_descartes_total {dados["descartes"]}',
+            '# TYPE iot_cache_recentes_sensores gauge',
+            f'iot_cache_recentes_sensores {dados["sensores"]}',
+            '# TYPE iot_cache_recentes_bytes gauge',
+            f'iot_cache_recentes_bytes {dados["bytes"]}',
+        ]
+
+
+def _criar_cache():
+    capacidade = getattr(settings, 'IOT_CACHE_RECENTES_LEITURAS', 1000)
+    orcamento = getattr(settings, 'IOT_CACHE_RECENTES_MB', 32) * 1024 * 1024
+    return CacheRecentes(
+        capacidade,
+        orcamento // (capacidade * BYTES_POR_LEITURA),
+        getattr(settings, 'IOT_CACHE_RECENTES_SEGUNDOS', 5),
+    )
+
+
+cache_recentes = _criar_cache()
+registro.registrar_coletor(cache_recentes.prometheus)
@@ -0,0 +1,161 @@
+"""Séries temporais reduzidas para gráficos.
+
+As leituras do intervalo, da tabela quente e do arquivo frio, vêm de
+``arquivo.leituras_no_intervalo`` em ordem cronológica e são reduzidas no
+servidor ao número de pontos pedido, sem carregar o intervalo inteiro em
+memória:
+
+- ``lttb`` (Largest-Triangle-Three-Buckets): um ponto por faixa, o que
+  forma o maior triângulo com o ponto escolhido antes e a média da faixa
+  seguinte; só duas faixas ficam em memória por vez.
+- ``minmax``: o mínimo e o máximo de cada faixa, em ordem de tempo, o que
+  preserva picos isolados.
+
+As faixas têm o mesmo número de leituras; o total vem de um ``count()``
+que percorre só o índice. Intervalos com menos leituras que os pontos
+pedidos são devolvidos sem redução. Intervalos cobertos pelo cache de
+leituras recentes (``core.recentes``) são servidos da memória.
+
+Intervalos longos, com ao menos um minuto por ponto pedido, leem os
+agregados (``core.agregados``) da granularidade mais grossa que ainda tem
+um período por ponto: cada período vira a média no seu início (``lttb``)
+ou o mínimo e o máximo (``minmax``), reduzidos da mesma forma.
+"""
+from django.db.models import Count, Sum
+
+from .agregados import escolher_granularidade, serie_agregada
+from .arquivo import leituras_no_intervalo, para_microssegundos
+from .recentes import cache_recentes
+
+
+METODOS = ('lttb', 'minmax')
+CHUNK_SIZE = 2000
+
+
+def leituras_do_intervalo(sensor_id, inicio, fim):
+    """Retorna (total, gerador de tuplas (timestamp em ms, valor)) do sensor em [inicio, fim), em ordem cronológica"""
+    linhas = cache_recentes.intervalo(sensor_id, inicio, fim)
+    if linhas is None:
+        total, linhas = leituras_no_intervalo(sensor_id, inicio, fim)
+    else:
+        total = len(linhas)
+    return total, ((momento // 1000, valor) for momento, valor in linhas)
+
+
+def periodos_do_intervalo(sensor_id, inicio, fim, granularidade, metodo):
+    """Retorna (leituras resumidas, total de linhas, gerador de tuplas (timestamp em ms, valor)) dos agregados"""
+    agregados = serie_agregada(sensor_id, inicio, fim, granularidade)
+    totais = agregados.aggregate(periodos=Count('pk'), leituras=Sum('contagem'))
+    por_periodo = 2 if metodo == 'minmax' else 1
+
+    def gerar():
+        linhas = agregados.values_list('inicio', 'minimo', 'maximo', 'soma', 'contagem')
+        for momento, minimo, maximo, soma, contagem in linhas.iterator(chunk_size=CHUNK_SIZE):
+            momento = para_microssegundos(momento) // 1000
+            if metodo == 'minmax':
+                yield momento, minimo
+                yield momento, maximo
+            else:
+                yield momento, soma / contagem
+
+    return totais['leituras'] or 0, totais['periodos'] * por_periodo, gerar()
+
+
+def _faixas(linhas, total_linhas, total_faixas):
+    """Agrupa as linhas ordenadas em (índice da faixa, [linhas]) com o mesmo número de linhas por faixa"""
+    atual, grupo = None, []
+    for posicao, linha in enumerate(linhas):
+        # Linhas gravadas depois da contagem caem na última faixa
+        indice = min(total_faixas - 1, posicao * total_faixas // max(1, total_linhas))
+        if indice != atual:
+            if grupo:
+                yield atual, grupo
+            atual, grupo = indice, []
+        grupo.append(linha)
+    if grupo:
+        yield atual, grupo
+
+
+def reduzir_minmax(linhas, total, pontos):
+    """Gera o mínimo e o máximo de cada faixa (até ``pontos`` pontos)"""
+    for _, grupo in _faixas(linhas, total, max(1, pontos // 2)):
+        minimo = min(grupo, key=lambda linha: linha[1])
+        maximo = max(grupo, key=lambda linha: linha[1])
+        if minimo is maximo:
+            yield minimo
+        elif minimo[0] <= maximo[0]:
+            yield minimo
+            yield maximo
+        else:
+            yield maximo
+            yield minimo
+
+
+def _escolher(grupo, anterior, proximo_t, proximo_v):
+    """Retorna o ponto do grupo que forma o maior triângulo com o anterior e o próximo"""
+    ta, va = anterior
+    melhor, maior_area = grupo[0], -1.0
+    for linha in grupo:
+        area = abs((ta - proximo_t) * (linha[1] - va) - (ta - linha[0]) * (proximo_v - va))
+        if area > maior_area:
+            melhor, maior_area = linha, area
+    return melhor
+
+
+def reduzir_lttb(linhas, total, pontos):
+    """Gera até ``pontos`` pontos com o LTTB, mantendo o primeiro e o último"""
+    linhas = iter(linhas)
+    primeiro = next(linhas, None)
+    if primeiro is None:
+        return
+    yield primeiro
+    if pontos < 3:
+        ultimo = None
+        for ultimo in linhas:
+            pass
+        if ultimo is not None and pontos > 1:
+            yield ultimo
+        return
+
+    anterior = primeiro
+    pendente = None
+    for _, grupo in _faixas(linhas, total - 1, pontos - 2):
+        if pendente is not None:
+            proximo_t = sum(linha[0] for linha in grupo) / len(grupo)
+            proximo_v = sum(linha[1] for linha in grupo) / len(grupo)
+            anterior = _escolher(pendente, anterior, proximo_t, proximo_v)
+            yield anterior
+        pendente = grupo
+    if pendente is not None:
+        # A última faixa é reduzida em relação ao último ponto, que sempre entra na série
+        ultimo = pendente[-1]
+        if len(pendente) > 1:
+            yield _escolher(pendente[:-1], anterior, ultimo[0], ultimo[1])
+        yield ultimo
+
+
+def serie_reduzida(sensor, inicio, fim, pontos, metodo='lttb'):
+    """Retorna a série do sensor em [inicio, fim) reduzida a ``pontos`` pontos em listas paralelas"""
+    granularidade = escolher_granularidade(inicio, fim, pontos)
+    if granularidade is None:
+        total, linhas = leituras_do_intervalo(sensor.pk, inicio, fim)
+        leituras = total
+    else:
+        leituras, total, linhas = periodos_do_intervalo(sensor.pk, inicio, fim, granularidade, metodo)
+    if total > pontos:
+        reduzir = reduzir_minmax if metodo == 'minmax' else reduzir_lttb
+        linhas = reduzir(linhas, total, pontos)
+    timestamps, valores = [], []
+    for momento, valor in linhas:
+        timestamps.append(momento)
+        valores.append(round(valor, sensor.precisao))
+    return {
+        'sensor': sensor.pk,
+        'unidade': sensor.tipo.unidade,
+        'metodo': metodo,
+        'granularidade': granularidade,
+        'leituras': leituras,
+        'pontos': len(timestamps),
+        'timestamps': timestamps,
+        'valores': valores,
+    }
@@ -0,0 +1,48 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .alertas import cache_limites
+from .estatisticas import invalidar_estatisticas, invalidar_total_usuarios
+from .ingestao import apos_gravar_leituras
+from .models import Ambiente, Dispositivo, LeituraSensor, Sensor
+from .recentes import cache_recentes
+
+
+@receiver(post_save, sender=LeituraSensor)
+def leitura_criada(sender, instance, created, raw=False, **kwargs):
+    """Mantém valor atual e agregados em dia para leituras criadas fora da ingestão em lote (admin, create())"""
+    if created and not raw:
+        apos_gravar_leituras([instance])
+
+
+@receiver(post_save, sender=Ambiente)
+@receiver(post_delete, sender=Ambiente)
+@receiver(post_save, sender=Dispositivo)
+@receiver(post_delete, sender=Dispositivo)
+@receiver(post_save, sender=Sensor)
+@receiver(post_delete, sender=Sensor)
+def objeto_do_usuario_alterado(sender, instance, **kwargs):
+    """Invalida as estatísticas do dashboard do dono do objeto depois do commit"""
+    # Antes do commit, outra requisição poderia guardar de novo as estatísticas antigas
+    transaction.on_commit(partial(invalidar_estatisticas, instance.usuario_id))
+    if sender is Sensor:
+        cache_limites.invalidar(instance.pk)
+        if kwargs['signal'] is post_delete:
+            cache_recentes.descartar(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def usuario_salvo(sender, instance, created, **kwargs):
+    """Invalida o total de usuários exibido no dashboard quando um usuário é criado"""
+    if created:
+        transaction.on_commit(invalidar_total_usuarios)
+
+
+@receiver(post_delete, sender=User)
+def usuario_removido(sender, instance, **kwargs):
+    """Invalida o total de usuários exibido no dashboard quando um usuário é removido"""
+    transaction.on_commit(invalidar_total_usuarios)
@@ -0,0 +1,12 @@
+from django import template
+
+from core.paginacao import hierarquia_datas
+
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def hierarquia_datas_leituras(cl):
+    """date_hierarchy do admin para a ChangeListLeituras (sem SELECT DISTINCT)"""
+    return hierarquia_datas(cl)
@@ -1,3 +1,1015 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ar_condicionado.models import ArCondicionado
+
+from . import ingestao
+from .agregados import _resumir, inicio_do_periodo
+from .alertas import avaliar_alertas
+from .arquivo import de_microssegundos, leituras_no_intervalo, ler_mes, mes_local, para_microssegundos
+from .binario import CONTENT_TYPE as CONTENT_TYPE_BINARIO, codificar_frame, decodificar, ingerir_binario
+from .escuta import Escuta
+from .eventos import Assinatura, Distribuidor
+from .fila import FalhaGravacao, FilaEscrita, _Pedido
+from .ingestao import LoteInvalido, gravar_leituras, ingerir_lote, parse_lote
+from .presenca import BufferPresenca, buffer_presenca
+from .provisionamento import ler_manifesto, validar_manifesto
+from .recentes import BufferCircular, CacheRecentes, cache_recentes
+from .models import (
+    SLOT_MAXIMO, AgregadoLeitura, Alerta, Ambiente, Dispositivo, LeituraSensor, Sensor, TipoSensor, UltimaLeitura,
+)
+from .series import reduzir_lttb, reduzir_minmax
+
+
+class DadosMixin:
+    """Um usuário com um dispositivo de dois sensores (Temperatura e Umidade)"""
+
+    def setUp(self):
+        cache.clear()
+        # O cache de leituras recentes é do processo: ids reaproveitados entre testes não podem achar buffers antigos
+        cache_recentes.descartar()
+        self.usuario = User.objects.create_user('dono', password='senha')
+        self.ambiente = Ambiente.objects.create(nome='Estufa', usuario=self.usuario)
+        self.temperatura = TipoSensor.objects.create(nome='Temperatura', unidade='°C')
+        self.umidade = TipoSensor.objects.create(nome='Umidade', unidade='%')
+        self.dispositivo = Dispositivo.objects.create(
+            nome='ESP32', tipo='sensor', mac_address='24:6f:28:ab:12:34', ambiente=self.ambiente, usuario=self.usuario,
+        )
+        self.token = self.dispositivo.gerar_token()
+        self.dispositivo.save()
+        self.sensor = self.criar_sensor(self.temperatura, valor_minimo=10, valor_maximo=30, precisao=1)
+        self.sensor_umidade = self.criar_sensor(self.umidade)
+        self.base = timezone.now().replace(second=0, microsecond=0) - timedelta(hours=1)
+
+    def criar_sensor(self, tipo, **campos):
+        return Sensor.objects.create(
+            nome=tipo.nome, tipo=tipo, dispositivo=self.dispositivo, ambiente=self.ambiente, usuario=self.usuario,
+            **campos,
+        )
+
+    def item(self, valor, segundos, tipo='Temperatura'):
+        return {
+            'mac': self.dispositivo.mac_address, 'tipo': tipo, 'valor': valor,
+            'timestamp': (self.base + timedelta(seconds=segundos)).isoformat(),
+        }
+
+    def postar(self, corpo, content_type='application/json', token=None):
+        return self.client.post(
+            reverse('ingerir_leituras'), corpo, content_type=content_type,
+            HTTP_AUTHORIZATION=f'Bearer {token or self.token}',
+        )
+
+
+class IngestaoTests(DadosMixin, TestCase):
+
+    def test_lote_json(self):
+        resposta = self.postar(json.dumps([self.item(20, 0), self.item(22, 30), self.item(55, 60, 'Umidade')]))
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.json()['aceitas'], 3)
+        self.assertEqual(
+            list(LeituraSensor.objects.filter(sensor=self.sensor).order_by('timestamp').values_list('valor', flat=True)),
+            [20, 22],
+        )
+        self.dispositivo.refresh_from_db()
+        self.assertIsNotNone(self.dispositivo.ultimo_contato)
+
+    def test_lote_ndjson(self):
+        corpo = '\n'.join(json.dumps(item) for item in [self.item(20, 0), self.item(21, 1)]) + '\n\n'
+        self.assertEqual(len(parse_lote(corpo, 'application/x-ndjson')), 2)
+        resposta = self.postar(corpo, 'application/x-ndjson')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(LeituraSensor.objects.filter(sensor=self.sensor).count(), 2)
+        with self.assertRaises(LoteInvalido):
+            parse_lote('{"valor": 1}\nnão é json', 'application/x-ndjson')
+
+    def test_itens_invalidos_sao_rejeitados_individualmente(self):
+        resultado = ingerir_lote([self.item(20, 0), self.item('x', 1), self.item(20, 2, 'Pressão')])
+        self.assertEqual((resultado['aceitas'], resultado['rejeitadas']), (1, 2))
+        self.assertEqual(resultado['resultados'][2]['erro'], 'Sensor não encontrado.')
+
+    def test_exige_token_do_dispositivo(self):
+        corpo = json.dumps([self.item(20, 0)])
+        resposta = self.client.post(reverse('ingerir_leituras'), corpo, content_type='application/json')
+        self.assertEqual(resposta.status_code, 401)
+        self.assertEqual(self.postar(corpo, token='invalido').status_code, 401)
+
+        outro = Dispositivo.objects.create(
+            nome='Outro', tipo='sensor', mac_address='24:6F:28:AB:12:35', ambiente=self.ambiente, usuario=self.usuario,
+        )
+        token_outro = outro.gerar_token()
+        outro.save()
+        resposta = self.postar(corpo, token=token_outro)
+        self.assertEqual(resposta.status_code, 422)
+        self.assertEqual(resposta.json()['resultados'][0]['erro'], 'Dispositivo não autorizado para este token.')
+
+    def test_repetidas_ignoradas_por_padrao(self):
+        ingerir_lote([self.item(20, 0), self.item(22, 30)])
+        resultado = ingerir_lote([self.item(25, 0), self.item(25, 0), self.item(23, 60)])
+        self.assertEqual(resultado['aceitas'], 3)
+        self.assertEqual(LeituraSensor.objects.filter(sensor=self.sensor).count(), 3)
+        self.assertEqual(LeituraSensor.objects.get(sensor=self.sensor, timestamp=self.base).valor, 20)
+        self.assertEqual(UltimaLeitura.objects.get(sensor=self.sensor).total_leituras, 3)
+        agregado = AgregadoLeitura.objects.get(sensor=self.sensor, granularidade='dia')
+        self.assertEqual((agregado.contagem, agregado.maximo), (3, 23))
+
+    @override_settings(IOT_INGESTAO_REPETIDAS='atualizar')
+    def test_repetidas_atualizam_valor_e_derivados(self):
+        ingerir_lote([self.item(20, 0), self.item(22, 30)])
+        ingerir_lote([self.item(28, 30), self.item(12, 0)])
+        self.assertEqual(LeituraSensor.objects.get(sensor=self.sensor, timestamp=self.base).valor, 12)
+        ultima = UltimaLeitura.objects.get(sensor=self.sensor)
+        self.assertEqual((ultima.valor, ultima.total_leituras), (28, 2))
+        for agregado in AgregadoLeitura.objects.filter(sensor=self.sensor):
+            self.assertEqual(agregado.contagem, 2)
+        dia = AgregadoLeitura.objects.get(sensor=self.sensor, granularidade='dia')
+        self.assertEqual((dia.minimo, dia.maximo, dia.soma), (12, 28, 40))
+
+    def test_conflito_conta_so_as_gravadas_por_este_lote(self):
+        ingerir_lote([self.item(20, 0), self.item(21, 1)])
+        separar = ingestao.separar_repetidas
+        chamadas = []
+
+        def sem_ver_as_gravadas(leituras):
+            # Simula outro processo gravando entre a consulta das repetidas e o INSERT
+            chamadas.append(len(leituras))
+            return (list(leituras), []) if len(chamadas) == 1 else separar(leituras)
+
+        leituras = [
+            LeituraSensor(sensor=self.sensor, valor=v, timestamp=self.base + timedelta(seconds=s))
+            for v, s in [(20, 0), (21, 1), (22, 2)]
+        ]
+        with mock.patch.object(ingestao, 'separar_repetidas', sem_ver_as_gravadas):
+            novas = gravar_leituras(leituras, {self.dispositivo.pk})
+        self.assertEqual(novas, 1)
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(UltimaLeitura.objects.get(sensor=self.sensor).total_leituras, 3)
+        self.assertEqual(AgregadoLeitura.objects.get(sensor=self.sensor, granularidade='dia').contagem, 3)
+
+    def test_copia_congelada_da_migracao_resume_como_core_agregados(self):
+        migracao = import_module('core.migrations.0010_leitura_unica_por_sensor_timestamp')
+        leituras = [
+            (sensor_id, valor, self.base + timedelta(seconds=segundos))
+            for sensor_id in (self.sensor.pk, self.sensor_umidade.pk)
+            for valor, segundos in [(20, 0), (18.5, 45), (25, 30), (22, 3700), (19, 90000), (21, 90000)]
+        ]
+        for granularidade in migracao.GRANULARIDADES:
+            with self.subTest(granularidade=granularidade):
+                self.assertEqual(migracao.resumir(leituras, granularidade), _resumir(leituras, granularidade))
+
+
+class UltimaLeituraTests(DadosMixin, TestCase):
+
+    def test_lote_fora_de_ordem_nao_faz_o_valor_atual_retroceder(self):
+        ingerir_lote([self.item(20, 0), self.item(22, 60)])
+        ingerir_lote([self.item(18, 30)])
+        ultima = UltimaLeitura.objects.get(sensor=self.sensor)
+        self.assertEqual((ultima.valor, ultima.timestamp, ultima.total_leituras), (22, self.base + timedelta(seconds=60), 3))
+
+        ingerir_lote([self.item(25, 90)])
+        self.sensor = Sensor.objects.select_related('leitura_atual').get(pk=self.sensor.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual((self.sensor.ultima_leitura.valor, self.sensor.total_leituras), (25, 4))
+
+    def test_leitura_criada_fora_do_lote(self):
+        self.assertIsNone(self.sensor.ultima_leitura)
+        self.assertEqual(self.sensor.total_leituras, 0)
+        LeituraSensor.objects.create(sensor=self.sensor, valor=21, timestamp=self.base)
+        ultima = UltimaLeitura.objects.get(sensor=self.sensor)
+        self.assertEqual((ultima.valor, ultima.total_leituras), (21, 1))
+
+
+class AgregadosTests(DadosMixin, TestCase):
+
+    def test_lote_mesclado_em_minuto_hora_e_dia(self):
+        self.base = inicio_do_periodo(self.base, 'hora')
+        ingerir_lote([self.item(20, 0), self.item(24, 30)])
+        ingerir_lote([self.item(22, 90)])
+        minutos = AgregadoLeitura.objects.filter(sensor=self.sensor, granularidade='minuto').order_by('inicio')
+        self.assertEqual(
+            [(agregado.contagem, agregado.minimo, agregado.maximo, agregado.ultimo_valor) for agregado in minutos],
+            [(2, 20, 24, 24), (1, 22, 22, 22)],
+        )
+        for granularidade in ('hora', 'dia'):
+            agregado = AgregadoLeitura.objects.get(sensor=self.sensor, granularidade=granularidade)
+            self.assertEqual((agregado.contagem, agregado.media, agregado.ultimo_valor), (3, 22, 22))
+
+    def test_intervalo_longo_le_os_agregados(self):
+        self.client.force_login(self.usuario)
+        horas = range(0, 200, 7)
+        ingerir_lote([self.item(10 + hora % 5, -3600 * hora) for hora in horas])
+        # Sem as leituras, a série só pode vir dos agregados
+        LeituraSensor.objects.filter(sensor=self.sensor).delete()
+
+        fim = timezone.now()
+        resposta = self.client.get(reverse('sensor_serie', args=[self.sensor.pk]), {
+            'from': (fim - timedelta(days=10)).isoformat(), 'to': fim.isoformat(), 'points': 100,
+        })
+        serie = resposta.json()
+        self.assertEqual((serie['granularidade'], serie['leituras']), ('hora', len(horas)))
+        self.assertEqual(serie['valores'], [10 + hora % 5 for hora in reversed(horas)])
+
+
+class AdminListagensTests(DadosMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='senha'))
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, len(consultas)
+
+    def test_contagens_dos_ambientes_na_consulta_da_listagem(self):
+        url = reverse('admin:core_ambiente_changelist')
+        _, antes = self.consultas(url)
+        for numero in range(5):
+            ambiente = Ambiente.objects.create(nome=f'Sala {numero}', usuario=self.usuario)
+            Dispositivo.objects.create(
+                nome=f'D{numero}', tipo='sensor', mac_address=f'02:00:00:00:00:{numero:02X}', ambiente=ambiente,
+                usuario=self.usuario,
+            )
+        resposta, depois = self.consultas(url + '?o=-4')
+        self.assertEqual(depois, antes)
+        primeiro = resposta.context['cl'].result_list[0]
+        self.assertEqual((primeiro.nome, primeiro.num_dispositivos, primeiro.num_sensores), ('Estufa', 1, 2))
+
+    def test_total_de_leituras_dos_sensores_sem_consulta_por_linha(self):
+        ingerir_lote([self.item(20, 0), self.item(21, 1), self.item(50, 0, 'Umidade')])
+        url = reverse('admin:core_sensor_changelist')
+        _, antes = self.consultas(url)
+        for tipo in ('Vento', 'Chuva', 'Pressão'):
+            self.criar_sensor(TipoSensor.objects.create(nome=tipo, unidade='-'))
+        resposta, depois = self.consultas(url + '?o=-6')
+        self.assertEqual(depois, antes)
+        self.assertEqual(
+            [(sensor.nome, sensor.total_leituras) for sensor in resposta.context['cl'].result_list[:2]],
+            [('Temperatura', 2), ('Umidade', 1)],
+        )
+
+
+class DashboardTests(DadosMixin, TestCase):
+
+    def estatisticas(self):
+        return self.client.get(reverse('dashboard')).context['estatisticas']
+
+    def test_estatisticas_em_cache_ate_o_commit_de_uma_alteracao(self):
+        self.usuario.is_staff = True
+        self.usuario.save()
+        self.client.force_login(self.usuario)
+        ingerir_lote([self.item(20, 0)])
+        estatisticas = self.estatisticas()
+        self.assertEqual((estatisticas['total_sensores'], estatisticas['total_usuarios']), (2, 1))
+        self.assertEqual([leitura['valor'] for leitura in estatisticas['leituras_recentes']], ['20.0 °C'])
+
+        # Sem o commit (o TestCase não confirma a transação) o cache continua valendo
+        self.criar_sensor(TipoSensor.objects.create(nome='Vento', unidade='m/s'))
+        # Sessão e usuário; as estatísticas, inclusive os alertas, vêm do cache
+        with self.assertNumQueries(2):
+            self.assertEqual(self.estatisticas()['total_sensores'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.criar_sensor(TipoSensor.objects.create(nome='Chuva', unidade='mm'))
+            User.objects.create_user('outro')
+        estatisticas = self.estatisticas()
+        self.assertEqual((estatisticas['total_sensores'], estatisticas['total_usuarios']), (4, 2))
+
+    def test_total_de_usuarios_so_para_a_equipe(self):
+        self.client.force_login(self.usuario)
+        self.assertNotIn('total_usuarios', self.estatisticas())
+        self.assertNotContains(self.client.get(reverse('dashboard')), 'Usuários</div>')
+
+    def test_alerta_aberto_ou_encerrado_invalida_o_cache(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.estatisticas()['alertas'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            ingerir_lote([self.item(35, 0)])
+        self.assertEqual([alerta.sensor_id for alerta in self.estatisticas()['alertas']], [self.sensor.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            ingerir_lote([self.item(20, 60)])
+        self.assertEqual(self.estatisticas()['alertas'], [])
+
+
+class DetalhesTests(DadosMixin, TestCase):
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return len(capturadas), resposta
+
+    def test_paginas_de_detalhe_com_consultas_constantes(self):
+        self.client.force_login(self.usuario)
+        ingerir_lote([self.item(21.5, 0), self.item(22.5, 60)])
+        urls = [
+            reverse('ambiente_detail', args=[self.ambiente.pk]),
+            reverse('dispositivo_detail', args=[self.dispositivo.pk]),
+        ]
+        antes = []
+        for url in urls:
+            total, resposta = self.consultas(url)
+            self.assertContains(resposta, '22.5')
+            antes.append(total)
+        # Sessão e usuário mais as consultas de cada view (3 e 2)
+        self.assertEqual(antes, [5, 4])
+
+        tipos = TipoSensor.objects.bulk_create([TipoSensor(nome=f'Tipo {numero}', unidade='u') for numero in range(8)])
+        for tipo in tipos:
+            self.criar_sensor(tipo)
+        outro = Dispositivo.objects.create(
+            nome='ESP32 2', tipo='sensor', mac_address='24:6f:28:ab:12:35', ambiente=self.ambiente, usuario=self.usuario,
+        )
+        Sensor.objects.create(nome='T', tipo=self.temperatura, dispositivo=outro, ambiente=self.ambiente, usuario=self.usuario)
+        ingerir_lote([dict(self.item(30, 120), tipo=tipo.nome) for tipo in tipos])
+        self.assertEqual([self.consultas(url)[0] for url in urls], antes)
+
+
+class PopularDadosTests(TestCase):
+
+    def popular(self):
+        call_command(
+            'popular_dados', usuarios=2, ambientes=2, dispositivos=2, sensores=3, dias=1, intervalo=60, seed=1, lote=7,
+            stdout=StringIO(),
+        )
+
+    def test_gera_a_estrutura_e_as_leituras_com_os_derivados(self):
+        User.objects.create_user('admin')
+        self.popular()
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual((Ambiente.objects.count(), Dispositivo.objects.count(), Sensor.objects.count()), (4, 8, 24))
+        self.assertEqual(set(Sensor.objects.values_list('slot', flat=True)), {0, 1, 2})
+        self.assertEqual(LeituraSensor.objects.count(), 24 * 24)
+        self.assertEqual(UltimaLeitura.objects.aggregate(total=Sum('total_leituras'))['total'], 24 * 24)
+        self.assertEqual(
+            AgregadoLeitura.objects.filter(granularidade='hora').aggregate(total=Sum('contagem'))['total'], 24 * 24,
+        )
+
+        # Rodar de novo reaproveita usuários, ambientes, dispositivos e sensores
+        self.popular()
+        self.assertEqual((User.objects.count(), Dispositivo.objects.count(), Sensor.objects.count()), (2, 8, 24))
+
+
+class ExportarDadosTests(DadosMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.saida = diretorio.name
+
+    def exportar(self, **opcoes):
+        call_command('exportar_dados', saida=self.saida, tabela=['core_leiturasensor'], stdout=StringIO(), **opcoes)
+
+    def test_exportacao_incremental_a_partir_da_marca(self):
+        ingerir_lote([self.item(20, 0), self.item(21, 1)])
+        self.exportar(incremental=True)
+        ids = list(LeituraSensor.objects.order_by('pk').values_list('pk', flat=True))
+        with open(Path(self.saida) / f'core_leiturasensor_1-{ids[-1]}.csv', encoding='utf-8') as arquivo:
+            linhas = list(csv.DictReader(arquivo))
+        self.assertEqual([int(linha['id']) for linha in linhas], ids)
+        marcas = json.loads((Path(self.saida) / '.marcas_exportacao.json').read_text())
+        self.assertEqual(marcas, {'core_leiturasensor': ids[-1]})
+
+        self.exportar(incremental=True)
+        self.assertEqual(len(list(Path(self.saida).glob('core_leiturasensor_*'))), 1)
+
+        ingerir_lote([self.item(22, 2)])
+        self.exportar(incremental=True, formato='ndjson', gzip=True)
+        novo = LeituraSensor.objects.latest('pk').pk
+        with gzip.open(Path(self.saida) / f'core_leiturasensor_{novo}-{novo}.ndjson.gz', 'rt', encoding='utf-8') as arquivo:
+            linhas = [json.loads(linha) for linha in arquivo]
+        self.assertEqual([(linha['id'], linha['valor']) for linha in linhas], [(novo, 22.0)])
+        self.assertFalse(list(Path(self.saida).glob('*.tmp')))
+
+
+class ArquivoTests(DadosMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(IOT_ARQUIVO_DIR=Path(diretorio.name))
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_arquivamento_e_leitura_de_volta(self):
+        self.sensor.retencao_dias = 30
+        self.sensor.save()
+        antigas = [
+            self.item(20.25, -40 * 86400),
+            dict(self.item(21.5, -40 * 86400 + 1), observacao='reinício'),
+            self.item(22, -35 * 86400),
+        ]
+        ingerir_lote(antigas + [self.item(23, 0), self.item(60, -40 * 86400, 'Umidade')])
+        originais = list(LeituraSensor.objects.filter(sensor=self.sensor).order_by('timestamp').values_list(
+            'id', 'timestamp', 'valor', 'observacao',
+        ))
+
+        call_command('arquivar_leituras', stdout=StringIO())
+        self.assertEqual(list(LeituraSensor.objects.filter(sensor=self.sensor).values_list('valor', flat=True)), [23])
+        self.assertEqual(LeituraSensor.objects.filter(sensor=self.sensor_umidade).count(), 1)
+        self.assertEqual(UltimaLeitura.objects.get(sensor=self.sensor).total_leituras, 1)
+
+        arquivadas = []
+        for mes in sorted({mes_local(momento) for _, momento, _, _ in originais[:3]}):
+            ids, timestamps, valores, observacoes = ler_mes(self.sensor.pk, *mes)
+            arquivadas += [
+                (ids[i], de_microssegundos(timestamps[i]), valores[i], observacoes.get(str(ids[i])))
+                for i in range(len(ids))
+            ]
+        self.assertEqual(arquivadas, originais[:3])
+
+        # Repetir não duplica o que já foi arquivado
+        call_command('arquivar_leituras', stdout=StringIO())
+        total, linhas = leituras_no_intervalo(self.sensor.pk, self.base - timedelta(days=60), timezone.now())
+        self.assertEqual(total, 4)
+        self.assertEqual(list(linhas), [(para_microssegundos(momento), valor) for _, momento, valor, _ in originais])
+
+    def test_lote_menor_que_o_mes_arquiva_todas_as_leituras(self):
+        self.sensor.retencao_dias = 30
+        self.sensor.save()
+        # Dois meses, cada um com mais leituras que o --lote
+        itens = [self.item(i, dias * -86400 + i * 60) for dias in (70, 40) for i in range(7)]
+        ingerir_lote(itens + [self.item(99, -70 * 86400, 'Umidade'), self.item(23, 0)])
+        originais = list(LeituraSensor.objects.filter(sensor=self.sensor, timestamp__lt=self.base).order_by(
+            'timestamp',
+        ).values_list('id', 'timestamp'))
+
+        call_command('arquivar_leituras', lote=2, stdout=StringIO())
+        self.assertEqual(list(LeituraSensor.objects.filter(sensor=self.sensor).values_list('valor', flat=True)), [23])
+        self.assertEqual(UltimaLeitura.objects.get(sensor=self.sensor).total_leituras, 1)
+        arquivadas = []
+        for mes in sorted({mes_local(momento) for _, momento in originais}):
+            arquivadas += list(ler_mes(self.sensor.pk, *mes)[0])
+        self.assertEqual(arquivadas, [leitura_id for leitura_id, _ in originais])
+
+    def test_reconstruir_agregados_le_o_arquivo(self):
+        self.sensor.retencao_dias = 30
+        self.sensor.save()
+        ingerir_lote([self.item(20, -40 * 86400), self.item(24, -40 * 86400 + 60), self.item(23, 0)])
+        antes = sorted(AgregadoLeitura.objects.filter(sensor=self.sensor).values_list(
+            'granularidade', 'inicio', 'contagem', 'soma',
+        ))
+        call_command('arquivar_leituras', stdout=StringIO())
+
+        call_command('reconstruir_agregados', stdout=StringIO())
+        depois = sorted(AgregadoLeitura.objects.filter(sensor=self.sensor).values_list(
+            'granularidade', 'inicio', 'contagem', 'soma',
+        ))
+        self.assertEqual(depois, antes)
+
+    def test_leitura_nos_dois_lados_conta_uma_vez(self):
+        self.sensor.retencao_dias = 30
+        self.sensor.save()
+        ingerir_lote([self.item(20, -40 * 86400), self.item(21, -40 * 86400 + 60), self.item(23, 0)])
+        call_command('arquivar_leituras', stdout=StringIO())
+        # Arquivamento interrompido antes de apagar: a mesma leitura volta à tabela quente
+        repetida = self.base - timedelta(days=40, seconds=-60)
+        LeituraSensor.objects.bulk_create([LeituraSensor(sensor=self.sensor, valor=99, timestamp=repetida)])
+
+        total, linhas = leituras_no_intervalo(self.sensor.pk, self.base - timedelta(days=60), timezone.now())
+        self.assertEqual(total, 3)
+        self.assertEqual([valor for _, valor in linhas], [20, 21, 23])
+
+
+@mock.patch('core.fila.close_old_connections', mock.Mock())
+class FilaEscritaTests(DadosMixin, TestCase):
+
+    def pedido(self, segundos, *valores, automacao=False):
+        leituras = [
+            LeituraSensor(sensor=self.sensor, valor=valor, timestamp=self.base + timedelta(seconds=segundos + i))
+            for i, valor in enumerate(valores)
+        ]
+        return _Pedido(leituras, {self.dispositivo.pk}, automacao)
+
+    def test_pedidos_pendentes_em_uma_transacao_e_falha_isolada(self):
+        fila = FilaEscrita()
+        juntos = [self.pedido(0, 20, 21), self.pedido(10, 22), self.pedido(20, 23, automacao=True)]
+        fila._processar(juntos)
+        # Um grupo por valor de automacao
+        self.assertEqual((fila.transacoes, fila.leituras_gravadas), (2, 4))
+        self.assertTrue(all(pedido.concluido.is_set() and pedido.erro is None for pedido in juntos))
+
+        bom, ruim = self.pedido(30, 30, 31), self.pedido(40, None)
+        with self.assertLogs('core.fila', 'ERROR'):
+            fila._processar([bom, ruim])
+        self.assertIsNone(bom.erro)
+        self.assertIsNotNone(ruim.erro)
+        self.assertEqual(LeituraSensor.objects.filter(sensor=self.sensor).count(), 6)
+
+    def test_timeout_sem_a_thread_de_escrita(self):
+        fila = FilaEscrita(timeout=0.01)
+        with mock.patch.object(fila, '_iniciar'), self.assertRaises(TimeoutError):
+            fila.gravar(self.pedido(0, 20).leituras, {self.dispositivo.pk})
+        self.assertEqual(fila.profundidade, 1)
+
+    @override_settings(IOT_INGESTAO_FILA=True)
+    def test_erros_da_fila_pela_api(self):
+        corpo = json.dumps([self.item(20, 0)])
+        with mock.patch.object(FilaEscrita, 'gravar', side_effect=TimeoutError):
+            resposta = self.postar(corpo)
+        self.assertEqual((resposta.status_code, resposta['Retry-After']), (503, '5'))
+        with mock.patch.object(FilaEscrita, 'gravar', side_effect=FalhaGravacao):
+            resposta = self.postar(corpo)
+        self.assertEqual(resposta.status_code, 500)
+        self.assertIn('nenhuma leitura foi gravada', resposta.json()['erro'])
+
+
+class PresencaTests(DadosMixin, TestCase):
+
+    def criar_dispositivo(self, numero, minutos, tipo='sensor', usuario=None):
+        return Dispositivo.objects.create(
+            nome=f'D{numero}', tipo=tipo, mac_address=f'02:00:00:00:00:{numero:02X}', ambiente=self.ambiente,
+            usuario=usuario or self.usuario,
+            ultimo_contato=None if minutos is None else timezone.now() - timedelta(minutes=minutos),
+        )
+
+    def test_presenca_calculada_no_banco(self):
+        self.criar_dispositivo(1, 1)
+        self.criar_dispositivo(2, 10)
+        self.criar_dispositivo(3, 60)
+        presencas = dict(Dispositivo.objects.com_presenca().values_list('nome', 'presenca'))
+        self.assertEqual(presencas, {'ESP32': 'offline', 'D1': 'online', 'D2': 'instavel', 'D3': 'offline'})
+        for presenca in ('online', 'instavel', 'offline'):
+            self.assertEqual(
+                set(Dispositivo.objects.por_presenca(presenca).values_list('nome', flat=True)),
+                {nome for nome, valor in presencas.items() if valor == presenca},
+            )
+
+        self.client.force_login(User.objects.create_superuser('admin', password='senha'))
+        resposta = self.client.get(reverse('admin:core_dispositivo_changelist'), {'presenca': 'instavel'})
+        self.assertEqual([dispositivo.nome for dispositivo in resposta.context['cl'].result_list], ['D2'])
+
+    @mock.patch('core.presenca.BufferPresenca._iniciar', mock.Mock())
+    def test_heartbeat_acumulado_e_gravado_em_bloco(self):
+        gateway = self.criar_dispositivo(1, None, tipo='gateway')
+        token = gateway.gerar_token()
+        gateway.save()
+        estranho = self.criar_dispositivo(2, None, usuario=User.objects.create_user('outro'))
+        buffer_presenca().gravar()
+
+        url = reverse('heartbeat')
+        self.assertEqual(self.client.post(url, '{}', content_type='application/json').status_code, 401)
+        resposta = self.client.post(
+            url, json.dumps({'macs': ['24-6f-28-ab-12-34', gateway.mac_address]}), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+        self.assertEqual((resposta.status_code, resposta.json()), (202, {'registrados': 2}))
+        resposta = self.client.post(
+            url, json.dumps({'mac': estranho.mac_address}), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {self.token}',
+        )
+        self.assertEqual((resposta.status_code, resposta.json()['macs']), (403, [estranho.mac_address]))
+
+        # Nada vai ao banco até o buffer ser gravado
+        self.assertFalse(Dispositivo.objects.filter(ultimo_contato__isnull=False).exists())
+        self.assertEqual(buffer_presenca().gravar(), 2)
+        self.assertEqual(
+            set(Dispositivo.objects.por_presenca('online').values_list('pk', flat=True)), {self.dispositivo.pk, gateway.pk},
+        )
+
+    @mock.patch('core.presenca.BufferPresenca._iniciar', mock.Mock())
+    def test_heartbeat_acumulado_nao_faz_o_contato_retroceder(self):
+        recente = timezone.now()
+        Dispositivo.objects.filter(pk=self.dispositivo.pk).update(ultimo_contato=recente)
+        sem_contato = self.criar_dispositivo(1, None)
+        buffer = BufferPresenca(intervalo=60)
+        buffer.registrar([self.dispositivo.mac_address, sem_contato.mac_address], recente - timedelta(seconds=30))
+        buffer.gravar()
+        self.dispositivo.refresh_from_db()
+        sem_contato.refresh_from_db()
+        self.assertEqual(self.dispositivo.ultimo_contato, recente)
+        self.assertEqual(sem_contato.ultimo_contato, recente - timedelta(seconds=30))
+
+
+class EventosTests(DadosMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ar = ArCondicionado.objects.create(ambiente=self.ambiente)
+        vizinho = User.objects.create_user('vizinho', password='senha')
+        self.ar_alheio = ArCondicionado.objects.create(ambiente=Ambiente.objects.create(nome='Quarto', usuario=vizinho))
+
+    async def test_fluxo_exige_login_e_so_aceita_aparelhos_do_usuario(self):
+        url = reverse('eventos')
+        resposta = await self.async_client.get(url, {'ar': self.ar.pk})
+        self.assertEqual(resposta.status_code, 403)
+
+        await self.async_client.aforce_login(self.usuario)
+        resposta = await self.async_client.get(url, {'ar': [self.ar.pk, self.ar_alheio.pk]})
+        self.assertEqual(resposta.status_code, 403)
+
+    def test_assinatura_filtra_por_aparelho_e_permissao(self):
+        distribuidor = Distribuidor(intervalo=1)
+        distribuidor._consultar()
+        ArCondicionado.objects.update(ligado=True)
+        eventos = distribuidor._consultar()
+        self.assertEqual(sorted(dados['pk'] for tipo, dados in eventos), [self.ar.pk, self.ar_alheio.pk])
+
+        do_dono = Assinatura(ars_permitidos={self.ar.pk})
+        filtrada = Assinatura(ars=[self.ar.pk])
+        pelo_ambiente = Assinatura(ambientes=[self.ar_alheio.ambiente_id], ars_permitidos={self.ar.pk})
+        self.assertEqual([dados['pk'] for tipo, dados in eventos if do_dono.aceita(tipo, dados)], [self.ar.pk])
+        self.assertEqual([dados['pk'] for tipo, dados in eventos if filtrada.aceita(tipo, dados)], [self.ar.pk])
+        self.assertFalse(any(pelo_ambiente.aceita(tipo, dados) for tipo, dados in eventos))
+
+
+class AlertasTests(DadosMixin, TestCase):
+
+    def avaliar(self, *pares):
+        avaliar_alertas([(self.sensor.pk, valor, self.base + timedelta(seconds=s)) for s, valor in pares])
+
+    def test_histerese_mantem_o_alerta_aberto_perto_do_limite(self):
+        # Faixa 10-30: a folga para fechar é 5% da largura (1.0)
+        self.avaliar((0, 31), (10, 33), (20, 29.5))
+        alerta = Alerta.objects.get()
+        self.assertIsNone(alerta.encerrado_em)
+        self.assertEqual((alerta.tipo, alerta.contagem, alerta.valor_extremo), ('acima', 2, 33))
+
+        self.avaliar((30, 31))
+        self.assertEqual(Alerta.objects.get().contagem, 3)
+
+        self.avaliar((40, 28.5))
+        alerta = Alerta.objects.get()
+        self.assertEqual(alerta.encerrado_em, self.base + timedelta(seconds=40))
+
+        self.avaliar((50, 5))
+        self.assertEqual(Alerta.objects.filter(encerrado_em__isnull=True, tipo='abaixo').count(), 1)
+
+    def test_ingestao_abre_alerta_so_para_sensor_com_faixa(self):
+        ingerir_lote([self.item(35, 0), self.item(120, 0, tipo='Umidade')])
+        self.assertEqual(list(Alerta.objects.values_list('sensor_id', 'tipo')), [(self.sensor.pk, 'acima')])
+
+
+class SeriesTests(DadosMixin, TestCase):
+
+    def test_reducao_respeita_o_numero_de_pontos(self):
+        linhas = [(momento, (momento * 37) % 101) for momento in range(1000)]
+        for pontos in (2, 3, 10, 99):
+            with self.subTest(pontos=pontos):
+                lttb = list(reduzir_lttb(iter(linhas), len(linhas), pontos))
+                self.assertEqual(len(lttb), pontos)
+                self.assertEqual((lttb[0], lttb[-1]), (linhas[0], linhas[-1]))
+                minmax = list(reduzir_minmax(iter(linhas), len(linhas), pontos))
+                self.assertLessEqual(len(minmax), pontos)
+                self.assertEqual(minmax, sorted(minmax))
+
+        # Um pico isolado sobrevive ao minmax
+        linhas[500] = (500, 1000)
+        self.assertIn((500, 1000), list(reduzir_minmax(iter(linhas), len(linhas), 10)))
+
+    def test_serie_da_view_dentro_do_orcamento(self):
+        self.client.force_login(self.usuario)
+        ingerir_lote([self.item(20 + segundo % 7, segundo) for segundo in range(600)])
+        url = reverse('sensor_serie', args=[self.sensor.pk])
+        periodo = {'from': self.base.isoformat(), 'to': (self.base + timedelta(minutes=10)).isoformat()}
+        for metodo in ('lttb', 'minmax'):
+            with self.subTest(metodo=metodo):
+                serie = self.client.get(url, dict(periodo, points=50, method=metodo)).json()
+                self.assertEqual((serie['granularidade'], serie['leituras']), (None, 600))
+                self.assertLessEqual(serie['pontos'], 50)
+                self.assertEqual(serie['timestamps'], sorted(serie['timestamps']))
+        serie = self.client.get(url, dict(periodo, points=1000)).json()
+        self.assertEqual(serie['pontos'], 600)
+
+
+class BinarioTests(DadosMixin, TestCase):
+
+    def frame(self, registros, mac=None):
+        agora = int(time.time() * 1000)
+        return codificar_frame(
+            mac or self.dispositivo.mac_address, [(slot, agora - atraso, valor) for slot, atraso, valor in registros],
+            base_ms=agora - 60000,
+        )
+
+    def test_decodifica_frames(self):
+        corpo = codificar_frame('24:6F:28:AB:12:34', [(0, 1500, 21.5), (1, 2500, 60.0)], base_ms=1000)
+        ((mac, base_ms, slots, momentos, valores),) = decodificar(corpo)
+        self.assertEqual((mac, base_ms, slots, momentos, valores), ('24:6F:28:AB:12:34', 1000, [0, 1], [1500, 2500], [21.5, 60.0]))
+        with self.assertRaises(LoteInvalido):
+            decodificar(corpo[:-3])
+        with self.assertRaises(LoteInvalido):
+            decodificar(b'XXXX' + corpo[4:])
+
+    def test_slots_sao_estaveis(self):
+        self.assertEqual((self.sensor.slot, self.sensor_umidade.slot), (0, 1))
+        self.sensor.delete()
+        vento = self.criar_sensor(TipoSensor.objects.create(nome='Vento', unidade='m/s'))
+        self.assertEqual(vento.slot, 2)
+
+        resultado = ingerir_binario(self.frame([(0, 3000, 1.0), (1, 2000, 55.0), (2, 1000, 3.0)]))
+        self.assertEqual(resultado['aceitas'], 2)
+        self.assertEqual(resultado['erros'], {'Sensor não encontrado.': 1})
+        self.assertEqual(LeituraSensor.objects.get(sensor=self.sensor_umidade).valor, 55)
+        self.assertEqual(LeituraSensor.objects.get(sensor=vento).valor, 3)
+
+    def test_precisao_e_autorizacao_pela_api(self):
+        resposta = self.postar(self.frame([(0, 1000, 23.4)]), CONTENT_TYPE_BINARIO)
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(LeituraSensor.objects.get(sensor=self.sensor).valor, 23.4)
+
+        outro = Dispositivo.objects.create(
+            nome='Outro', tipo='sensor', mac_address='24:6F:28:AB:12:35', ambiente=self.ambiente, usuario=self.usuario,
+        )
+        Sensor.objects.create(nome='T', tipo=self.temperatura, dispositivo=outro, ambiente=self.ambiente, usuario=self.usuario)
+        resposta = self.postar(self.frame([(0, 1000, 20.0)], mac=outro.mac_address), CONTENT_TYPE_BINARIO)
+        self.assertEqual(resposta.status_code, 422)
+
+    def test_mac_normalizado(self):
+        self.assertEqual(self.dispositivo.mac_address, '24:6F:28:AB:12:34')
+        repetido = Dispositivo(
+            nome='Cópia', tipo='sensor', mac_address='24-6f-28-ab-12-34', ambiente=self.ambiente, usuario=self.usuario,
+        )
+        with self.assertRaisesMessage(Exception, 'Endereço MAC'):
+            repetido.full_clean()
+
+    def test_slot_acima_de_255_usa_o_menor_livre(self):
+        tipos = TipoSensor.objects.bulk_create([TipoSensor(nome=f'T{slot}', unidade='u') for slot in range(2, 258)])
+        self.criar_sensor(tipos[-1], slot=SLOT_MAXIMO)
+        self.assertEqual(self.criar_sensor(tipos[0]).slot, 2)
+
+        Sensor.objects.bulk_create([
+            Sensor(nome=tipo.nome, tipo=tipo, slot=slot, dispositivo=self.dispositivo, ambiente=self.ambiente, usuario=self.usuario)
+            for slot, tipo in zip(range(3, SLOT_MAXIMO), tipos[1:])
+        ])
+        with self.assertRaises(ValidationError):
+            self.criar_sensor(tipos[-2])
+
+    def test_sem_relogio_rejeita_leitura_antiga(self):
+        registros = [(0, 0, 20.0), (0, 4 * 60000, 21.0), (0, 6 * 60000, 22.0)]
+        resultado = ingerir_binario(codificar_frame(self.dispositivo.mac_address, registros))
+        self.assertEqual(resultado['erros'], {'Leitura antiga demais para dispositivo sem relógio.': 1})
+        momentos = LeituraSensor.objects.filter(sensor=self.sensor).order_by('timestamp').values_list('timestamp', flat=True)
+        self.assertEqual(momentos[1] - momentos[0], timedelta(minutes=2))
+        self.assertLess(timezone.now() - momentos[1], timedelta(minutes=1))
+
+
+@mock.patch('core.escuta.close_old_connections', mock.Mock())
+class EscutaTests(DadosMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.escuta = Escuta(lote=2, max_pendentes=3)
+        self.escuta.credenciais.recarregar()
+        self.addCleanup(self.escuta._escritor.shutdown)
+
+    def linha(self, valor, segundos):
+        item = self.item(valor, segundos)
+        del item['mac']
+        return json.dumps(item)
+
+    async def test_buffer_grava_em_lotes_e_espera_o_escritor(self):
+        self.escuta._gatilho = asyncio.Event()
+        self.escuta._espaco = asyncio.Event()
+        self.escuta._espaco.set()
+        lotes = []
+        self.escuta._gravar = lambda itens: lotes.append([item['valor'] for item in itens])
+        gravador = asyncio.get_running_loop().create_task(self.escuta._gravador())
+        try:
+            for valor in range(7):
+                await self.escuta._processar_linha(self.dispositivo.mac_address, self.linha(valor, valor))
+            await self.escuta.esvaziar()
+        finally:
+            gravador.cancel()
+
+        self.assertEqual([valor for lote in lotes for valor in lote], list(range(7)))
+        self.assertTrue(all(len(lote) <= 2 for lote in lotes))
+        self.assertEqual((self.escuta.metricas.profundidade, self.escuta.metricas.leituras_recebidas), (0, 7))
+        self.assertLessEqual(self.escuta.metricas.profundidade_maxima, 3)
+
+    def test_gravacao_atualiza_metricas_e_conta_perdas(self):
+        itens = [dict(self.item(20 + segundo, segundo), mac=self.dispositivo.mac_address) for segundo in range(3)]
+        self.escuta._gravar(itens + [dict(self.item(1, 5), tipo='Vento')])
+        self.assertEqual(LeituraSensor.objects.filter(sensor=self.sensor).count(), 3)
+        metricas = self.escuta.metricas
+        self.assertEqual((metricas.gravacoes, metricas.leituras_gravadas, metricas.leituras_rejeitadas), (1, 3, 1))
+
+        with mock.patch('core.escuta.ingerir_lote', side_effect=RuntimeError), self.assertLogs('core.escuta', 'ERROR'):
+            self.escuta._gravar(itens)
+        self.assertEqual((metricas.gravacoes, metricas.leituras_perdidas), (1, 3))
+        self.assertIn('iot_escuta_leituras_perdidas_total 3\n', metricas.prometheus())
+
+
+class BenchmarkSuiteTests(DadosMixin, TestCase):
+
+    def test_suite_mede_as_views_dentro_dos_limites(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        ingerir_lote([self.item(20, segundo) for segundo in range(10)])
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = Path(diretorio) / 'resultado.json'
+            call_command('benchmark_suite', repeticoes=2, lotes=2, tamanho=5, json=str(caminho), stdout=StringIO())
+            resultado = json.loads(caminho.read_text(encoding='utf-8'))
+        self.assertEqual(resultado['falhas'], [])
+        self.assertEqual(resultado['ingestao']['lotes'], 2)
+        for nome, medida in resultado['views'].items():
+            self.assertEqual(medida['status'], 200, nome)
+            if medida['limite_consultas'] is not None:
+                self.assertLessEqual(medida['consultas'], medida['limite_consultas'], nome)
+
+    def test_limite_excedido_falha(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        with mock.patch.dict('core.management.commands.benchmark_suite.LIMITES_CONSULTAS', painel=0):
+            with self.assertRaisesMessage(CommandError, 'painel:'):
+                call_command('benchmark_suite', repeticoes=1, lotes=1, tamanho=1, stdout=StringIO())
+
+
+class MetricasTests(DadosMixin, TestCase):
+
+    def amostras(self):
+        """Lê /metrics validando cada linha; retorna ({nome: tipo}, {(nome, rótulos): valor})"""
+        resposta = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertTrue(resposta['Content-Type'].startswith('text/plain; version=0.0.4'))
+        tipos, amostras = {}, {}
+        for linha in resposta.content.decode().splitlines():
+            if linha.startswith('# TYPE '):
+                _, _, nome, tipo = linha.split()
+                tipos[nome] = tipo
+                continue
+            encontrada = re.fullmatch(r'([a-z_]+)(?:\{(.*)\})? (\S+)', linha)
+            self.assertIsNotNone(encontrada, linha)
+            nome, rotulos, valor = encontrada.groups()
+            amostras[nome, rotulos or ''] = float(valor)
+        return tipos, amostras
+
+    def test_exige_token_fora_do_debug(self):
+        # O cliente de testes chega como 127.0.0.1: o endereço local não libera o acesso
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with override_settings(IOT_METRICAS_TOKEN='segredo'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer outro').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+
+    @override_settings(IOT_METRICAS_TOKEN='segredo')
+    def test_formato_texto_do_prometheus(self):
+        # Os contadores são do processo e acumulam entre os testes: compara antes e depois
+        _, antes = self.amostras()
+        self.postar(json.dumps([self.item(20, 0), self.item(21, 1)]))
+        tipos, depois = self.amostras()
+
+        for nome, _ in depois:
+            self.assertIn(re.sub(r'_(bucket|sum|count)$', '', nome) if nome not in tipos else nome, tipos, nome)
+        rota = 'rota="/api/leituras/",metodo="POST"'
+        variacao = {chave: valor - antes.get(chave, 0) for chave, valor in depois.items()}
+        self.assertEqual(variacao['iot_http_requisicoes_total', rota + ',status="201"'], 1)
+        self.assertEqual(variacao['iot_ingestao_leituras_aceitas_total', ''], 2)
+        baldes = [valor for (nome, rotulos), valor in depois.items()
+                  if nome == 'iot_http_latencia_segundos_bucket' and rotulos.startswith(rota)]
+        self.assertEqual(baldes, sorted(baldes))
+        self.assertEqual(baldes[-1], depois['iot_http_latencia_segundos_count', rota])
+
+
+class CacheRecentesTests(DadosMixin, TestCase):
+
+    def test_buffer_circular_guarda_as_ultimas(self):
+        buffer = BufferCircular(3)
+        for posicao in range(5):
+            self.assertTrue(buffer.acrescentar(posicao + 1, posicao * 10, float(posicao)))
+        self.assertEqual(buffer.linhas(), [(20, 2.0), (30, 3.0), (40, 4.0)])
+        self.assertEqual((buffer.mais_antigo(), buffer.posicao(25), buffer.ids_desde(3)), (20, 1, {4, 5}))
+        self.assertFalse(buffer.acrescentar(6, 35, 9.0))
+
+    def test_descarta_o_sensor_usado_ha_mais_tempo(self):
+        vento = self.criar_sensor(TipoSensor.objects.create(nome='Vento', unidade='m/s'))
+        tipos = ('Temperatura', 'Umidade', 'Vento')
+        ingerir_lote([self.item(segundo, segundo, tipo) for tipo in tipos for segundo in range(5)])
+        recentes = CacheRecentes(capacidade=3, max_sensores=2, validade=None)
+
+        def valores(sensor, segundos):
+            linhas = recentes.intervalo(sensor.pk, self.base + timedelta(seconds=segundos), timezone.now())
+            return [valor for _, valor in linhas]
+
+        valores(self.sensor, 2)
+        valores(self.sensor_umidade, 2)
+        # Usar a temperatura de novo faz da umidade a menos recente
+        self.assertEqual(valores(self.sensor, 3), [3, 4])
+        valores(vento, 2)
+        self.assertEqual(list(recentes._buffers), [self.sensor.pk, vento.pk])
+
+        # Leituras novas entram no buffer em cache sem ir ao banco
+        ingerir_lote([self.item(9, 10)])
+        recentes.registrar(LeituraSensor.objects.filter(sensor=self.sensor, valor=9))
+        with self.assertNumQueries(0):
+            self.assertEqual(valores(self.sensor, 3), [3, 4, 9])
+        estatisticas = recentes.estatisticas()
+        self.assertEqual(
+            (estatisticas['acertos'], estatisticas['faltas'], estatisticas['descartes'], estatisticas['sensores']),
+            (2, 3, 1, 2),
+        )
+
+
+class ProvisionamentoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('dono', password='senha')
+        TipoSensor.objects.create(nome='Temperatura', unidade='°C')
+        TipoSensor.objects.create(nome='Umidade', unidade='%')
+
+    def test_validacao_acusa_erros_sem_gravar(self):
+        manifesto = json.dumps([
+            {'mac': '02:00:00:00:00:01', 'ambiente': 'Lab', 'sensores': ['Temperatura', 'Umidade']},
+            {'mac': '02-00-00-00-00-01', 'ambiente': 'Lab', 'sensores': []},
+            {'mac': 'zz', 'ambiente': 'Lab', 'sensores': ['Pressão']},
+            {'mac': '02:00:00:00:00:03', 'ambiente': '', 'sensores': ['Temperatura', 'Temperatura']},
+        ])
+        plano = validar_manifesto(ler_manifesto(manifesto, 'json'), self.usuario)
+        erros = [erro for _, _, erro in plano.erros]
+        self.assertIn('MAC repetido no manifesto.', erros)
+        self.assertIn('MAC inválido: "zz".', erros)
+        self.assertIn('Tipo de sensor desconhecido: "Pressão".', erros)
+        self.assertIn('"ambiente" é obrigatório.', erros)
+        self.assertIn('Sensor "Temperatura" repetido no dispositivo.', erros)
+        self.assertEqual(len(plano.dispositivos), 1)
+        self.assertFalse(Dispositivo.objects.exists())
+
+    def test_precisao_negativa_e_slots_alem_do_maximo_sao_erros_da_linha(self):
+        tipos = TipoSensor.objects.bulk_create([TipoSensor(nome=f'T{i}', unidade='u') for i in range(SLOT_MAXIMO + 1)])
+        manifesto = json.dumps([
+            {'mac': '02:00:00:00:00:01', 'ambiente': 'Lab', 'sensores': [{'tipo': 'Temperatura', 'precisao': -1}]},
+            {'mac': '02:00:00:00:00:02', 'ambiente': 'Lab', 'sensores': ['Temperatura'] + [tipo.nome for tipo in tipos]},
+            {'mac': '02:00:00:00:00:03', 'ambiente': 'Lab', 'sensores': [tipo.nome for tipo in tipos]},
+        ])
+        plano = validar_manifesto(ler_manifesto(manifesto, 'json'), self.usuario)
+        self.assertEqual(plano.erros, [
+            (1, '02:00:00:00:00:01', 'Sensor "Temperatura": precisao não pode ser negativa.'),
+            (2, '02:00:00:00:00:02', f'O dispositivo tem {SLOT_MAXIMO + 2} sensores; o máximo é {SLOT_MAXIMO + 1}.'),
+        ])
+        self.assertEqual(len(plano.dispositivos), 1)
+
+    def test_simulacao_e_gravacao_pelo_comando(self):
+        caminho = self.arquivo('mac,ambiente,sensor_tipo\n02:00:00:00:00:0a,Lab,Temperatura\n02:00:00:00:00:0a,Lab,Umidade\n')
+        call_command('provisionar_dispositivos', caminho, usuario='dono', simular=True, stdout=StringIO())
+        self.assertFalse(Dispositivo.objects.exists())
+        self.assertFalse(Ambiente.objects.exists())
+
+        call_command('provisionar_dispositivos', caminho, usuario='dono', stdout=StringIO())
+        dispositivo = Dispositivo.objects.get()
+        self.assertEqual(dispositivo.mac_address, '02:00:00:00:00:0A')
+        self.assertEqual(
+            list(dispositivo.sensores.order_by('slot').values_list('tipo__nome', 'slot')),
+            [('Temperatura', 0), ('Umidade', 1)],
+        )
+        with self.assertRaisesMessage(CommandError, 'nada foi gravado'):
+            call_command('provisionar_dispositivos', caminho, usuario='dono', stdout=StringIO())
+        call_command('provisionar_dispositivos', caminho, usuario='dono', ignorar_existentes=True, stdout=StringIO())
+        self.assertEqual(Dispositivo.objects.count(), 1)
+
+    def arquivo(self, conteudo):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        self.addCleanup(os.unlink, arquivo.name)
+        return arquivo.name
+
+
+class PaginacaoLeiturasTests(DadosMixin, TestCase):
+
+    def test_paginacao_por_chave_percorre_todas_as_leituras(self):
+        admin_user = User.objects.create_superuser('admin', password='senha')
+        self.client.force_login(admin_user)
+        # Os dois sensores têm leituras nos mesmos instantes: o id desempata
+        leituras = [
+            LeituraSensor(sensor=sensor, valor=i, timestamp=self.base + timedelta(seconds=i))
+            for i in range(6) for sensor in (self.sensor, self.sensor_umidade)
+        ]
+        LeituraSensor.objects.bulk_create(leituras)
+
+        url = reverse('admin:core_leiturasensor_changelist')
+        vistos = []
+        with mock.patch.object(admin.site._registry[LeituraSensor], 'list_per_page', 5):
+            consulta = ''
+            while consulta is not None:
+                cl = self.client.get(url + consulta).context['cl']
+                vistos.extend((leitura.timestamp, leitura.pk) for leitura in cl.result_list)
+                consulta = cl.proxima_pagina
+        self.assertEqual(len(vistos), 12)
+        self.assertEqual(vistos, sorted(vistos, reverse=True))
+
+    def test_cursor_invalido(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='senha'))
+        resposta = self.client.get(reverse('admin:core_leiturasensor_changelist') + '?apos=lixo')
+        self.assertEqual(resposta.status_code, 302)
@@ -11,4 +11,8 @@ urlpatterns = [
     path('ar_condicionado/', include('ar_condicionado.urls')),
     path('ambiente/<int:pk>/', views.ambiente_detail, name='ambiente_detail'),
     path('dispositivo/<int:pk>/', views.dispositivo_detail, name='dispositivo_detail'),
+    path('sensor/<int:pk>/series/', views.sensor_serie, name='sensor_serie'),
+    path('api/leituras/', views.ingerir_leituras, name='ingerir_leituras'),
+    path('api/heartbeat/', views.heartbeat, name='heartbeat'),
+    path('api/eventos/', views.eventos, name='eventos'),
 ]
\ No newline at end of file
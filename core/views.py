@@ -1,3 +1,7 @@
+import asyncio
+import json
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
@@ -5,7 +9,34 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import reverse_lazy
-from .models import Ambiente, Dispositivo
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db.models import Count
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from ar_condicionado.comandos import aparelhos_do_usuario
+from .models import Ambiente, Dispositivo, Sensor
+from .binario import CONTENT_TYPE as CONTENT_TYPE_BINARIO, ingerir_binario
+from .estatisticas import estatisticas_dashboard
+from .fila import FalhaGravacao
+from .eventos import Assinatura, distribuidor, fluxo_disponivel, formatar_evento
+from .ingestao import LoteInvalido, autenticar_dispositivo, ingerir_lote, normalizar_mac, parse_lote
+from .presenca import buffer_presenca
+from .series import METODOS, serie_reduzida
+
+
+INTERVALO_KEEPALIVE = 15
+PONTOS_PADRAO = 500
+PONTOS_MAXIMO = 5000
+# Segundos sugeridos ao dispositivo (Retry-After) quando a fila de escrita está atrasada
+ESPERA_FILA_OCUPADA = 5
+# Ícone de icons.html usado no cartão de cada tipo de sensor
+ICONES_TIPO = {
+    'Temperatura': 'temperatura',
+    'Umidade': 'umidade',
+    'Luminosidade': 'luminosidade',
+}
 
 
 
@@ -13,20 +44,200 @@ from .models import Ambiente, Dispositivo
   #  """Página inicial"""
  #   return render(request, 'core/home.html')
 
+def _cartao_sensor(sensor):
+    """Contexto do partial sensor.html; o sensor precisa vir com tipo e leitura_atual (select_related)"""
+    leitura = sensor.ultima_leitura
+    if leitura is None or not sensor.ativo:
+        cor = 'bg-secondary'
+    elif (sensor.valor_minimo is not None and leitura.valor < sensor.valor_minimo) or (
+            sensor.valor_maximo is not None and leitura.valor > sensor.valor_maximo):
+        cor = 'bg-danger'
+    else:
+        cor = 'bg-success'
+    return {
+        'sensor': sensor,
+        'label': sensor.nome,
+        'icone': ICONES_TIPO.get(sensor.tipo.nome, 'wifi'),
+        'value': f'{leitura.valor:.{sensor.precisao}f}' if leitura else '--',
+        'unit': sensor.tipo.unidade,
+        'status_color': cor,
+        'timestamp': leitura.timestamp if leitura else None,
+    }
+
+
+@login_required
 def ambiente_detail(request, pk):
-    ambiente = get_object_or_404(Ambiente, pk=pk)
-    return render(request, 'core/ambiente_detail.html', {'ambiente': ambiente})
+    """Dispositivos e sensores do ambiente com o valor atual; 3 consultas independente do tamanho"""
+    filtro = {} if request.user.is_superuser else {'usuario': request.user}
+    ambiente = get_object_or_404(Ambiente.objects.select_related('usuario'), pk=pk, **filtro)
+    dispositivos = ambiente.dispositivos.com_presenca().annotate(total_sensores=Count('sensores'))
+    sensores = (
+        ambiente.sensores.select_related('tipo', 'dispositivo', 'leitura_atual')
+        .order_by('dispositivo__nome', 'nome')
+    )
+    return render(request, 'core/ambiente_detail.html', {
+        'ambiente': ambiente,
+        'dispositivos': dispositivos,
+        'cartoes': [_cartao_sensor(sensor) for sensor in sensores],
+    })
 
 
 
 @login_required
 def dashboard(request):
     """Dashboard principal para usuários autenticados"""
-    return render(request, 'core/dashboard.html')
+    return render(request, 'core/dashboard.html', {'estatisticas': estatisticas_dashboard(request.user)})
 
+@login_required
 def dispositivo_detail(request, pk):
-    dispositivo = get_object_or_404(Dispositivo, pk=pk)
-    return render(request, 'core/dispositivo_detail.html', {'dispositivo': dispositivo})
+    """Sensores do dispositivo com a última leitura e a presença; 2 consultas independente do tamanho"""
+    filtro = {} if request.user.is_superuser else {'usuario': request.user}
+    dispositivo = get_object_or_404(
+        Dispositivo.objects.com_presenca().select_related('ambiente', 'usuario', 'ar'), pk=pk, **filtro,
+    )
+    sensores = dispositivo.sensores.select_related('tipo', 'leitura_atual').order_by('nome')
+    return render(request, 'core/dispositivo_detail.html', {
+        'dispositivo': dispositivo,
+        'cartoes': [_cartao_sensor(sensor) for sensor in sensores],
+    })
+
+def _token_invalido():
+    resposta = JsonResponse({'erro': 'Envie o token do dispositivo em "Authorization: Bearer <token>".'}, status=401)
+    resposta['WWW-Authenticate'] = 'Bearer'
+    return resposta
+
+@csrf_exempt
+@require_POST
+def ingerir_leituras(request):
+    """Recebe um lote de leituras (JSON, NDJSON ou binário compacto); exige o token do dispositivo"""
+    remetente = autenticar_dispositivo(request.headers.get('Authorization'))
+    if remetente is None:
+        return _token_invalido()
+    try:
+        if request.content_type == CONTENT_TYPE_BINARIO:
+            resultado = ingerir_binario(request.body, remetente)
+        else:
+            resultado = ingerir_lote(parse_lote(request.body, request.content_type or ''), remetente)
+    except LoteInvalido as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+    except TimeoutError:
+        resposta = JsonResponse({
+            'erro': 'A gravação está atrasada; tente novamente. O lote ainda pode ser gravado, '
+                    'então envie o timestamp de cada leitura para que o reenvio não duplique.',
+        }, status=503)
+        resposta['Retry-After'] = str(ESPERA_FILA_OCUPADA)
+        return resposta
+    except FalhaGravacao:
+        return JsonResponse({'erro': 'Não foi possível gravar o lote; nenhuma leitura foi gravada.'}, status=500)
+
+    status = 201 if resultado['aceitas'] else 422
+    return JsonResponse(resultado, status=status)
+
+@csrf_exempt
+@require_POST
+def heartbeat(request):
+    """Registra o contato do dispositivo do token; um gateway pode informar {"mac": "..."} ou {"macs": [...]}"""
+    remetente = autenticar_dispositivo(request.headers.get('Authorization'))
+    if remetente is None:
+        return _token_invalido()
+    try:
+        dados = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'erro': 'Corpo da requisição não é um JSON válido.'}, status=400)
+    if not isinstance(dados, dict):
+        return JsonResponse({'erro': 'Esperado um objeto JSON.'}, status=400)
+
+    macs = dados.get('macs') or ([dados['mac']] if dados.get('mac') else [remetente.mac])
+    if not isinstance(macs, list) or not all(isinstance(mac, str) and mac for mac in macs):
+        return JsonResponse({'erro': '"mac" deve ser um texto e "macs" uma lista de textos.'}, status=400)
+
+    macs = {normalizar_mac(mac) for mac in macs}
+    donos = dict(Dispositivo.objects.filter(mac_address__in=macs).values_list('mac_address', 'usuario_id'))
+    negados = sorted(mac for mac in macs if mac not in donos or not remetente.pode_enviar_por(mac, donos[mac]))
+    if negados:
+        return JsonResponse({'erro': 'Dispositivos não autorizados para este token.', 'macs': negados}, status=403)
+
+    buffer_presenca().registrar(macs)
+    return JsonResponse({'registrados': len(macs)}, status=202)
+
+async def _fluxo_eventos(assinatura):
+    fila = distribuidor().assinar(assinatura).fila
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                tipo, dados = await asyncio.wait_for(fila.get(), timeout=INTERVALO_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Comentário vazio mantém a conexão aberta em proxies que derrubam conexões ociosas
+                yield ': ping\n\n'
+                continue
+            yield formatar_evento(tipo, dados)
+    finally:
+        distribuidor().cancelar(assinatura)
+
+@require_GET
+async def eventos(request):
+    """Fluxo server-sent events de leituras e aparelhos (?sensor=, ?ambiente=, ?ar=); requer ASGI e login"""
+    if not fluxo_disponivel(request):
+        return JsonResponse({'erro': 'O fluxo ao vivo requer o servidor ASGI (uvicorn sistema_iot.asgi:application).'}, status=501)
+    try:
+        filtros = {nome: [int(valor) for valor in request.GET.getlist(nome)] for nome in ('sensor', 'ambiente', 'ar')}
+    except ValueError:
+        return JsonResponse({'erro': 'Os filtros devem ser ids inteiros.'}, status=400)
+
+    # Leituras só dos sensores do usuário e aparelhos só dos seus ambientes, como na API de comandos
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return JsonResponse({'erro': 'Faça login para acompanhar o fluxo ao vivo.'}, status=403)
+    if usuario.is_superuser:
+        sensores = ars = None
+    else:
+        sensores = {pk async for pk in Sensor.objects.filter(usuario=usuario).values_list('pk', flat=True)}
+        ars = {pk async for pk in aparelhos_do_usuario(usuario).values_list('pk', flat=True)}
+        if not ars.issuperset(filtros['ar']):
+            return JsonResponse({'erro': 'Aparelho inexistente ou de outro usuário.'}, status=403)
+
+    assinatura = Assinatura(
+        filtros['sensor'], filtros['ambiente'], filtros['ar'], sensores_permitidos=sensores, ars_permitidos=ars,
+    )
+    resposta = StreamingHttpResponse(_fluxo_eventos(assinatura), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
+def _parse_momento(texto):
+    # Um "+" do fuso horário chega como espaço quando não é codificado na URL
+    momento = parse_datetime(texto.replace(' ', '+'))
+    if momento is not None and timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+@login_required
+def sensor_serie(request, pk):
+    """Série do sensor para gráficos (?from=&to=&points=&method=lttb|minmax) em arrays paralelos"""
+    filtro = {} if request.user.is_superuser else {'usuario': request.user}
+    sensor = get_object_or_404(Sensor.objects.select_related('tipo'), pk=pk, **filtro)
+
+    fim = timezone.now()
+    inicio = fim - timedelta(days=1)
+    try:
+        if request.GET.get('to'):
+            fim = _parse_momento(request.GET['to'])
+        if request.GET.get('from'):
+            inicio = _parse_momento(request.GET['from'])
+        pontos = int(request.GET.get('points', PONTOS_PADRAO))
+    except ValueError:
+        inicio = fim = None
+    if inicio is None or fim is None:
+        return JsonResponse({'erro': 'Use datas ISO 8601 em "from"/"to" e um inteiro em "points".'}, status=400)
+    if inicio >= fim:
+        return JsonResponse({'erro': '"from" deve ser anterior a "to".'}, status=400)
+    metodo = request.GET.get('method', 'lttb')
+    if metodo not in METODOS:
+        return JsonResponse({'erro': f'"method" deve ser um de: {", ".join(METODOS)}.'}, status=400)
+
+    serie = serie_reduzida(sensor, inicio, fim, min(max(pontos, 2), PONTOS_MAXIMO), metodo)
+    return JsonResponse(dict(serie, inicio=inicio, fim=fim))
 
 def registro(request):
     """Página de registro de novos usuários"""
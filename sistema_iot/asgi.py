@@ -3,6 +3,14 @@ ASGI config for sistema_iot project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+O fluxo ao vivo em /api/eventos/ mantém conexões abertas e precisa de um
+servidor ASGI (uvicorn, em requirements.txt)::
+
+    uvicorn sistema_iot.asgi:application --host 0.0.0.0 --port 8000
+
+No runserver e em servidores WSGI o site funciona normalmente, mas
+/api/eventos/ responde 501 e as páginas não abrem o fluxo.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
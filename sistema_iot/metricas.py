@@ -0,0 +1,247 @@
+"""Métricas de requisições e da ingestão no formato texto do Prometheus.
+
+``MetricasMiddleware`` mede cada requisição: latência em histograma por
+rota, consultas SQL e tempo gasto no banco, e bytes da resposta. As
+consultas são contadas por um ``execute_wrapper`` instalado em cada
+conexão, que soma no acumulador da requisição atual (uma ``ContextVar``,
+que também acompanha as views síncronas executadas em threads no ASGI).
+
+Com ``IOT_REQUISICAO_LENTA_MS`` definido, as requisições mais lentas que o
+limite são registradas no logger ``sistema_iot.lentas`` com o SQL
+executado.
+
+Os valores ficam na memória de cada processo; com vários workers, o
+Prometheus deve coletar cada um separadamente.
+
+Fora do DEBUG, ``/metrics`` só responde com ``IOT_METRICAS_TOKEN`` definido
+e enviado no cabeçalho ``Authorization``: o endereço de origem não prova que
+o acesso é local atrás de um proxy reverso.
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+logger = logging.getLogger('sistema_iot.lentas')
+
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+LIMITES_LOTE = (1, 10, 50, 100, 500, 1000, 5000, 10000)
+MAXIMO_SQL_CAPTURADO = 100
+
+
+class Histograma:
+    __slots__ = ('limites', 'contagens', 'soma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def linhas(self, nome, rotulos=''):
+        separador = ',' if rotulos else ''
+        acumulado = 0
+        for limite, contagem in zip(self.limites, self.contagens):
+            acumulado += contagem
+            yield f'{nome}_bucket{{{rotulos}{separador}le="{limite}"}} {acumulado}'
+        yield f'{nome}_bucket{{{rotulos}{separador}le="+Inf"}} {self.total}'
+        chaves = f'{{{rotulos}}}' if rotulos else ''
+        yield f'{nome}_sum{chaves} {self.soma}'
+        yield f'{nome}_count{chaves} {self.total}'
+
+
+class _Rota:
+    __slots__ = ('latencia', 'consultas', 'tempo_sql', 'bytes', 'status')
+
+    def __init__(self):
+        self.latencia = Histograma(LIMITES_LATENCIA)
+        self.consultas = Histograma(LIMITES_CONSULTAS)
+        self.tempo_sql = 0.0
+        self.bytes = 0
+        self.status = {}
+
+
+def _rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Registro:
+    """Acumula as métricas do processo; as atualizações são protegidas por um lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rotas = {}
+        self.leituras_recebidas = 0
+        self.leituras_aceitas = 0
+        self.lotes = Histograma(LIMITES_LOTE)
+        self._coletores = []
+
+    def registrar_coletor(self, coletor):
+        """Acrescenta à exportação as linhas devolvidas por ``coletor()`` (métricas mantidas em outros módulos)"""
+        self._coletores.append(coletor)
+
+    def registrar_requisicao(self, rota, metodo, status, duracao, consultas, tempo_sql, tamanho):
+        with self._lock:
+            dados = self._rotas.get((rota, metodo))
+            if dados is None:
+                dados = self._rotas[(rota, metodo)] = _Rota()
+            dados.latencia.observar(duracao)
+            dados.consultas.observar(consultas)
+            dados.tempo_sql += tempo_sql
+            dados.bytes += tamanho
+            dados.status[status] = dados.status.get(status, 0) + 1
+
+    def registrar_ingestao(self, recebidas, aceitas):
+        with self._lock:
+            self.leituras_recebidas += recebidas
+            self.leituras_aceitas += aceitas
+            self.lotes.observar(recebidas)
+
+    def prometheus(self):
+        with self._lock:
+            linhas = [
+                '# TYPE iot_http_requisicoes_total counter',
+                '# TYPE iot_http_latencia_segundos histogram',
+                '# TYPE iot_http_consultas_sql histogram',
+                '# TYPE iot_http_sql_segundos_total counter',
+                '# TYPE iot_http_resposta_bytes_total counter',
+            ]
+            for (rota, metodo), dados in sorted(self._rotas.items()):
+                rotulos = f'rota="{_rotulo(rota)}",metodo="{metodo}"'
+                for status, total in sorted(dados.status.items()):
+                    linhas.append(f'iot_http_requisicoes_total{{{rotulos},status="{status}"}} {total}')
+                linhas.extend(dados.latencia.linhas('iot_http_latencia_segundos', rotulos))
+                linhas.extend(dados.consultas.linhas('iot_http_consultas_sql', rotulos))
+                linhas.append(f'iot_http_sql_segundos_total{{{rotulos}}} {dados.tempo_sql}')
+                linhas.append(f'iot_http_resposta_bytes_total{{{rotulos}}} {dados.bytes}')
+
+            linhas.append('# TYPE iot_ingestao_leituras_recebidas_total counter')
+            linhas.append(f'iot_ingestao_leituras_recebidas_total {self.leituras_recebidas}')
+            linhas.append('# TYPE iot_ingestao_leituras_aceitas_total counter')
+            linhas.append(f'iot_ingestao_leituras_aceitas_total {self.leituras_aceitas}')
+            linhas.append('# TYPE iot_ingestao_lote_leituras histogram')
+            linhas.extend(self.lotes.linhas('iot_ingestao_lote_leituras'))
+        for coletor in self._coletores:
+            linhas.extend(coletor())
+        return '\n'.join(linhas) + '\n'
+
+
+registro = Registro()
+
+
+class _Acumulador:
+    __slots__ = ('consultas', 'tempo', 'sql')
+
+    def __init__(self, capturar):
+        self.consultas = 0
+        self.tempo = 0.0
+        self.sql = [] if capturar else None
+
+
+_requisicao_atual = ContextVar('iot_requisicao_atual', default=None)
+
+
+def _contar_consulta(execute, sql, params, many, context):
+    acumulador = _requisicao_atual.get()
+    if acumulador is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracao = time.perf_counter() - inicio
+        acumulador.consultas += 1
+        acumulador.tempo += duracao
+        if acumulador.sql is not None and len(acumulador.sql) < MAXIMO_SQL_CAPTURADO:
+            acumulador.sql.append((duracao, sql))
+
+
+def _instalar_contador(sender, connection, **kwargs):
+    if _contar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_contar_consulta)
+
+
+connection_created.connect(_instalar_contador)
+
+
+class MetricasMiddleware:
+    """Mede latência, consultas SQL e tamanho da resposta de cada requisição"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        limite = getattr(settings, 'IOT_REQUISICAO_LENTA_MS', None)
+        self.limite_lenta = limite / 1000 if limite else None
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self._chamar_async(request)
+        # Conexões abertas antes do middleware carregar não passaram pelo sinal
+        _instalar_contador(None, connection)
+        acumulador = _Acumulador(self.limite_lenta is not None)
+        marca = _requisicao_atual.set(acumulador)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _requisicao_atual.reset(marca)
+        self._registrar(request, response, time.perf_counter() - inicio, acumulador)
+        return response
+
+    async def _chamar_async(self, request):
+        acumulador = _Acumulador(self.limite_lenta is not None)
+        marca = _requisicao_atual.set(acumulador)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _requisicao_atual.reset(marca)
+        self._registrar(request, response, time.perf_counter() - inicio, acumulador)
+        return response
+
+    def _registrar(self, request, response, duracao, acumulador):
+        correspondencia = getattr(request, 'resolver_match', None)
+        rota = '/' + correspondencia.route if correspondencia else 'nao_encontrada'
+        # Em respostas em streaming (SSE, exportações) o corpo ainda não foi gerado
+        tamanho = 0 if response.streaming else len(response.content)
+        registro.registrar_requisicao(
+            rota, request.method, response.status_code, duracao, acumulador.consultas, acumulador.tempo, tamanho,
+        )
+        if self.limite_lenta is not None and duracao >= self.limite_lenta:
+            sql = '\n'.join(f'  [{tempo * 1000:.1f} ms] {texto}' for tempo, texto in acumulador.sql)
+            logger.warning(
+                'Requisição lenta: %s %s levou %.0f ms com %d consultas (%.0f ms no banco)\n%s',
+                request.method, request.get_full_path(), duracao * 1000,
+                acumulador.consultas, acumulador.tempo * 1000, sql,
+            )
+
+
+def metricas(request):
+    """Exporta as métricas do processo no formato texto do Prometheus (sem token, só em DEBUG)"""
+    token = getattr(settings, 'IOT_METRICAS_TOKEN', None)
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(registro.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sistema_iot.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,12 +66,15 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.fluxo_ao_vivo',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'sistema_iot.wsgi.application'
+# Deploy com o fluxo ao vivo: uvicorn sistema_iot.asgi:application (veja sistema_iot/asgi.py)
+ASGI_APPLICATION = 'sistema_iot.asgi.application'
 
 
 # Database
@@ -82,6 +87,31 @@ DATABASES = {
     }
 }
 
+# Modo de produção do SQLite (IOT_DB_PRODUCAO=1): WAL permite leituras
+# concorrentes com a escrita, busy_timeout espera o lock em vez de falhar com
+# "database is locked" e transações IMMEDIATE pegam o lock de escrita no
+# início, evitando deadlocks de upgrade de lock. As conexões são reutilizadas
+# entre requisições e a ingestão passa pela fila de escritor único.
+IOT_DB_PRODUCAO = os.environ.get('IOT_DB_PRODUCAO') == '1'
+
+if IOT_DB_PRODUCAO:
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA busy_timeout=20000;'
+            'PRAGMA cache_size=-20000;'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+    }
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Agrupa lotes de ingestão concorrentes em transações feitas por uma única thread
+IOT_INGESTAO_FILA = IOT_DB_PRODUCAO
+# Leitura reenviada com o mesmo (sensor, timestamp): 'ignorar' mantém a gravada, 'atualizar' sobrescreve valor e observação
+IOT_INGESTAO_REPETIDAS = 'ignorar'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,6 +152,45 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Presença dos dispositivos: online até X minutos sem contato, instável até Y, depois offline
+IOT_PRESENCA_ONLINE_MINUTOS = 5
+IOT_PRESENCA_OFFLINE_MINUTOS = 30
+# Intervalo em que os heartbeats acumulados em memória são gravados em lote
+IOT_HEARTBEAT_FLUSH_SEGUNDOS = 5
+
+# Retenção e arquivamento das leituras de sensores
+# Dias mantidos em LeituraSensor quando nem o sensor nem o tipo definem retenção (None = para sempre)
+IOT_RETENCAO_DIAS = None
+IOT_ARQUIVO_DIR = BASE_DIR / 'arquivo'
+
+# Alertas de faixa: folga para fechar um alerta (fração da largura mínimo-máximo)
+# e validade do cache de limites dos sensores em cada processo
+IOT_ALERTA_HISTERESE = 0.05
+IOT_ALERTA_CACHE_SEGUNDOS = 60
+
+# Fluxo ao vivo (/api/eventos/, servido via ASGI): segundos entre as consultas compartilhadas por todos os navegadores
+IOT_EVENTOS_INTERVALO = 1
+
+# Cache em memória das leituras recentes (por processo): leituras por sensor, orçamento de
+# memória que limita quantos sensores ficam em cache e segundos até rebuscar leituras de outros processos
+IOT_CACHE_RECENTES_LEITURAS = 1000
+IOT_CACHE_RECENTES_MB = 32
+IOT_CACHE_RECENTES_SEGUNDOS = 5
+
+# Automação dos aparelhos de ar-condicionado: validade do índice de regras em memória (por processo)
+IOT_AUTOMACAO_CACHE_SEGUNDOS = 60
+# O estado das regras também é por processo: com vários workers WSGI (WEB_CONCURRENCY > 1) a
+# automação fica desligada por padrão; ligue-a (IOT_AUTOMACAO_ATIVA=1) só no processo que recebe
+# todas as leituras, como o listener (escutar_dispositivos) ou um único worker de ingestão
+IOT_WORKERS_WEB = int(os.environ.get('WEB_CONCURRENCY') or 1)
+IOT_AUTOMACAO_ATIVA = os.environ.get('IOT_AUTOMACAO_ATIVA', '1' if IOT_WORKERS_WEB == 1 else '0') == '1'
+
+# Métricas no formato do Prometheus em /metrics: exige o cabeçalho "Authorization: Bearer <token>".
+# Sem token o endpoint só responde com DEBUG ligado
+IOT_METRICAS_TOKEN = os.environ.get('IOT_METRICAS_TOKEN') or None
+# Requisições acima deste tempo (ms) vão para o log sistema_iot.lentas com o SQL executado (None = desligado)
+IOT_REQUISICAO_LENTA_MS = None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .metricas import metricas
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metricas, name='metricas'),
     path('', include('core.urls')),
 ]